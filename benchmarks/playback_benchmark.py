@@ -0,0 +1,67 @@
+"""
+Replays synthetic cassettes through the indexed cassette and the vcr cassette.
+
+Usage:
+    python -m benchmarks.playback_benchmark [--sizes 1000 10000 100000] [--vcr-max 10000]
+"""
+import argparse
+import time
+
+from vcr import matchers
+from vcr.cassette import Cassette
+from vcr.record_mode import RecordMode
+from vcr.request import Request
+
+from integrations_testing_framework.cassettes.playback import IndexedCassette
+
+_MATCH_ON = [getattr(matchers, name) for name in ('method', 'scheme', 'host', 'port', 'path', 'query', 'body')]
+
+
+def synthetic_interactions(size):
+    """
+    Paginated GET requests against a handful of endpoints.
+    """
+    interactions = []
+    for i in range(size):
+        request = Request('GET', f'https://api.example.com/v1/stream_{i % 10}?page={i}&per_page=100', None, {})
+        response = {'status': {'code': 200, 'message': 'OK'},
+                    'headers': {'Content-Type': ['application/json']},
+                    'body': {'string': b'{"data": []}'}}
+        interactions.append((request, response))
+    return interactions
+
+
+def replay(cassette_class, interactions):
+    """
+    :return: Seconds spent loading the cassette and playing every request.
+    :type: float
+    """
+    start = time.perf_counter()
+    cassette = cassette_class('synthetic', record_mode=RecordMode.NONE, match_on=_MATCH_ON)
+    for request, response in interactions:
+        cassette.append(request, response)
+    if isinstance(cassette, IndexedCassette):
+        cassette._build_index()
+    for request, _ in interactions:
+        cassette.play_response(request)
+    assert cassette.all_played
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', nargs='+', type=int, default=[1000, 10000, 100000])
+    parser.add_argument('--vcr-max', type=int, default=10000,
+                        help='Largest cassette replayed with the vcr cassette (quadratic).')
+    args = parser.parse_args()
+
+    print(f'{"interactions":>12} {"indexed (s)":>12} {"vcr (s)":>12}')
+    for size in args.sizes:
+        interactions = synthetic_interactions(size)
+        indexed = replay(IndexedCassette, interactions)
+        baseline = f'{replay(Cassette, interactions):12.3f}' if size <= args.vcr_max else f'{"skipped":>12}'
+        print(f'{size:>12} {indexed:12.3f} {baseline}')
+
+
+if __name__ == '__main__':
+    main()
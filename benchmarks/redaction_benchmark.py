@@ -0,0 +1,112 @@
+"""
+Redacts synthetic JSON exports with the redactor and the previous recursive implementation of `_filter_json`.
+
+Usage:
+    python -m benchmarks.redaction_benchmark [--sizes 10 100 500] [--legacy-max 100] [--memory]
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+from integrations_testing_framework.redaction import PRESERVE_CHARS, Redactor
+
+_MB = 1 << 20
+_SKIP_KEYS = ['id', 'updated_at']
+
+
+def legacy_filter_json(data, update_keys=None, skip_keys=None):
+    """
+    `_filter_json` before the redactor, rebuilding the decoded tree and redacting strings one character at a time.
+    """
+    update_keys = set(update_keys) if update_keys else {}
+    skip_keys = set(skip_keys) if skip_keys else {}
+
+    def update_data(_data):
+        if _data is None:
+            return None
+        if isinstance(_data, bool):
+            return not _data
+        if isinstance(_data, (int, float)):
+            return _data * 0
+        if isinstance(_data, str):
+            return ''.join([x if x in PRESERVE_CHARS else 'X' for x in _data])
+        if isinstance(_data, list):
+            return [update_data(item) for item in _data]
+        if isinstance(_data, dict):
+            if skip_keys:
+                return {key: update_data(value) if isinstance(value, dict) or key not in skip_keys else value
+                        for key, value in _data.items()}
+            if update_keys:
+                return {key: update_data(value) if isinstance(value, dict) or key in update_keys else value
+                        for key, value in _data.items()}
+            return {key: update_data(value) for key, value in _data.items()}
+    return json.dumps(update_data(json.loads(data)))
+
+
+def synthetic_export(size_mb):
+    """
+    :return: A paginated API response of about size_mb megabytes.
+    :type: bytes
+    """
+    records = []
+    size = 0
+    while size < size_mb * _MB:
+        record = json.dumps({
+            'id': len(records),
+            'email': f'user.{len(records)}@example.com',
+            'name': 'Jane Doe',
+            'active': len(records) % 2 == 0,
+            'score': len(records) / 7,
+            'address': {'street': 'Main street 1', 'city': 'Springfield', 'zip': '12345'},
+            'tags': ['customer', 'newsletter'],
+            'updated_at': '2021-06-01T12:00:00Z',
+        })
+        records.append(record)
+        size += len(record) + 2
+    return ('{"data": [' + ', '.join(records) + '], "next_page": null}').encode()
+
+
+def measure(function, data, memory):
+    """
+    :return: Seconds spent redacting the data and the peak of memory allocated meanwhile in MB, None if not traced.
+    """
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    result = function(data)
+    elapsed = time.perf_counter() - start
+    peak = None
+    if memory:
+        peak = tracemalloc.get_traced_memory()[1] / _MB
+        tracemalloc.stop()
+    del result
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', nargs='+', type=int, default=[10, 100, 500], help='Payload sizes in MB.')
+    parser.add_argument('--legacy-max', type=int, default=100,
+                        help='Largest payload redacted with the previous implementation.')
+    parser.add_argument('--memory', action='store_true', help='Trace peak memory, slowing down both implementations.')
+    args = parser.parse_args()
+    redactor = Redactor(skip_keys=_SKIP_KEYS)
+    print(f'{"size (MB)":>10} {"redactor (s)":>13} {"legacy (s)":>11} {"redactor (MB)":>14} {"legacy (MB)":>12}')
+    for size in args.sizes:
+        data = synthetic_export(size)
+        redacted, redacted_peak = measure(redactor.redact_json, data, args.memory)
+        legacy, legacy_peak = None, None
+        if size <= args.legacy_max:
+            legacy, legacy_peak = measure(lambda body: legacy_filter_json(body, skip_keys=_SKIP_KEYS), data,
+                                          args.memory)
+
+        def column(value, width, precision):
+            return f'{value:{width}.{precision}f}' if value is not None else f'{"-":>{width}}'
+
+        print(f'{size:>10} {column(redacted, 13, 3)} {column(legacy, 11, 3)} {column(redacted_peak, 14, 1)} '
+              f'{column(legacy_peak, 12, 1)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,456 @@
+"""
+Benchmark suite of the hot paths of the framework, run offline against synthetic cassettes and a local HTTP server.
+
+Every case is measured at several sizes: its throughput (units processed per second, best of --repeat runs) and, in a
+separate traced run, its peak of allocated memory. Results are compared with a baseline file, and the suite fails when
+a case is slower or allocates more than the baseline beyond the thresholds. Baselines depend on the machine, they are
+stored with --save-baseline on the machine the suite is then run on (e.g. a CI runner, from the main branch).
+
+The committed baseline (benchmarks/baseline.json) holds the results at scales 1 and 0.1, along with the Python version
+and platform they were stored with. The benchmark tests (`benchmark` marker of tests/benchmark_suite_test.py) are not
+run by default, `pytest -m benchmark` runs them: they compare a run at scale 0.1 with the baseline per case, relative
+to the speed of the machine measured along each case (--by-case), with a 30% throughput threshold by default as
+runners are noisy, and are skipped when the baseline was stored with another Python version or platform.
+BENCHMARK_THRESHOLD and BENCHMARK_MEMORY_THRESHOLD change the thresholds, and BENCHMARK_BASELINE the baseline file.
+Changes expected to move results store the baseline again at scale 1, then at scale 0.1.
+
+Usage:
+    python -m benchmarks.suite [--cases load match ...] [--scale 1] [--repeat 3] [--baseline FILE] [--save-baseline]
+                               [--threshold 0.25] [--memory-threshold 0.25] [--by-case]
+"""
+import argparse
+import collections
+import contextlib
+import gc
+import itertools
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import requests
+from vcr import matchers
+from vcr.record_mode import RecordMode
+from vcr.request import Request
+
+from benchmarks.redaction_benchmark import synthetic_export
+from integrations_testing_framework.cassettes.cache import CASSETTE_CACHE
+from integrations_testing_framework.cassettes.formats import get_format
+from integrations_testing_framework.cassettes.playback import IndexedCassette
+from integrations_testing_framework.decorators.decorators import assert_stdout_matches, write_stdout
+from integrations_testing_framework.decorators.http_mocking_decorators import (_MATCH_ON, _filter_json,
+                                                                               _to_list_of_tuple, intercept_requests)
+from integrations_testing_framework.utils import assert_matching_file_contents
+
+_DEFAULT_BASELINE = Path(__file__).parent / 'baseline.json'
+# Key of the environment a baseline was stored in, see `environment`
+ENVIRONMENT_KEY = '_environment'
+# Modules imported by the import case, by variant
+_IMPORTS = {
+    'package': 'integrations_testing_framework',
+    'utils': 'integrations_testing_framework.utils',
+    'decorators': 'integrations_testing_framework.decorators.decorators',
+    'intercept_requests': 'integrations_testing_framework.decorators.http_mocking_decorators',
+}
+# Minimum duration of a timed run
+_MIN_RUN_SECONDS = 0.02
+# Peak memory differences below this number of bytes are noise
+_MEMORY_NOISE = 256 << 10
+# Combinations of ignore_on_match benchmarked by the matching case: every subset of the matched attributes
+_IGNORE_ON_MATCH = {'_'.join(ignored) or 'none': list(ignored) for count in range(len(_MATCH_ON) + 1)
+                    for ignored in itertools.combinations(sorted(_MATCH_ON), count)}
+
+# Benchmark cases by name, see `case`
+CASES = {}
+
+
+def case(name, unit, sizes, variants=(None,)):
+    """
+    Register a benchmark case.
+    :param str name: Name of the case.
+    :param str unit: Unit of the throughput.
+    :param list sizes: Sizes the case is measured at, multiplied by --scale.
+    :param variants: Variants of the case, passed to the case function with the size.
+    The case function `function(workdir, size, variant)` prepares the data and returns a function running the
+    benchmarked code once, returning the number of units processed.
+    """
+    def decorator(function):
+        CASES[name] = (function, unit, sizes, variants)
+        return function
+
+    return decorator
+
+
+def synthetic_interactions(size):
+    """
+    Paginated GET requests and JSON POST requests against a handful of endpoints.
+    """
+    interactions = []
+    for i in range(size):
+        if i % 2:
+            request = Request('POST', f'https://api.example.com/v1/stream_{i % 10}/search', json.dumps({'page': i}),
+                              {'Content-Type': 'application/json'})
+        else:
+            request = Request('GET', f'https://api.example.com/v1/stream_{i % 10}?page={i}&per_page=100', None, {})
+        response = {'status': {'code': 200, 'message': 'OK'},
+                    'headers': {'Content-Type': ['application/json']},
+                    'body': {'string': json.dumps({'data': [{'id': i, 'name': f'item {i}'}]}).encode()}}
+        interactions.append((request, response))
+    return interactions
+
+
+def singer_lines(size):
+    return [json.dumps({'type': 'RECORD', 'stream': f'stream_{i % 5}', 'record': {'id': i, 'name': f'item {i}'}})
+            for i in range(size)]
+
+
+@case('load', 'interactions/s', [1000, 10000], variants=('yaml', 'jsonl'))
+def bench_load(workdir, size, cassette_format):
+    path = str(workdir / f'load_{size}.{cassette_format}')
+    get_format(cassette_format).save_interactions(path, synthetic_interactions(size))
+
+    def run():
+        cassette = IndexedCassette(path, record_mode=RecordMode.NONE, match_on=[matchers.path],
+                                   persister=get_format(cassette_format))
+        cassette._load()
+        return len(cassette)
+
+    return run
+
+
+@case('match', 'requests/s', [1000, 10000], variants=tuple(_IGNORE_ON_MATCH))
+def bench_match(workdir, size, ignore):
+    interactions = synthetic_interactions(size)
+    match_on = [getattr(matchers, name) for name in sorted(_MATCH_ON - set(_IGNORE_ON_MATCH[ignore]))]
+
+    def run():
+        cassette = IndexedCassette('synthetic', record_mode=RecordMode.NONE, match_on=match_on)
+        cassette.data = list(interactions)
+        cassette._build_index()
+        cassette.allow_playback_repeats = False
+        for request, _ in interactions:
+            cassette.play_response(request)
+        assert cassette.all_played
+        return size
+
+    return run
+
+
+@case('http_playback', 'requests/s', [100, 1000], variants=('yaml', 'jsonl'))
+def bench_http_playback(workdir, size, cassette_format):
+    """
+    Requests made with requests to the local server and played back through `intercept_requests`.
+    """
+    path = str(workdir / f'http_{size}.{cassette_format}')
+
+    def tap():
+        with requests.Session() as session:
+            for page in range(size):
+                session.get(f'{_SERVER.url}/v1/items', params={'page': page}, timeout=10)
+
+    intercept_requests(path, generate=True, format=cassette_format)(tap)()
+    playback = intercept_requests(path, format=cassette_format)(tap)
+
+    def run():
+        CASSETTE_CACHE.clear()
+        playback()
+        return size
+
+    return run
+
+
+@case('filter_json', 'MB/s', [1, 10], variants=('update', 'skip'))
+def bench_filter_json(workdir, size, mode):
+    data = synthetic_export(size)
+    keys = {'update': {'update_keys': ['email', 'name']}, 'skip': {'skip_keys': ['id', 'updated_at']}}[mode]
+
+    def run():
+        _filter_json(data, **keys)
+        return len(data) / (1 << 20)
+
+    return run
+
+
+@case('to_list_of_tuple', 'keys/s', [1000, 100000])
+def bench_to_list_of_tuple(workdir, size, _):
+    keys = [f'parameter_{i}' for i in range(size)]
+
+    def run():
+        _to_list_of_tuple(keys)
+        return size
+
+    return run
+
+
+@case('stdout', 'lines/s', [10000, 100000], variants=('write', 'match'))
+def bench_stdout(workdir, size, mode):
+    path = str(workdir / f'stdout_{size}.txt')
+    lines = singer_lines(size)
+
+    def tap():
+        for line in lines:
+            print(line)
+
+    write_stdout(path)(tap)()
+    decorated = write_stdout(path)(tap) if mode == 'write' else assert_stdout_matches(path)(tap)
+
+    def run():
+        decorated()
+        return size
+
+    return run
+
+
+@case('import', 'imports/s', [5], variants=tuple(_IMPORTS))
+def bench_import(workdir, size, module):
+    """
+    Imports in fresh interpreters, the time an interpreter takes to start is measured as well.
+    """
+    command = [sys.executable, '-c', f'import {_IMPORTS[module]}']
+    root = Path(__file__).parent.parent
+
+    def run():
+        for _ in range(size):
+            subprocess.run(command, cwd=root, check=True)
+        return size
+
+    return run
+
+
+@case('file_comparison', 'lines/s', [10000, 100000])
+def bench_file_comparison(workdir, size, _):
+    path = workdir / f'comparison_{size}.txt'
+    path.write_text(''.join(f'{line}\n' for line in singer_lines(size)))
+
+    def run():
+        with open(path) as expected, open(path) as actual:
+            assert_matching_file_contents(expected, actual)
+        return size
+
+    return run
+
+
+class _LocalServer:
+    """
+    Local stand-in for the APIs called by the HTTP cases, answering every request with a JSON page.
+    """
+
+    class _Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            payload = json.dumps({'path': self.path, 'data': [{'id': 1, 'name': 'item'}]}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    url = None
+
+    @contextlib.contextmanager
+    def run(self):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), self._Handler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.url = f'http://127.0.0.1:{server.server_address[1]}'
+        try:
+            yield self
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+_SERVER = _LocalServer()
+
+
+def environment():
+    """
+    :return: Python version and platform results depend on beyond the speed of the machine: baselines stored in another
+    environment are not comparable.
+    :type: dict
+    """
+    return {'python': f'{platform.python_implementation()} {sys.version_info[0]}.{sys.version_info[1]}',
+            'platform': f'{platform.system()} {platform.machine()}'}
+
+
+def load_baseline(path):
+    """
+    :return: Results of a baseline file by benchmark key, empty when it does not exist, and the environment they were
+    stored in.
+    :type: tuple
+    """
+    if not os.path.exists(path):
+        return {}, None
+    with open(path) as file:
+        baseline = json.load(file)
+    return baseline, baseline.pop(ENVIRONMENT_KEY, None)
+
+
+def calibrate(repeat=3, size=5000):
+    """
+    :return: Speed of the machine, the best throughput in loops per second of a pure Python workload, see `compare`.
+    :type: float
+    """
+    best = 0.0
+    for _ in range(repeat):
+        values = {}
+        start = time.perf_counter()
+        for i in range(size):
+            values[i % 1000] = json.dumps([i, str(i)])
+        best = max(best, size / (time.perf_counter() - start))
+    return best
+
+
+def measure(run, repeat):
+    """
+    :return: Best throughput of the runs in units per second, and the peak of memory allocated by a traced run.
+    :type: tuple
+    """
+    # The traced run also warms up the case
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        units, elapsed = 0, 0.0
+        start = time.perf_counter()
+        # Short cases are run several times per measurement, so that timer resolution and pauses do not dominate
+        while elapsed < _MIN_RUN_SECONDS:
+            units += run()
+            elapsed = time.perf_counter() - start
+        throughput = units / elapsed if elapsed > 0 else float('inf')
+        best = throughput if best is None else max(best, throughput)
+    return best, peak
+
+
+def run_suite(names=None, scale=1.0, repeat=3, log=None):
+    """
+    Run benchmark cases.
+    :param list names: Names of the cases to run, all cases by default.
+    :param float scale: Factor applied to the sizes of the cases.
+    :param int repeat: Number of timed runs of each measurement.
+    :param log: Text file results are printed to as they are measured.
+    :return: Results by benchmark key ('<case>[<variant>]@<size>'): {'unit', 'throughput', 'peak_bytes',
+    'calibration'}, calibration being the speed of the machine measured along the case.
+    :type: dict
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir, _SERVER.run():
+        for name in names or CASES:
+            function, unit, sizes, variants = CASES[name]
+            sizes = sorted({max(int(size * scale), 1) for size in sizes})
+            for variant in variants:
+                for size in sizes:
+                    key = f'{name}[{variant}]@{size}' if variant is not None else f'{name}@{size}'
+                    throughput, peak = measure(function(Path(workdir), size, variant), repeat)
+                    results[key] = {'unit': unit, 'throughput': round(throughput, 3), 'peak_bytes': peak,
+                                    'calibration': round(calibrate(repeat), 1)}
+                    if log is not None:
+                        print(f'{key:<40} {throughput:>14.1f} {unit:<15} {peak / (1 << 20):>9.2f} MB', file=log)
+    return results
+
+
+def _case_name(key):
+    return key.split('[')[0].split('@')[0]
+
+
+def _geometric_mean(values):
+    return math.exp(sum(map(math.log, values)) / len(values))
+
+
+def compare(results, baseline, threshold=0.25, memory_threshold=0.25, by_case=False):
+    """
+    :param dict results: Results of `run_suite`.
+    :param dict baseline: Results of a previous run.
+    :param float threshold: Maximum relative throughput decrease.
+    :param float memory_threshold: Maximum relative peak memory increase.
+    :param bool by_case: True to compare the throughput of each case on the geometric mean of its variants and sizes,
+    each relative to the speed of the machine measured along it, so that the noise of single measurements averages out
+    and the baseline can be stored on another machine.
+    :return: Descriptions of the regressions.
+    :type: list
+    """
+    regressions = []
+    # Throughput ratios to the baseline, relative to the speed of the machine, by case
+    ratios = collections.defaultdict(list)
+    for key, result in results.items():
+        expected = baseline.get(key)
+        if expected is None:
+            continue
+        throughput, expected_throughput = result['throughput'], expected['throughput']
+        speed = result['calibration'] / expected['calibration'] if 'calibration' in expected else 1.0
+        ratios[_case_name(key)].append(throughput / expected_throughput / speed)
+        if not by_case and throughput < expected_throughput * (1 - threshold):
+            regressions.append(f'{key}: throughput {throughput:.1f} {result["unit"]}, baseline '
+                               f'{expected_throughput:.1f} ({throughput / expected_throughput - 1:+.0%})')
+        peak, expected_peak = result['peak_bytes'], expected['peak_bytes']
+        if peak > expected_peak * (1 + memory_threshold) and peak - expected_peak > _MEMORY_NOISE:
+            regressions.append(f'{key}: peak memory {peak / (1 << 20):.2f} MB, baseline '
+                               f'{expected_peak / (1 << 20):.2f} MB ({peak / expected_peak - 1:+.0%})')
+    if by_case:
+        for name, case_ratios in ratios.items():
+            ratio = _geometric_mean(case_ratios)
+            if ratio < 1 - threshold:
+                regressions.append(f'{name}: throughput {ratio - 1:+.0%} of the baseline relative to the speed of the '
+                                   f'machine (geometric mean of {len(case_ratios)} measurements)')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cases', nargs='+', choices=list(CASES), help='Cases to run, all by default.')
+    parser.add_argument('--scale', type=float, default=1.0, help='Factor applied to the sizes of the cases.')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs of each measurement, the best is kept.')
+    parser.add_argument('--baseline', default=str(_DEFAULT_BASELINE), help='Baseline results file.')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='Store the results as baseline, merged with the baseline of the cases not run.')
+    parser.add_argument('--threshold', type=float, default=0.25, help='Maximum relative throughput decrease.')
+    parser.add_argument('--memory-threshold', type=float, default=0.25, help='Maximum relative peak memory increase.')
+    parser.add_argument('--by-case', action='store_true',
+                        help='Compare the throughput of each case on the geometric mean of its measurements.')
+    args = parser.parse_args()
+
+    print(f'{"benchmark":<40} {"throughput":>14} {"":<15} {"peak":>12}')
+    results = run_suite(args.cases, scale=args.scale, repeat=args.repeat, log=sys.stdout)
+    baseline, baseline_environment = load_baseline(args.baseline)
+    if args.save_baseline:
+        # Results stored in another environment are not merged with these ones
+        baseline = baseline if baseline_environment == environment() else {}
+        with open(args.baseline, 'w') as file:
+            json.dump({**baseline, **results, ENVIRONMENT_KEY: environment()}, file, indent=2, sort_keys=True)
+        print(f'Baseline saved to {args.baseline}')
+        return
+    if not baseline:
+        print(f'No baseline at {args.baseline}, run with --save-baseline to store one')
+        return
+    if baseline_environment != environment():
+        print(f'Baseline stored with {baseline_environment}, results may not be comparable with {environment()}')
+    for key in sorted(set(results) - set(baseline)):
+        print(f'No baseline for {key}')
+    regressions = compare(results, baseline, threshold=args.threshold, memory_threshold=args.memory_threshold,
+                          by_case=args.by_case)
+    for regression in regressions:
+        print(f'REGRESSION {regression}')
+    if regressions:
+        sys.exit(1)
+    print(f'No regression against {args.baseline}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,69 @@
+"""
+Integrations testing framework.
+
+The decorators are imported on first access, so that importing the package, or any of its modules (e.g. `utils`), does
+not import vcr and the HTTP libraries it patches, nor has any side effect. Stdout is only redirected while a capture
+decorator (`write_stdout`, `assert_stdout_matches`, `assert_singer_output_matches`) runs.
+"""
+import importlib
+import importlib.util
 import io
-import sys
+import warnings
+
+_DECORATORS = 'integrations_testing_framework.decorators.decorators'
+_HTTP_MOCKING_DECORATORS = 'integrations_testing_framework.decorators.http_mocking_decorators'
+
+# Module of each attribute loaded on demand
+_LAZY_ATTRIBUTES = {
+    'write_stdout': _DECORATORS,
+    'assert_stdout_matches': _DECORATORS,
+    'assert_singer_output_matches': _DECORATORS,
+    'instrument': _DECORATORS,
+    'with_sys_args': _DECORATORS,
+    'intercept_requests': _HTTP_MOCKING_DECORATORS,
+    'mock_requests': _HTTP_MOCKING_DECORATORS,
+    'MockServer': _HTTP_MOCKING_DECORATORS,
+    'MockResponse': _HTTP_MOCKING_DECORATORS,
+    'BlobStore': _HTTP_MOCKING_DECORATORS,
+    'ReplayTiming': _HTTP_MOCKING_DECORATORS,
+    'FaultProfile': _HTTP_MOCKING_DECORATORS,
+}
+
+__all__ = sorted(_LAZY_ATTRIBUTES)
+
+
+def __getattr__(name):
+    if name == 'intercepted_stdout':
+        return _intercepted_stdout()
+    module = _LAZY_ATTRIBUTES.get(name)
+    if module is not None:
+        value = getattr(importlib.import_module(module), name)
+    elif not name.startswith('_') and importlib.util.find_spec(f'{__name__}.{name}') is not None:
+        # A submodule imported with `from integrations_testing_framework import utils`
+        return importlib.import_module(f'{__name__}.{name}')
+    else:
+        # Other names the package used to import from the decorator modules
+        for module in (_DECORATORS, _HTTP_MOCKING_DECORATORS):
+            value = getattr(importlib.import_module(module), name, None) if not name.startswith('_') else None
+            if value is not None:
+                break
+        else:
+            raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
+
 
-sys.stdout = intercepted_stdout = io.StringIO()
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
 
-from integrations_testing_framework.decorators.decorators import *
-from integrations_testing_framework.decorators.http_mocking_decorators import *
 
+def _intercepted_stdout():
+    """
+    Former stdout replacement, kept for code that still reads it. It is no longer installed as `sys.stdout`, so nothing
+    is written to it.
+    """
+    warnings.warn('integrations_testing_framework.intercepted_stdout is deprecated, stdout is only redirected by the '
+                  'capture decorators', DeprecationWarning, stacklevel=3)
+    global intercepted_stdout
+    intercepted_stdout = io.StringIO()
+    return intercepted_stdout
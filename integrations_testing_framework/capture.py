@@ -0,0 +1,196 @@
+import collections
+import io
+import os
+import sys
+import threading
+
+from integrations_testing_framework.context import ContextLocal
+
+
+class StdoutSink(io.TextIOBase):
+    """
+    Text stream replacing sys.stdout that hands every complete line written to it to `write_line`.
+    Lines are assembled per thread, so that threads printing concurrently do not mix their lines.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        # Unterminated line written by each thread
+        self._pending = collections.defaultdict(list)
+        self.lines_written = 0
+        # Output statistics of an instrumented test, see `integrations_testing_framework.instrumentation`
+        self.stats = None
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        thread = threading.get_ident()
+        if '\n' not in text:
+            self._pending[thread].append(text)
+            return len(text)
+        *lines, rest = text.split('\n')
+        with self._lock:
+            pending = self._pending.pop(thread, None)
+            if pending:
+                lines[0] = ''.join(pending) + lines[0]
+            if rest:
+                self._pending[thread].append(rest)
+            for line in lines:
+                self._handle_line(line + '\n')
+        return len(text)
+
+    def _handle_line(self, line):
+        self.lines_written += 1
+        if self.stats is not None:
+            self.stats.add_line(line)
+        self.write_line(line)
+
+    def write_line(self, line):
+        """
+        :param str line: A line written to stdout, including the line separator.
+        """
+        raise NotImplementedError
+
+    def finish(self):
+        """
+        Handle the last line if it is not terminated, called once the wrapped function has returned.
+        """
+        with self._lock:
+            for pending in self._pending.values():
+                self._handle_line(''.join(pending))
+            self._pending.clear()
+
+
+class FileSink(StdoutSink):
+    """
+    Writes stdout to a file through a buffered writer. The file is replaced only once the output is complete.
+    """
+
+    def __init__(self, file_uri):
+        super().__init__()
+        self._file_uri = file_uri
+        self._tmp_uri = f'{file_uri}.{os.getpid()}.{threading.get_ident()}.tmp'
+        self._file = open(self._tmp_uri, 'w')
+
+    def write_line(self, line):
+        self._file.write(line)
+
+    def finish(self):
+        try:
+            super().finish()
+            self._file.close()
+            if self.lines_written == 0:
+                raise Exception("Stdout is empty")
+            os.replace(self._tmp_uri, self._file_uri)
+        finally:
+            self.close()
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+        if os.path.exists(self._tmp_uri):
+            os.remove(self._tmp_uri)
+        super().close()
+
+
+class MatchingSink(StdoutSink):
+    """
+    Compares every line written to stdout with the next line of a file, failing on the first line that does not match.
+    Lines are compared without trailing whitespace, output written after the end of the file is ignored.
+    """
+    # Number of matching lines reported before a mismatch
+    context_lines = 3
+
+    def __init__(self, file_uri):
+        super().__init__()
+        self._file_uri = file_uri
+        self._file = open(file_uri, 'r')
+        self._context = collections.deque(maxlen=self.context_lines)
+        self._expected_lines = 0
+        self.error = None
+
+    def write_line(self, line):
+        if self.error is None:
+            self._compare(self._file.readline(), line)
+
+    def _compare(self, expected_line, actual_line):
+        if not expected_line:
+            return
+        self._expected_lines += 1
+        expected = expected_line.rstrip()
+        actual = actual_line.rstrip()
+        if expected != actual:
+            context = ''.join(f'  {line}\n' for line in self._context)
+            self.error = AssertionError(
+                f'Output does not match between files at line {self._expected_lines} of {self._file_uri}.\n\n'
+                f'Preceding lines: \n{context}Expected: \n{expected}\nActual: \n{actual}')
+            raise self.error
+        self._context.append(expected)
+
+    def finish(self):
+        """
+        :raises AssertionError: on the first mismatch, including one already raised to the wrapped function.
+        """
+        try:
+            super().finish()
+            if self.error is not None:
+                raise self.error
+            for expected_line in self._file:
+                self._compare(expected_line, '')
+            if self._expected_lines == 0:
+                raise Exception("File is empty.")
+        finally:
+            self.close()
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+
+class _StdoutProxy(io.TextIOBase):
+    """
+    Replaces sys.stdout while sinks are in use, writing to the sink of the calling context.
+    """
+
+    def __init__(self, stream):
+        super().__init__()
+        self.stream = stream
+
+    def _target(self):
+        return _SINK.get(self.stream)
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        return self._target().write(text)
+
+    def writelines(self, lines):
+        self._target().writelines(lines)
+
+    def flush(self):
+        self._target().flush()
+
+    def __getattr__(self, name):
+        return getattr(self._target(), name)
+
+
+def _install_proxy():
+    sys.stdout = _StdoutProxy(sys.stdout)
+
+
+def _uninstall_proxy():
+    if isinstance(sys.stdout, _StdoutProxy):
+        sys.stdout = sys.stdout.stream
+
+
+_SINK = ContextLocal('stdout_sink', install=_install_proxy, uninstall=_uninstall_proxy)
+
+
+def redirect_stdout(sink):
+    """
+    Context manager redirecting stdout of the current context to the sink.
+    """
+    return _SINK.use(sink)
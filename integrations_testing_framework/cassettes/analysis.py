@@ -0,0 +1,371 @@
+"""
+Analysis and bulk rewriting of cassettes.
+
+    python -m integrations_testing_framework.cassettes.analysis analyze requests/ [--ignore-on-match query] [--json]
+    python -m integrations_testing_framework.cassettes.analysis rewrite requests/ --format jsonl [--dedup] [--jobs 8]
+
+`analyze` reads cassettes with the parsers used on playback, their format being detected from their content, and
+reports for each of them the interactions per host and path, the distribution of response body sizes, the bodies
+stored several times, and the time taken to load the cassette and to match every recorded request, as played back with
+the given `ignore_on_match`. Under that configuration, interactions sharing the match key of an earlier interaction are
+only played when the request is made again ('repeated'), and they are redundant when their response is the same as the
+response of the previous interaction with the key, apart from the volatile headers of `_VOLATILE_HEADERS`.
+Interactions left unplayed once every recorded request is played back again are unreachable under that configuration.
+
+`rewrite` migrates cassettes to another format and, with `--dedup`, merges each redundant interaction into the
+previous interaction with its key, counting the times the merged interaction is played ('plays', see
+`IndexedCassette`), so that the rewritten cassette plays back the same responses in the same order.
+
+Cassettes are processed in parallel, one process per CPU core by default.
+"""
+import argparse
+import collections
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from vcr import matchers
+from vcr.record_mode import RecordMode
+
+from integrations_testing_framework.cassettes.compression import CompressedFormat
+from integrations_testing_framework.cassettes.formats import FORMATS, get_format, materialize_response
+from integrations_testing_framework.cassettes.playback import IndexedCassette, request_key_function
+from integrations_testing_framework.cassettes.sharding import MANIFEST, ShardedFormat
+
+# Attributes requests are matched on by default, as by `intercept_requests`
+MATCH_ON = ('body', 'host', 'method', 'path', 'port', 'query', 'scheme')
+# Response headers ignored when comparing responses
+_VOLATILE_HEADERS = frozenset({'date', 'age', 'expires'})
+_PERCENTILES = (50, 90, 99)
+
+
+def detect_format(cassette_path):
+    """
+    :return: Format of a cassette file or sharded cassette directory, from its content.
+    """
+    path = Path(cassette_path)
+    if path.is_dir():
+        manifest = json.loads((path / MANIFEST).read_text())
+        return ShardedFormat(get_format(manifest['format']), manifest['shard_by'])
+    with open(path, 'rb') as file:
+        head = file.read(64)
+    if head.startswith(b'{') and b'"format": "jsonl"' in head.split(b'\n', 1)[0]:
+        return get_format('jsonl')
+    if len(head) > 4 and b'format' in head[4:16] and b'msgpack' in head[4:32]:
+        return get_format('msgpack')
+    return get_format('yaml')
+
+
+def _body(response):
+    """
+    :return: Digest and size of the body of a response. Bodies stored in a blob store are identified by their
+    reference, and their size is not known.
+    :type: tuple
+    """
+    body = response.get('body')
+    if isinstance(body, dict) and 'blob' in body:
+        return f"blob:{body['blob']}".encode('utf-8'), 0
+    data = body.get('string') if isinstance(body, dict) else None
+    data = data.encode('utf-8') if isinstance(data, str) else data or b''
+    return hashlib.blake2b(data, digest_size=16).digest(), len(data)
+
+
+def _response_identity(response, body_digest):
+    headers = tuple(sorted((name.lower(), tuple(values)) for name, values in (response.get('headers') or {}).items()
+                           if name.lower() not in _VOLATILE_HEADERS))
+    return json.dumps(response.get('status'), sort_keys=True), headers, body_digest
+
+
+def _distribution(sizes):
+    if not sizes:
+        return {'count': 0, 'total': 0}
+    sizes = sorted(sizes)
+    distribution = {'count': len(sizes), 'total': sum(sizes), 'min': sizes[0], 'max': sizes[-1]}
+    for percentile in _PERCENTILES:
+        distribution[f'p{percentile}'] = sizes[min(len(sizes) - 1, len(sizes) * percentile // 100)]
+    return distribution
+
+
+def _match_on(ignore_on_match):
+    return sorted(set(MATCH_ON) - set(ignore_on_match or []))
+
+
+def _merge(interactions, ignore_on_match, dedup):
+    """
+    Iterate over the interactions of a cassette with their body digest and whether they are repeated or redundant.
+    With dedup, redundant interactions are merged into the previous interaction with their key instead.
+    :return: Iterator over (request, response, body digest, body size, repeated, redundant) tuples.
+    """
+    request_key = request_key_function(_match_on(ignore_on_match))
+    # Previous interaction of each key: (response, its identity)
+    previous = {}
+    for request, response in interactions:
+        digest, size = _body(response)
+        key = request_key(request)
+        identity = _response_identity(response, digest)
+        last = previous.get(key)
+        redundant = last is not None and last[1] == identity
+        if redundant and dedup:
+            last[0]['plays'] = last[0].get('plays', 1) + response.get('plays', 1)
+            continue
+        previous[key] = (response, identity)
+        yield request, response, digest, size, last is not None, redundant
+
+
+def analyze_cassette(cassette_path, ignore_on_match=None):
+    """
+    :param str cassette_path: Path of a cassette file, or of a sharded cassette directory.
+    :param list ignore_on_match: Request attributes ignored while matching, as for `intercept_requests`.
+    :return: Statistics of the cassette, see the module documentation.
+    :type: dict
+    """
+    cassette_format = detect_format(cassette_path)
+    hosts = collections.defaultdict(collections.Counter)
+    sizes = []
+    played = []
+    bodies = collections.Counter()
+    duplicate_bytes = 0
+    count = repeated = redundant = 0
+    interactions = ((request, CompressedFormat.decompress(response))
+                    for request, response in cassette_format.iter_interactions(cassette_path))
+    for request, response, digest, size, is_repeated, is_redundant in _merge(interactions, ignore_on_match,
+                                                                            dedup=False):
+        count += 1
+        repeated += is_repeated
+        redundant += is_redundant
+        hosts[request.host][request.path] += 1
+        sizes.append(size)
+        bodies[digest] += 1
+        if bodies[digest] > 1:
+            duplicate_bytes += size
+        played.extend([request] * response.get('plays', 1))
+    load_seconds, match_seconds, unplayed = _playback_seconds(cassette_path, cassette_format, played,
+                                                              ignore_on_match)
+    return {
+        'path': str(cassette_path),
+        'format': cassette_format.name + ('/sharded' if isinstance(cassette_format, ShardedFormat) else ''),
+        'file_bytes': _file_bytes(cassette_path),
+        'interactions': count,
+        'plays': len(played),
+        'hosts': {host: {'interactions': sum(paths.values()), 'paths': dict(paths.most_common())}
+                  for host, paths in sorted(hosts.items())},
+        'body_bytes': _distribution(sizes),
+        'duplicate_bodies': {'bodies': sum(1 for times in bodies.values() if times > 1),
+                             'interactions': sum(times - 1 for times in bodies.values()),
+                             'bytes': duplicate_bytes},
+        'repeated': repeated,
+        'redundant': redundant,
+        'unplayed': unplayed,
+        'load_seconds': round(load_seconds, 6),
+        'match_seconds': round(match_seconds, 6),
+    }
+
+
+def _file_bytes(cassette_path):
+    path = Path(cassette_path)
+    if path.is_dir():
+        return sum(file.stat().st_size for file in path.iterdir() if file.is_file())
+    return path.stat().st_size
+
+
+def _playback_seconds(cassette_path, cassette_format, requests, ignore_on_match):
+    """
+    :param list requests: Recorded requests, in the order they are played.
+    :return: Seconds taken to load the cassette, and to match the requests as they are played back, and number of
+    plays of the interactions no request was matched to.
+    """
+    match_on = [getattr(matchers, name) for name in _match_on(ignore_on_match)]
+    cassette = IndexedCassette(str(cassette_path), record_mode=RecordMode.NONE, match_on=match_on,
+                               persister=cassette_format)
+    start = time.perf_counter()
+    cassette._load()
+    load_seconds = time.perf_counter() - start
+    cassette.allow_playback_repeats = False
+    start = time.perf_counter()
+    for request in requests:
+        cassette.play_response(request)
+    match_seconds = time.perf_counter() - start
+    unplayed = sum(max(0, cassette._plays(position) - cassette.play_counts[position])
+                   for position in range(len(cassette.data)))
+    return load_seconds, match_seconds, unplayed
+
+
+def rewrite_cassette(cassette_path, target_path=None, target_format=None, dedup=False, ignore_on_match=None):
+    """
+    Rewrite a cassette, migrating it to another format and merging its redundant interactions.
+    :param str cassette_path: Path of a cassette file, or of a sharded cassette directory.
+    :param str target_path: Path of the rewritten cassette, the cassette is replaced by default.
+    :param str target_format: Format of the rewritten cassette, one of FORMATS, the format of the cassette by default.
+    Sharded cassettes keep their shards.
+    :param bool dedup: True to merge the redundant interactions.
+    :param list ignore_on_match: Request attributes ignored while matching, as for `intercept_requests`.
+    :return: (interactions read, interactions written).
+    :type: tuple
+    """
+    source_format = detect_format(cassette_path)
+    target_path = str(target_path or cassette_path)
+    if isinstance(source_format, ShardedFormat):
+        inner = get_format(target_format) if target_format else source_format.cassette_format
+        cassette_format = ShardedFormat(inner, source_format.shard_by)
+    else:
+        cassette_format = get_format(target_format) if target_format else source_format
+    counts = {'read': 0, 'written': 0}
+
+    def interactions():
+        for request, response in source_format.iter_interactions(cassette_path):
+            counts['read'] += 1
+            # Bodies are read before the target is written, sharded cassettes are rewritten in place
+            yield request, materialize_response(response)
+
+    merged = [(request, response) for request, response, *_ in _merge(interactions(), ignore_on_match, dedup)]
+    counts['written'] = len(merged)
+    if isinstance(cassette_format, ShardedFormat):
+        cassette_format.save_interactions(target_path, merged)
+    else:
+        tmp_path = f'{target_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            cassette_format.save_interactions(tmp_path, merged)
+            os.replace(tmp_path, target_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    return counts['read'], counts['written']
+
+
+def find_cassettes(paths):
+    """
+    :param list paths: Cassette files and directories, searched recursively. Directories holding a manifest are
+    sharded cassettes.
+    :return: Paths of the cassettes.
+    :type: list
+    """
+    cassettes = []
+    for path in map(Path, paths):
+        if not path.is_dir() or (path / MANIFEST).is_file():
+            cassettes.append(str(path))
+            continue
+        for directory, directories, files in os.walk(path):
+            if MANIFEST in files:
+                cassettes.append(directory)
+                directories.clear()
+                continue
+            directories.sort()
+            cassettes.extend(os.path.join(directory, name) for name in sorted(files) if not name.endswith('.tmp'))
+    return cassettes
+
+
+def _run(function, cassette_path, kwargs):
+    try:
+        return cassette_path, function(cassette_path, **kwargs), None
+    except Exception as err:  # Reported with the cassette, files that are not cassettes are skipped
+        return cassette_path, None, f'{type(err).__name__}: {err}'
+
+
+def run_parallel(function, cassettes, jobs=None, **kwargs):
+    """
+    Apply `analyze_cassette` or `rewrite_cassette` to cassettes, in parallel processes.
+    :param int jobs: Number of processes, one per CPU core by default.
+    :return: (cassette path, result, error) tuples, in the order of the cassettes.
+    :type: list
+    """
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1 or len(cassettes) <= 1:
+        return [_run(function, cassette, kwargs) for cassette in cassettes]
+    with ProcessPoolExecutor(max_workers=min(jobs, len(cassettes))) as executor:
+        return list(executor.map(_run, [function] * len(cassettes), cassettes, [kwargs] * len(cassettes)))
+
+
+def _seconds(report):
+    return report['load_seconds'] + report['match_seconds']
+
+
+def summarize(reports, top=10):
+    """
+    :param list reports: Reports of `analyze_cassette`.
+    :return: Totals of the cassettes, their hottest endpoints and the cassettes slowest to play back.
+    :type: dict
+    """
+    endpoints = collections.Counter()
+    for report in reports:
+        for host, stats in report['hosts'].items():
+            for path, count in stats['paths'].items():
+                endpoints[f'{host}{path}'] += count
+    return {
+        'cassettes': len(reports),
+        'file_bytes': sum(report['file_bytes'] for report in reports),
+        'interactions': sum(report['interactions'] for report in reports),
+        'body_bytes': sum(report['body_bytes']['total'] for report in reports),
+        'duplicate_body_bytes': sum(report['duplicate_bodies']['bytes'] for report in reports),
+        'redundant': sum(report['redundant'] for report in reports),
+        'playback_seconds': round(sum(map(_seconds, reports)), 6),
+        'endpoints': dict(endpoints.most_common(top)),
+        'slowest': [{'path': report['path'], 'seconds': round(_seconds(report), 6)}
+                    for report in sorted(reports, key=_seconds, reverse=True)[:top]],
+    }
+
+
+def _print_analysis(reports, summary, out):
+    print(f"{'cassette':<50} {'format':<15} {'MB':>8} {'interactions':>12} {'dup MB':>8} {'redundant':>9} "
+          f"{'unplayed':>8} {'load ms':>9} {'match ms':>9}", file=out)
+    # Slowest cassettes first
+    for report in sorted(reports, key=_seconds, reverse=True):
+        print(f"{report['path'][-50:]:<50} {report['format']:<15} {report['file_bytes'] / (1 << 20):>8.2f} "
+              f"{report['interactions']:>12} {report['duplicate_bodies']['bytes'] / (1 << 20):>8.2f} "
+              f"{report['redundant']:>9} {report['unplayed']:>8} {report['load_seconds'] * 1000:>9.1f} "
+              f"{report['match_seconds'] * 1000:>9.1f}", file=out)
+    print(f"\n{summary['cassettes']} cassettes, {summary['file_bytes'] / (1 << 20):.2f} MB, "
+          f"{summary['interactions']} interactions, {summary['duplicate_body_bytes'] / (1 << 20):.2f} MB of "
+          f"duplicate bodies, {summary['redundant']} redundant interactions, "
+          f"{summary['playback_seconds']:.3f}s to load and match", file=out)
+    print('\nHottest endpoints:', file=out)
+    for endpoint, count in summary['endpoints'].items():
+        print(f'{count:>10} {endpoint}', file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Analyze and rewrite cassettes.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    analyze = commands.add_parser('analyze', help='report the content and playback cost of cassettes')
+    rewrite = commands.add_parser('rewrite', help='migrate cassettes to another format, merging redundant entries')
+    for command in (analyze, rewrite):
+        command.add_argument('paths', nargs='+', help='cassette files and directories, searched recursively')
+        command.add_argument('--ignore-on-match', nargs='*', default=[], choices=MATCH_ON,
+                             help='request attributes ignored while matching, as for intercept_requests')
+        command.add_argument('--jobs', type=int, default=None, help='number of processes, one per CPU by default')
+    analyze.add_argument('--json', action='store_true', help='print the reports as JSON')
+    analyze.add_argument('--top', type=int, default=10, help='number of endpoints and cassettes listed')
+    rewrite.add_argument('--format', choices=sorted(FORMATS), default=None, help='format of the rewritten cassettes')
+    rewrite.add_argument('--dedup', action='store_true', help='merge redundant interactions')
+    args = parser.parse_args(argv)
+
+    cassettes = find_cassettes(args.paths)
+    if args.command == 'analyze':
+        results = run_parallel(analyze_cassette, cassettes, jobs=args.jobs, ignore_on_match=args.ignore_on_match)
+    else:
+        results = run_parallel(rewrite_cassette, cassettes, jobs=args.jobs, target_format=args.format,
+                               dedup=args.dedup, ignore_on_match=args.ignore_on_match)
+    for path, _, error in results:
+        if error is not None:
+            print(f'Skipped {path}: {error}', file=sys.stderr)
+    done = [(path, result) for path, result, error in results if error is None]
+    if args.command == 'analyze':
+        reports = [report for _, report in done]
+        summary = summarize(reports, top=args.top)
+        if args.json:
+            json.dump({'cassettes': reports, 'summary': summary}, sys.stdout, indent=2)
+            print()
+        else:
+            _print_analysis(reports, summary, sys.stdout)
+    else:
+        for path, (read, written) in done:
+            print(f'{path}: {read} interactions read, {written} written')
+    return 0 if len(done) == len(results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
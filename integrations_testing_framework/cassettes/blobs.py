@@ -0,0 +1,222 @@
+"""
+Content-addressed storage of response bodies shared by cassettes.
+
+Response bodies are stored once in a blob directory, under the BLAKE2b digest of their content, and cassettes hold a
+reference to the blob in place of the body: `body: {blob: <digest>}`. Identical bodies recorded by any number of
+cassettes are stored a single time. Blobs are read on playback the first time their body is played, and kept in a
+process wide cache bounded in size, so that bodies played by several tests are read once.
+"""
+import collections
+import hashlib
+import os
+import threading
+from functools import partial
+from pathlib import Path
+
+from vcr.persisters.filesystem import CassetteDecodeError
+
+from integrations_testing_framework.cassettes.compression import compress, decompress, zstandard_module
+from integrations_testing_framework.cassettes.formats import LazyBody
+
+_DIGEST_SIZE = 32
+# Blob file suffix of each compression
+_SUFFIXES = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+
+
+class BlobCache:
+    """
+    Least recently used blobs, bounded by their total size.
+    """
+
+    def __init__(self, max_size):
+        """
+        :param int max_size: Maximum total size of the cached blobs in bytes.
+        """
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._blobs = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, digest, load):
+        """
+        :param str digest: Digest of the blob.
+        :param load: Function reading the blob when it is not cached.
+        :return: The content of the blob.
+        :type: bytes
+        """
+        with self._lock:
+            data = self._blobs.get(digest)
+            if data is not None:
+                self._blobs.move_to_end(digest)
+                self.hits += 1
+                return data
+            self.misses += 1
+        data = load()
+        with self._lock:
+            if digest not in self._blobs and len(data) <= self.max_size:
+                self._blobs[digest] = data
+                self.size += len(data)
+                while self.size > self.max_size:
+                    self.size -= len(self._blobs.popitem(last=False)[1])
+        return data
+
+    def clear(self):
+        with self._lock:
+            self._blobs.clear()
+            self.size = 0
+
+
+# Blobs read by every store of the process, blobs being identified by their content
+BLOB_CACHE = BlobCache(max_size=256 << 20)
+
+
+def _digest(data):
+    return hashlib.blake2b(data, digest_size=_DIGEST_SIZE).hexdigest()
+
+
+class BlobStore:
+    """
+    Directory of response bodies stored by digest, in files `<directory>/<2 first digest characters>/<digest>`.
+    """
+
+    def __init__(self, directory, compression=None, min_size=256):
+        """
+        :param str directory: Blob directory, can be shared by any number of cassettes.
+        :param str compression: Compression of the blobs written, None, 'gzip' or 'zstd' (requires zstandard). Blobs
+        are read whatever their compression.
+        :param int min_size: Bodies smaller than this number of bytes stay in cassettes.
+        """
+        if compression not in _SUFFIXES:
+            raise ValueError(f'Unknown blob compression "{compression}", expected one of {list(_SUFFIXES)}')
+        if compression == 'zstd':
+            zstandard_module()
+        self.directory = Path(directory)
+        self.compression = compression
+        self.min_size = min_size
+
+    def _path(self, digest, compression):
+        return self.directory / digest[:2] / f'{digest}{_SUFFIXES[compression]}'
+
+    def put(self, data):
+        """
+        Store a blob, unless a blob with the same content is stored already.
+        :param bytes data: Content of the blob.
+        :return: Digest of the blob.
+        :type: str
+        """
+        digest = _digest(data)
+        if any(self._path(digest, compression).exists() for compression in _SUFFIXES):
+            return digest
+        path = self._path(digest, self.compression)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as file:
+            file.write(compress(data, self.compression))
+        os.replace(tmp_path, path)
+        return digest
+
+    def get(self, digest):
+        """
+        :return: Content of the blob, from the cache if it was read already.
+        :type: bytes
+        :raises CassetteDecodeError: if the blob is missing or does not match its digest.
+        """
+        return BLOB_CACHE.get(digest, partial(self._read, digest))
+
+    def _read(self, digest):
+        for compression in _SUFFIXES:
+            try:
+                with open(self._path(digest, compression), 'rb') as file:
+                    data = decompress(file.read(), compression)
+                break
+            except FileNotFoundError:
+                continue
+        else:
+            raise CassetteDecodeError(f'Blob {digest} not found in {self.directory}')
+        if _digest(data) != digest:
+            raise CassetteDecodeError(f'Blob {digest} in {self.directory} does not match its digest')
+        return data
+
+    def reference(self, response):
+        """
+        :return: Copy of a response referencing its body stored as blob, the response itself if its body is kept.
+        """
+        body = response.get('body')
+        if not isinstance(body, dict) or 'blob' in body:
+            return response
+        data = body.get('string')
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        if data is None or len(data) < self.min_size:
+            return response
+        return {**response, 'body': {'blob': self.put(data)}}
+
+    def resolve(self, response):
+        """
+        :return: Copy of a response whose body is read from its blob when accessed, the response itself if it does not
+        reference a blob.
+        """
+        body = response.get('body')
+        if not isinstance(body, dict) or 'blob' not in body:
+            return response
+        return {**response, 'body': LazyBody(partial(self.get, body['blob']))}
+
+
+class BlobStoreFormat:
+    """
+    Cassette format storing response bodies in a blob store, wrapping the format storing the rest of the cassette.
+    """
+
+    def __init__(self, cassette_format, store):
+        self.name = cassette_format.name
+        self.cassette_format = cassette_format
+        self.store = store
+
+    @property
+    def cache_key(self):
+        """
+        Key of the format in the cassette cache, equal for formats of the same blob directory.
+        """
+        return self.cassette_format, str(self.store.directory.resolve())
+
+    def load_cassette(self, cassette_path, serializer=None):
+        requests, responses = self.cassette_format.load_cassette(cassette_path, serializer=serializer)
+        return requests, [self.store.resolve(response) for response in responses]
+
+    def save_cassette(self, cassette_path, cassette_dict, serializer=None):
+        self.save_interactions(cassette_path, zip(cassette_dict['requests'], cassette_dict['responses']))
+
+    def save_interactions(self, cassette_path, interactions):
+        self.cassette_format.save_interactions(cassette_path, ((request, self.store.reference(response))
+                                                               for request, response in interactions))
+
+    def iter_interactions(self, cassette_path):
+        for request, response in self.cassette_format.iter_interactions(cassette_path):
+            yield request, self.store.resolve(response)
+
+    def open_writer(self, cassette_path):
+        writer = self.cassette_format.open_writer(cassette_path)
+        return _BlobWriter(writer, self.store) if writer is not None else None
+
+
+class _BlobWriter:
+    def __init__(self, writer, store):
+        self._writer = writer
+        self._store = store
+
+    def append(self, request, response):
+        self._writer.append(request, self._store.reference(response))
+
+    def close(self):
+        self._writer.close()
+
+    def abort(self):
+        self._writer.abort()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._writer.__exit__(*exc_info)
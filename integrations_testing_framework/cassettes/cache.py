@@ -0,0 +1,108 @@
+"""
+Process wide cache of loaded cassettes.
+
+Tests playing back the same cassette file with the same configuration share the interactions parsed, filtered and
+indexed by the first of them, while each test plays them with its own play counts. Entries are keyed on the path,
+modification time and size of the file and on the configuration, so that changed files are parsed again, and least
+recently used entries are evicted once the files of the cached cassettes exceed `max_file_size` bytes in total.
+
+The bound is on the size of the files (the shards of sharded cassettes included), not on the memory held by the
+cached interactions: parsed YAML takes several times the size of its file, while the bodies of streaming, compressed
+and blob store cassettes are only held once played.
+"""
+import collections
+import os
+import threading
+import time
+
+from vcr.record_mode import RecordMode
+
+
+class CassetteCache:
+    """
+    Snapshots of loaded cassettes, see `IndexedCassette.snapshot`.
+    """
+
+    def __init__(self, max_file_size):
+        """
+        :param int max_file_size: Maximum total size in bytes of the files of the cached cassettes, 0 disables caching.
+        """
+        self.max_file_size = max_file_size
+        self.file_size = 0
+        self.hits = 0
+        self.misses = 0
+        # Seconds spent loading cassettes on misses, and that loading the cassettes played from the cache took
+        self.load_seconds = 0.0
+        self.saved_seconds = 0.0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, cassette, config_key):
+        """
+        Load a cassette from the cache, or from its file if it is not cached. Only cassettes that are played back
+        without recording are cached.
+        :param IndexedCassette cassette: Cassette that has not been loaded yet.
+        :param config_key: Hashable configuration the cassette was created with, None if it cannot be cached.
+        """
+        path = os.path.realpath(cassette._path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            stat = None
+        if config_key is None or stat is None or cassette.record_mode != RecordMode.NONE or self.max_file_size <= 0:
+            cassette._load()
+            return
+        key = (path, stat.st_mtime_ns, _file_size(path, stat), config_key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                self.saved_seconds += entry[1]
+        if entry is not None:
+            cassette.restore(entry[0])
+            return
+        start = time.perf_counter()
+        cassette._load()
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.misses += 1
+            self.load_seconds += elapsed
+            if key[2] > self.max_file_size or key in self._entries:
+                return
+            # Entries of previous versions of the file cannot be hit anymore
+            for stale_key in [stale_key for stale_key in self._entries if stale_key[0] == path]:
+                self.file_size -= stale_key[2]
+                del self._entries[stale_key]
+            self._entries[key] = (cassette.snapshot(), elapsed)
+            self.file_size += key[2]
+            while self.file_size > self.max_file_size:
+                self.file_size -= self._entries.popitem(last=False)[0][2]
+
+    def stats(self):
+        """
+        :return: Counters of the cache.
+        :type: dict
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries),
+                    'file_size': self.file_size, 'load_seconds': round(self.load_seconds, 6),
+                    'saved_seconds': round(self.saved_seconds, 6)}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.file_size = 0
+
+
+def _file_size(path, stat):
+    """
+    :return: Size of a cassette file, or of the files of a sharded cassette directory.
+    """
+    if not os.path.isdir(path):
+        return stat.st_size
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+# Cassettes loaded by the decorators of the process
+CASSETTE_CACHE = CassetteCache(max_file_size=512 << 20)
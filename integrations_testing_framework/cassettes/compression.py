@@ -0,0 +1,142 @@
+"""
+Compression of the response bodies stored in cassettes.
+
+Responses are recorded decompressed (`decode_compressed_response`), so that they can be redacted and read in diffs.
+With `CompressedFormat`, bodies of at least `min_size` bytes are compressed with gzip or zstd when the cassette is
+saved, once redacted, and stored as bytes: base64 in YAML and JSON Lines cassettes, raw in msgpack cassettes. The
+compression is recorded in the response (`body_compression`), and bodies are decompressed on playback only when
+they are read.
+"""
+import gzip
+
+from integrations_testing_framework.cassettes.formats import LazyBody
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSIONS = ('gzip', 'zstd')
+
+
+def zstandard_module():
+    if zstandard is None:
+        raise ImportError('zstd compression requires the "zstandard" package')
+    return zstandard
+
+
+def compress(data, compression):
+    if compression == 'gzip':
+        return gzip.compress(data, mtime=0)
+    if compression == 'zstd':
+        return zstandard_module().ZstdCompressor().compress(data)
+    return data
+
+
+def decompress(data, compression):
+    if compression == 'gzip':
+        return gzip.decompress(data)
+    if compression == 'zstd':
+        return zstandard_module().ZstdDecompressor().decompress(data)
+    return data
+
+
+class CompressedFormat:
+    """
+    Cassette format storing response bodies compressed, wrapping the format storing the cassette.
+    """
+
+    def __init__(self, cassette_format, compression='zstd', min_size=1024):
+        """
+        :param cassette_format: Format of the cassette.
+        :param str compression: 'gzip' or 'zstd' (requires zstandard), None to store bodies as they are. Bodies are read
+        whatever their compression.
+        :param int min_size: Bodies smaller than this number of bytes are stored as they are.
+        :raises ValueError: for unknown compressions.
+        """
+        if compression is not None and compression not in COMPRESSIONS:
+            raise ValueError(f'Unknown compression "{compression}", expected one of {list(COMPRESSIONS)}')
+        if compression == 'zstd':
+            zstandard_module()
+        self.name = cassette_format.name
+        self.cassette_format = cassette_format
+        self.compression = compression
+        self.min_size = min_size
+
+    @property
+    def cache_key(self):
+        """
+        Key of the format in the cassette cache.
+        """
+        return getattr(self.cassette_format, 'cache_key', self.cassette_format), self.compression, self.min_size
+
+    def compress(self, response):
+        """
+        :return: Copy of a response with its body compressed, the response itself if its body is stored as it is.
+        """
+        body = response.get('body')
+        if self.compression is None or not isinstance(body, dict) or response.get('body_compression'):
+            return response
+        data = body.get('string')
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        if data is None or len(data) < self.min_size:
+            return response
+        compressed = compress(data, self.compression)
+        if len(compressed) >= len(data):
+            return response
+        return {**response, 'body': {'string': compressed}, 'body_compression': self.compression}
+
+    @staticmethod
+    def decompress(response):
+        """
+        :return: Copy of a response whose body is decompressed when accessed, the response itself if its body is not
+        compressed.
+        """
+        compression = response.get('body_compression')
+        body = response.get('body')
+        if not compression or not isinstance(body, dict):
+            return response
+        response = {key: value for key, value in response.items() if key != 'body_compression'}
+        response['body'] = LazyBody(lambda: decompress(body['string'], compression))
+        return response
+
+    def load_cassette(self, cassette_path, serializer=None):
+        requests, responses = self.cassette_format.load_cassette(cassette_path, serializer=serializer)
+        return requests, [self.decompress(response) for response in responses]
+
+    def save_cassette(self, cassette_path, cassette_dict, serializer=None):
+        self.save_interactions(cassette_path, zip(cassette_dict['requests'], cassette_dict['responses']))
+
+    def save_interactions(self, cassette_path, interactions):
+        self.cassette_format.save_interactions(cassette_path, ((request, self.compress(response))
+                                                               for request, response in interactions))
+
+    def iter_interactions(self, cassette_path):
+        for request, response in self.cassette_format.iter_interactions(cassette_path):
+            yield request, self.decompress(response)
+
+    def open_writer(self, cassette_path):
+        writer = self.cassette_format.open_writer(cassette_path)
+        return _CompressingWriter(writer, self) if writer is not None else None
+
+
+class _CompressingWriter:
+    def __init__(self, writer, cassette_format):
+        self._writer = writer
+        self._format = cassette_format
+
+    def append(self, request, response):
+        self._writer.append(request, self._format.compress(response))
+
+    def close(self):
+        self._writer.close()
+
+    def abort(self):
+        self._writer.abort()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._writer.__exit__(*exc_info)
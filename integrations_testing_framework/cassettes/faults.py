@@ -0,0 +1,337 @@
+"""
+Fault and load injection on playback.
+
+A `FaultProfile` layers faults on the responses played back from a cassette, to check offline how a tap handles rate
+limits, server errors, slow responses and dropped connections:
+    RateLimit: a 429 response with a Retry-After header every N requests.
+    ServerErrors: bursts of 5xx responses, starting at random.
+    Latency: a fixed latency, plus a random jitter.
+    DropConnections: connections reset at random, raising ConnectionResetError from the client (see its limitation).
+    Throttle: the transfer time of response bodies at a bandwidth.
+Each fault can be limited to the requests whose path matches regular expressions. Injected error responses do not
+consume the recorded interactions, so that retried requests are answered with the recorded response.
+
+Random draws are seeded with the seed of the profile, the request and the number of times the request was made
+before, so that a profile injects the same faults on every run, whatever the order concurrent requests are made in.
+
+A `FaultReport` of every playback counts the injected faults, the retries of the failed requests and the time the tap
+waited before retrying them, and the throughput of the recorded responses.
+"""
+import collections
+import random
+import re
+import threading
+import time
+from http import HTTPStatus
+
+from integrations_testing_framework.cassettes.timing import response_size
+
+
+class Fault:
+    """
+    Base class of the faults of a profile.
+    """
+
+    def __init__(self, paths=None):
+        """
+        :param list paths: Regular expressions of the request paths the fault applies to, all requests by default.
+        """
+        self.paths = [re.compile(pattern) for pattern in paths or []]
+
+    def applies(self, request):
+        return not self.paths or any(pattern.search(request.path) for pattern in self.paths)
+
+    def response(self, request, state, rng):
+        """
+        :param dict state: State of the fault for the played cassette.
+        :param random.Random rng: Random numbers of the request.
+        :return: Response injected in place of the recorded one, None to play the recorded response.
+        :raises ConnectionResetError: to drop the connection.
+        """
+        return None
+
+    def delay(self, response, rng):
+        """
+        :return: Seconds added to the latency of the response.
+        :type: float
+        """
+        return 0.0
+
+
+def error_response(status, headers=None):
+    """
+    :return: vcr response with an empty body.
+    """
+    try:
+        message = HTTPStatus(status).phrase
+    except ValueError:
+        message = ''
+    return {'status': {'code': status, 'message': message},
+            'headers': {'Content-Length': ['0'], **(headers or {})},
+            'body': {'string': b''}}
+
+
+class RateLimit(Fault):
+    """
+    Answer every N-th request with a 429 response.
+    """
+
+    def __init__(self, every, retry_after=1, status=429, paths=None):
+        """
+        :param int every: Number of requests per rate limited request.
+        :param float retry_after: Seconds of the Retry-After header, None for no header.
+        :param int status: Status of the responses.
+        """
+        super().__init__(paths)
+        self.every = every
+        self.retry_after = retry_after
+        self.status = status
+
+    def response(self, request, state, rng):
+        state['requests'] = state.get('requests', 0) + 1
+        if state['requests'] % self.every:
+            return None
+        headers = {}
+        if self.retry_after is not None:
+            retry_after = int(self.retry_after) if float(self.retry_after).is_integer() else self.retry_after
+            headers['Retry-After'] = [str(retry_after)]
+        return error_response(self.status, headers)
+
+
+class ServerErrors(Fault):
+    """
+    Answer requests with bursts of server errors.
+    """
+
+    def __init__(self, rate, status=503, burst=1, paths=None):
+        """
+        :param float rate: Probability that a burst starts at a request.
+        :param int status: Status of the responses.
+        :param int burst: Number of consecutive requests answered with an error per burst.
+        """
+        super().__init__(paths)
+        self.rate = rate
+        self.status = status
+        self.burst = burst
+
+    def response(self, request, state, rng):
+        if state.get('remaining'):
+            state['remaining'] -= 1
+        elif rng.random() < self.rate:
+            state['remaining'] = self.burst - 1
+        else:
+            return None
+        return error_response(self.status)
+
+
+class DropConnections(Fault):
+    """
+    Reset the connection of requests at random.
+
+    The ConnectionResetError is raised from the vcr patches of the HTTP clients, not from their transport: requests
+    wraps it in a `requests.ConnectionError` as for an actual reset, but httpx and aiohttp clients receive the builtin
+    ConnectionResetError instead of their own transport errors (`httpx.TransportError`,
+    `aiohttp.ClientConnectionError`), so taps only handling those do not see the reset as a connection error.
+    """
+
+    def __init__(self, rate, paths=None):
+        """
+        :param float rate: Probability that the connection of a request is dropped.
+        """
+        super().__init__(paths)
+        self.rate = rate
+
+    def response(self, request, state, rng):
+        if rng.random() < self.rate:
+            raise ConnectionResetError(f'Connection dropped by fault injection: {request.method} {request.uri}')
+        return None
+
+
+class Latency(Fault):
+    """
+    Delay responses.
+    """
+
+    def __init__(self, seconds, jitter=0.0, paths=None):
+        """
+        :param float seconds: Latency of every response.
+        :param float jitter: Maximum random latency added to seconds.
+        """
+        super().__init__(paths)
+        self.seconds = seconds
+        self.jitter = jitter
+
+    def delay(self, response, rng):
+        return self.seconds + (rng.uniform(0, self.jitter) if self.jitter else 0.0)
+
+
+class Throttle(Fault):
+    """
+    Delay responses by the transfer time of their body.
+    """
+
+    def __init__(self, bandwidth, paths=None):
+        """
+        :param float bandwidth: Bandwidth in bytes per second.
+        """
+        super().__init__(paths)
+        self.bandwidth = bandwidth
+
+    def delay(self, response, rng):
+        return response_size(response) / self.bandwidth
+
+
+class FaultProfile:
+    """
+    Faults layered on the responses played back from cassettes, see the module documentation.
+    """
+
+    def __init__(self, *faults, seed=0, min_throughput=None):
+        """
+        :param faults: Faults, the first one injecting a response or dropping the connection of a request wins, the
+        delays of all of them add up.
+        :param seed: Seed of the random draws.
+        :param float min_throughput: Playback fails if fewer recorded responses per second are played.
+        """
+        self.faults = faults
+        self.seed = seed
+        self.min_throughput = min_throughput
+        #: Reports of the finished playbacks
+        self.reports = []
+        self._lock = threading.Lock()
+
+    def _random(self, request, report, position):
+        return random.Random(f'{self.seed}:{position}:{request.method} {request.uri}:{report.occurrence(request)}')
+
+    def inject(self, request, report):
+        """
+        Count a request and pick the response injected in place of the recorded one, if any.
+        :param FaultReport report: Report of the playback.
+        :return: Injected response, None to play the recorded response.
+        :raises ConnectionResetError: if the connection is dropped.
+        """
+        report.add_request(request)
+        for position, fault in enumerate(self.faults):
+            if not fault.applies(request):
+                continue
+            try:
+                response = fault.response(request, report.state[position], self._random(request, report, position))
+            except ConnectionResetError:
+                report.add_fault(request, 'drop')
+                raise
+            if response is not None:
+                report.add_fault(request, str(response['status']['code']))
+                return response
+        return None
+
+    def delay(self, request, response, report, injected=False):
+        """
+        :param bool injected: True if the response was injected.
+        :return: Seconds added to the latency of the response.
+        :type: float
+        """
+        seconds = sum(fault.delay(response, self._random(request, report, position))
+                      for position, fault in enumerate(self.faults) if fault.applies(request))
+        report.add_response(response, seconds, injected)
+        return seconds
+
+    def finish(self, report):
+        """
+        Complete the report of a playback and check its throughput.
+        """
+        report.finish()
+        with self._lock:
+            self.reports.append(report)
+        if self.min_throughput is not None:
+            assert report.throughput >= self.min_throughput, \
+                f"throughput of {report.throughput:.2f} responses/s, less than {self.min_throughput}"
+
+
+class FaultReport:
+    """
+    Faults injected during a playback, and how the tap coped with them.
+    """
+
+    def __init__(self, profile):
+        """
+        :param FaultProfile profile: Injected profile.
+        """
+        #: State of each fault of the profile
+        self.state = [{} for _ in profile.faults]
+        self.requests = 0
+        #: Injected faults by status code, or 'drop'
+        self.faults = collections.Counter()
+        #: Requests made again after a fault, and the seconds between the faults and the retries
+        self.retries = 0
+        self.backoff_seconds = 0.0
+        #: Recorded responses played, their size and the latency added to all responses
+        self.responses = 0
+        self.bytes = 0
+        self.delay_seconds = 0.0
+        self.wall_seconds = None
+        # Requests made so far, and time of the last fault of the requests that failed, by request
+        self._occurrences = collections.Counter()
+        self._failed = {}
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def occurrence(self, request):
+        """
+        :return: Number of times the request was made before.
+        """
+        return self._occurrences[(request.method, request.uri)] - 1
+
+    def add_request(self, request):
+        key = (request.method, request.uri)
+        with self._lock:
+            self.requests += 1
+            self._occurrences[key] += 1
+            failed_at = self._failed.pop(key, None)
+            if failed_at is not None:
+                self.retries += 1
+                self.backoff_seconds += time.perf_counter() - failed_at
+
+    def add_fault(self, request, fault):
+        with self._lock:
+            self.faults[fault] += 1
+            self._failed[(request.method, request.uri)] = time.perf_counter()
+
+    def add_response(self, response, delay, injected):
+        with self._lock:
+            self.delay_seconds += delay
+            if not injected:
+                self.responses += 1
+                self.bytes += response_size(response)
+
+    def finish(self):
+        self.wall_seconds = time.perf_counter() - self._start
+
+    @property
+    def throughput(self):
+        """
+        Recorded responses played per second.
+        """
+        seconds = self.wall_seconds if self.wall_seconds is not None else time.perf_counter() - self._start
+        return self.responses / seconds if seconds > 0 else 0.0
+
+    def to_dict(self):
+        seconds = self.wall_seconds or 0
+        return {
+            'requests': self.requests,
+            'faults': dict(self.faults),
+            'retries': self.retries,
+            'backoff_seconds': round(self.backoff_seconds, 6),
+            'responses': self.responses,
+            'bytes': self.bytes,
+            'delay_seconds': round(self.delay_seconds, 6),
+            'wall_seconds': round(seconds, 6),
+            'responses_per_second': round(self.throughput, 3),
+            'bytes_per_second': round(self.bytes / seconds, 1) if seconds > 0 else 0.0,
+        }
+
+    def summary(self):
+        report = self.to_dict()
+        faults = ', '.join(f'{count} {fault}' for fault, count in sorted(report['faults'].items())) or 'none'
+        return (f"{report['requests']} requests, faults: {faults}, {report['retries']} retries after "
+                f"{report['backoff_seconds']:.3f}s of backoff, {report['responses']} responses played in "
+                f"{report['wall_seconds']:.3f}s ({report['responses_per_second']} responses/s)")
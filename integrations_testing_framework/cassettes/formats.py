@@ -0,0 +1,411 @@
+"""
+Cassette storage formats.
+
+Besides the vcr YAML format, cassettes can be stored in streaming formats holding one record per interaction:
+    'jsonl': JSON Lines, a request/response line followed by a line holding the response body as JSON string.
+    'msgpack': Length prefixed msgpack request/response maps, each followed by the raw response body.
+Streaming formats are written incrementally while recording, to a temporary file replacing the cassette once complete.
+On playback only requests and response headers are parsed, response bodies are read from the cassette file (through
+mmap) the first time they are played.
+"""
+import base64
+import collections
+import json
+import mmap
+import os
+import struct
+import threading
+from functools import partial
+from pathlib import Path
+
+from vcr.persisters.filesystem import CassetteDecodeError, CassetteNotFoundError, FilesystemPersister
+from vcr.request import Request
+from vcr.serializers import yamlserializer
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+_FORMAT_VERSION = 1
+# Maximum number of cassette files kept memory mapped
+_MAX_MAPPED_FILES = 16
+_MAPPED_FILES = collections.OrderedDict()
+_MAPPED_FILES_LOCK = threading.Lock()
+
+
+class LazyBody(dict):
+    """
+    Response body whose 'string' is read only when accessed.
+    """
+
+    def __init__(self, loader, **kwargs):
+        super().__init__(**kwargs)
+        self.loader = loader
+
+    def __missing__(self, key):
+        if key != 'string':
+            raise KeyError(key)
+        value = self['string'] = self.loader()
+        return value
+
+    def __contains__(self, key):
+        return key == 'string' or super().__contains__(key)
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+
+def materialize_response(response):
+    """
+    Copy of a response with a plain dictionary body, as expected by serializers.
+    """
+    response = dict(response)
+    body = response.get('body')
+    if isinstance(body, dict):
+        # Bodies referencing their content elsewhere have no string
+        response['body'] = {**body, 'string': body['string']} if 'string' in body else dict(body)
+    return response
+
+
+def _read_mapped(path, stamp, offset, size):
+    """
+    Read `size` bytes at `offset` from a memory mapped cassette file.
+    :param tuple stamp: (mtime, size) of the file when it was indexed.
+    """
+    if size == 0:
+        return b''
+    key = (path, stamp)
+    with _MAPPED_FILES_LOCK:
+        mapped = _MAPPED_FILES.get(key)
+        if mapped is None:
+            try:
+                with open(path, 'rb') as file:
+                    if _file_stamp(file.fileno()) != stamp:
+                        raise CassetteDecodeError(f'Cassette {path} changed since it was loaded')
+                    mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except FileNotFoundError as err:
+                raise CassetteDecodeError(f'Cassette {path} was removed since it was loaded') from err
+            _MAPPED_FILES[key] = mapped
+            while len(_MAPPED_FILES) > _MAX_MAPPED_FILES:
+                _MAPPED_FILES.popitem(last=False)[1].close()
+        _MAPPED_FILES.move_to_end(key)
+        return mapped[offset:offset + size]
+
+
+def _file_stamp(fileno):
+    stat = os.fstat(fileno)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _to_bytes(string):
+    return string.encode('utf-8') if isinstance(string, str) else string
+
+
+class YamlFormat:
+    """
+    The vcr YAML cassette format, loaded and saved as a whole.
+    """
+    name = 'yaml'
+
+    @staticmethod
+    def load_cassette(cassette_path, serializer=yamlserializer):
+        return FilesystemPersister.load_cassette(cassette_path, serializer=serializer or yamlserializer)
+
+    def save_cassette(self, cassette_path, cassette_dict, serializer=yamlserializer):
+        self.save_interactions(cassette_path, zip(cassette_dict['requests'], cassette_dict['responses']),
+                               serializer=serializer)
+
+    @staticmethod
+    def save_interactions(cassette_path, interactions, serializer=yamlserializer):
+        requests, responses = [], []
+        for request, response in interactions:
+            requests.append(request)
+            responses.append(materialize_response(response))
+        FilesystemPersister.save_cassette(cassette_path, {'requests': requests, 'responses': responses},
+                                          serializer=serializer or yamlserializer)
+
+    def iter_interactions(self, cassette_path):
+        requests, responses = self.load_cassette(cassette_path)
+        return zip(requests, responses)
+
+    def open_writer(self, cassette_path):
+        return None
+
+
+class _StreamingFormat:
+    """
+    Base class of formats storing one record per interaction, followed by the response body.
+
+    Subclasses implement the record framing through `_write_header`, `_write_record` and `_read_records`.
+    """
+    name = None
+
+    def load_cassette(self, cassette_path, serializer=None):
+        requests, responses = [], []
+        for request, response in self.iter_interactions(cassette_path):
+            requests.append(request)
+            responses.append(response)
+        return requests, responses
+
+    def save_cassette(self, cassette_path, cassette_dict, serializer=None):
+        self.save_interactions(cassette_path, zip(cassette_dict['requests'], cassette_dict['responses']))
+
+    def save_interactions(self, cassette_path, interactions):
+        """
+        Write (request, response) pairs to the cassette, replacing it once complete (see `CassetteWriter`).
+        """
+        with self.open_writer(cassette_path) as writer:
+            for request, response in interactions:
+                writer.append(request, response)
+
+    def open_writer(self, cassette_path):
+        return CassetteWriter(self, cassette_path)
+
+    def iter_interactions(self, cassette_path):
+        """
+        Iterate over (request, response) pairs of a cassette, response bodies are loaded lazily.
+        """
+        cassette_path = str(cassette_path)
+        if not Path(cassette_path).is_file():
+            raise CassetteNotFoundError()
+        with open(cassette_path, 'rb') as file:
+            stamp = _file_stamp(file.fileno())
+            try:
+                header = self._read_header(file)
+            except ValueError as err:
+                raise CassetteDecodeError(f'Cannot read {self.name} cassette {cassette_path}') from err
+            if not header or header.get('format') != self.name:
+                raise CassetteDecodeError(f'{cassette_path} is not a {self.name} cassette')
+            for record, offset in self._read_records(file):
+                yield self._from_record(record, partial(self._read_body, cassette_path, stamp, offset))
+
+    def _from_record(self, record, read_body):
+        request = record['request']
+        request = Request(method=request['method'],
+                          uri=request['uri'],
+                          body=self._decode(request['body'], request.get('body_encoding')),
+                          headers=request['headers'])
+        response = dict(record['response'])
+        body = response['body']
+        if body.get('size') is None:
+            # Body held in the record, or kept elsewhere
+            response['body'] = dict(body)
+        else:
+            response['body'] = LazyBody(partial(read_body, body['size'], body.get('encoding')))
+        return request, response
+
+    def _to_record(self, request, response):
+        request = request._to_dict()
+        request['body'], encoding = self._encode(_to_bytes(request['body']))
+        if encoding:
+            request['body_encoding'] = encoding
+        response = dict(response)
+        body = response['body'].get('string')
+        if body is None:
+            response['body'] = dict(response['body'])
+            return {'request': request, 'response': response}, None
+        body, encoding = self._encode(_to_bytes(body))
+        response['body'] = {'size': len(body)}
+        if encoding:
+            response['body']['encoding'] = encoding
+        return {'request': request, 'response': response}, body
+
+    def _read_body(self, path, stamp, offset, size, encoding):
+        return self._decode(_read_mapped(path, stamp, offset, size), encoding)
+
+    def _encode(self, data):
+        """
+        :return: Tuple of data as stored by the format and encoding name, None if stored as is.
+        """
+        return data, None
+
+    def _decode(self, data, encoding):
+        return data
+
+    def _write_header(self, file):
+        raise NotImplementedError
+
+    def _read_header(self, file):
+        raise NotImplementedError
+
+    def _write_record(self, file, record, body):
+        raise NotImplementedError
+
+    def _read_records(self, file):
+        """
+        Iterate over (record, body offset) tuples, skipping bodies.
+        """
+        raise NotImplementedError
+
+
+class JsonLinesFormat(_StreamingFormat):
+    name = 'jsonl'
+
+    def _encode(self, data):
+        if data is None:
+            return None, None
+        try:
+            return data.decode('utf-8'), None
+        except UnicodeDecodeError:
+            return base64.b64encode(data).decode('ascii'), 'base64'
+
+    def _decode(self, data, encoding):
+        if isinstance(data, bytes):
+            data = json.loads(data)
+        if data is None:
+            return None
+        return base64.b64decode(data) if encoding == 'base64' else data.encode('utf-8')
+
+    def _to_record(self, request, response):
+        record, body = super()._to_record(request, response)
+        if body is not None:
+            body = json.dumps(body).encode('utf-8')
+            record['response']['body']['size'] = len(body)
+        return record, body
+
+    def _write_header(self, file):
+        file.write(json.dumps({'format': self.name, 'version': _FORMAT_VERSION}).encode('utf-8') + b'\n')
+
+    def _read_header(self, file):
+        line = file.readline()
+        return json.loads(line) if line else None
+
+    def _write_record(self, file, record, body):
+        file.write(json.dumps(record).encode('utf-8') + b'\n')
+        if body is not None:
+            file.write(body + b'\n')
+
+    def _read_records(self, file):
+        for line in file:
+            record = json.loads(line)
+            offset = file.tell()
+            size = record['response']['body'].get('size')
+            if size is not None:
+                file.seek(offset + size + 1)
+            yield record, offset
+
+
+class MsgpackFormat(_StreamingFormat):
+    name = 'msgpack'
+    _LENGTH = struct.Struct('>I')
+
+    def _write_header(self, file):
+        self._write_record(file, {'format': self.name, 'version': _FORMAT_VERSION}, None)
+
+    def _read_header(self, file):
+        return next(self._read_records(file), (None, None))[0]
+
+    def _write_record(self, file, record, body):
+        packed = _msgpack().packb(record, use_bin_type=True)
+        file.write(self._LENGTH.pack(len(packed)))
+        file.write(packed)
+        if body is not None:
+            file.write(body)
+
+    def _read_records(self, file):
+        unpackb = _msgpack().unpackb
+        while True:
+            length = file.read(self._LENGTH.size)
+            if not length:
+                return
+            if len(length) != self._LENGTH.size:
+                raise CassetteDecodeError('Truncated msgpack cassette')
+            record = unpackb(file.read(self._LENGTH.unpack(length)[0]), raw=False)
+            offset = file.tell()
+            size = record.get('response', {}).get('body', {}).get('size')
+            if size is not None:
+                file.seek(offset + size)
+            yield record, offset
+
+
+def _msgpack():
+    if msgpack is None:
+        raise ImportError('The msgpack cassette format requires the "msgpack" package')
+    return msgpack
+
+
+class CassetteWriter:
+    """
+    Appends interactions to a streaming cassette, one record at a time. Records are written to a temporary file of the
+    process and thread, replacing the cassette when the writer is closed, so that a crash, a failure or another worker
+    never leaves it incomplete.
+    """
+
+    def __init__(self, cassette_format, cassette_path):
+        self._format = cassette_format
+        self._path = cassette_path
+        self._tmp_path = f'{cassette_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        Path(cassette_path).parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self._tmp_path, 'wb')
+        self._format._write_header(self._file)
+
+    def append(self, request, response):
+        self._format._write_record(self._file, *self._format._to_record(request, response))
+
+    def close(self):
+        """
+        Replace the cassette with the records written.
+        """
+        try:
+            self._file.close()
+            os.replace(self._tmp_path, self._path)
+        finally:
+            self._remove_tmp()
+
+    def abort(self):
+        """
+        Discard the records written, leaving the cassette as it was.
+        """
+        self._file.close()
+        self._remove_tmp()
+
+    def _remove_tmp(self):
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+FORMATS = {cassette_format.name: cassette_format
+           for cassette_format in (YamlFormat(), JsonLinesFormat(), MsgpackFormat())}
+
+
+def get_format(name):
+    """
+    :param str name: Name of a cassette format, one of FORMATS.
+    :raises ValueError: for unknown formats.
+    """
+    try:
+        return FORMATS[name]
+    except KeyError:
+        raise ValueError(f'Unknown cassette format "{name}", expected one of {sorted(FORMATS)}') from None
+
+
+def convert_cassette(source_path, target_path, source_format='yaml', target_format='jsonl'):
+    """
+    Convert a cassette between storage formats, e.g. to migrate YAML cassettes.
+    :param str source_path: Path of the cassette to convert.
+    :param str target_path: Path of the converted cassette, can be the same as source_path.
+    :param str source_format: Format of the source cassette.
+    :param str target_format: Format of the converted cassette.
+    :return: Number of converted interactions.
+    :type: int
+    """
+    count = 0
+
+    def interactions():
+        nonlocal count
+        for interaction in get_format(source_format).iter_interactions(source_path):
+            count += 1
+            yield interaction
+
+    get_format(target_format).save_interactions(target_path, interactions())
+    return count
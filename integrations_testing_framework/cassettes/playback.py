@@ -0,0 +1,426 @@
+import collections
+import os
+import re
+import threading
+import time
+import weakref
+
+from vcr.cassette import Cassette
+from vcr.errors import UnhandledHTTPRequestError
+from vcr.persisters.filesystem import CassetteDecodeError, CassetteNotFoundError
+from vcr.record_mode import RecordMode
+from vcr.util import read_body
+
+from integrations_testing_framework.cassettes.faults import FaultReport
+from integrations_testing_framework.cassettes.timing import TimingReport, wait
+from integrations_testing_framework.instrumentation import current_report, timed
+
+# Functions producing a hashable value for each supported matcher, keyed by vcr matcher name
+_KEY_FUNCTIONS = {
+    'method': lambda request: request.method,
+    'scheme': lambda request: request.scheme,
+    'host': lambda request: request.host,
+    'port': lambda request: request.port,
+    'path': lambda request: request.path,
+    'query': lambda request: tuple(request.query),
+    'body': read_body,
+}
+
+
+def matcher_names(match_on):
+    """
+    :param list match_on: vcr matcher functions or matcher names.
+    :return: Names of the matchers, None for anonymous matchers.
+    :type: list
+    """
+    return [matcher if isinstance(matcher, str) else getattr(matcher, '__name__', None) for matcher in match_on]
+
+
+def request_key_function(match_on):
+    """
+    Build a function computing the index key of a request.
+    :param list match_on: vcr matcher functions or matcher names.
+    :return: Function returning a hashable key for a request, None if any of the matchers cannot be indexed.
+    :type: callable
+    """
+    names = matcher_names(match_on)
+    if not all(name in _KEY_FUNCTIONS for name in names):
+        return None
+    key_functions = [_KEY_FUNCTIONS[name] for name in sorted(names)]
+
+    def request_key(request):
+        return tuple(key_function(request) for key_function in key_functions)
+
+    return request_key
+
+
+# Full identity of a request, used to pick among interactions matching a request once some attributes are ignored
+_identity_key = request_key_function(list(_KEY_FUNCTIONS))
+
+
+class IndexedCassette(Cassette):
+    """
+    Cassette that plays back recorded interactions through a hash index instead of a linear scan.
+
+    The index is keyed on the request attributes selected by `match_on` and keeps, for every key, the interactions in
+    recording order with a cursor on the first one that has not been played yet. Lookups are therefore constant time
+    while the "next unplayed match wins" behaviour of vcr is preserved. The index itself is never modified, so that
+    loaded cassettes can be shared through a snapshot (see `integrations_testing_framework.cassettes.cache`).
+    Requests that are not found in the index (e.g. JSON bodies serialized with a different key order) fall back to
+    the regular vcr matching.
+
+    With `prefer_exact_match`, an interaction recorded for a request with the same full identity (all attributes of
+    `_MATCH_ON`, regardless of `match_on`) is played before other matches, so that the responses played to concurrent
+    requests do not depend on the order they are made in.
+
+    While recording, the timeline of every interaction is stored in the response:
+        'started', 'finished': seconds since the cassette was loaded,
+        'concurrency': number of requests in flight when the request started, including itself,
+        'size': size of the response body in bytes,
+        'recorded_at': Unix time the response was recorded at.
+    With a `ReplayTiming`, responses are played back after the delay it computes from their timeline, and the played
+    requests are reported in `timing_report`. With a `FaultProfile`, faults are injected in place of, or on top of, the
+    responses played back, and reported in `fault_report`.
+
+    With `incremental` recording (record mode 'new_episodes'), recorded interactions are played back and only the
+    requests missing from the cassette are recorded. Interactions recorded longer than `refresh_after` seconds ago, or
+    for a path matching one of `refresh_paths`, are dropped on load so that they are recorded again. The file is then
+    rewritten atomically with the interactions used, in the order of the requests. Unused interactions are dropped,
+    unless the recording was interrupted (see `keep_unused`).
+
+    Cassettes of a sharded format (see `integrations_testing_framework.cassettes.sharding`) played back with requests
+    matched on the attributes their shards are split by only read the manifest on load. The interactions of a shard
+    are loaded and added to the index the first time a request for the shard is made, the index of a snapshot being
+    copied rather than modified. Interactions of shards that are never opened are not played.
+
+    Consecutive identical interactions merged by `integrations_testing_framework.cassettes.analysis.rewrite_cassette`
+    hold the number of times they are played in their response ('plays'), and are played that many times.
+    """
+
+    def __init__(self, *args, prefer_exact_match=False, timing=None, incremental=False, refresh_after=None,
+                 refresh_paths=None, faults=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._request_key = request_key_function(self._match_on)
+        self._prefer_exact_match = prefer_exact_match
+        self._index = {}
+        self._identity_index = {} if prefer_exact_match else None
+        # Position in each index entry of the first interaction that may not have been played, by (index, key)
+        self._cursors = {}
+        self._lock = threading.RLock()
+        self._loading = False
+        # Writes recorded interactions one by one for streaming formats
+        self._writer = None
+        self._clock_start = time.perf_counter()
+        # Start time of requests in flight
+        self._started = weakref.WeakKeyDictionary()
+        self.timing = timing
+        self.timing_report = TimingReport() if timing is not None else None
+        self.faults = faults
+        self.fault_report = FaultReport(faults) if faults is not None else None
+        self._incremental = incremental
+        self._refresh_after = refresh_after
+        self._refresh_paths = [re.compile(pattern) for pattern in refresh_paths or []]
+        # Positions of the interactions used by an incremental recording, in the order of the requests
+        self._used = [] if incremental else None
+        #: Number of interactions dropped on load to be recorded again
+        self.refreshed = 0
+        #: Keep the unused interactions when saving an incremental recording
+        self.keep_unused = False
+        # Shards not loaded yet by shard key and function of a request returning its shard key, for sharded cassettes
+        self._shards = None
+        self._shard_key = None
+
+    def _load(self):
+        shard_route = getattr(self._persister, 'shard_route', None)
+        if shard_route is not None and self.record_mode == RecordMode.NONE:
+            self._shard_key = shard_route(matcher_names(self._match_on))
+        if self._shard_key is not None:
+            self._load_manifest()
+            return
+        self._loading = True
+        try:
+            super()._load()
+        finally:
+            self._loading = False
+        if self._refresh_after is not None or self._refresh_paths:
+            self._drop_stale()
+        self._build_index()
+
+    def _load_manifest(self):
+        """
+        Load the shards of a sharded cassette lazily.
+        """
+        try:
+            shards = self._persister.read_manifest(self._path)['shards']
+        except (CassetteDecodeError, CassetteNotFoundError):
+            shards = []
+        self._shards = {}
+        for shard in shards:
+            self._shards.setdefault(shard['key'], []).append(shard)
+        self.rewound = True
+        self._build_index()
+
+    def _load_shards(self, shards):
+        """
+        Add the interactions of shards to the cassette and to its index.
+        """
+        start = len(self.data)
+        self._loading = True
+        try:
+            with timed('load'):
+                interactions = self._persister.load_shards(self._path, shards)
+            for request, response in interactions:
+                self.append(request, response)
+                self._old_interactions.append((request, response))
+        finally:
+            self._loading = False
+        self.dirty = False
+        if self._request_key is None:
+            return
+        self._index = self._extend_index(self._index, self._request_key, start)
+        if self._identity_index is not None:
+            self._identity_index = self._extend_index(self._identity_index, _identity_key, start)
+
+    def _extend_index(self, index, key_function, start):
+        """
+        :return: Copy of an index with the interactions from position start added.
+        """
+        index = dict(index)
+        for key, positions in self._index_by(key_function, start).items():
+            index[key] = index.get(key, ()) + positions
+        return index
+
+    @property
+    def all_played(self):
+        # Interactions of the shards that were never opened were not played
+        return not self._shards and all(self.play_counts[position] >= self._plays(position)
+                                        for position in range(len(self.data)))
+
+    def _plays(self, position):
+        """
+        :return: Number of times the interaction at the position is played.
+        """
+        return self.data[position][1].get('plays', 1)
+
+    def _drop_stale(self):
+        """
+        Drop the interactions to record again, older than `refresh_after` or for a path matching `refresh_paths`.
+        """
+        try:
+            file_time = os.path.getmtime(self._path)
+        except OSError:
+            file_time = time.time()
+        now = time.time()
+
+        def is_stale(request, response):
+            if any(pattern.search(request.path) for pattern in self._refresh_paths):
+                return True
+            if self._refresh_after is None:
+                return False
+            # Cassettes recorded without timeline were recorded when their file was written
+            recorded_at = (response.get('timeline') or {}).get('recorded_at', file_time)
+            return now - recorded_at > self._refresh_after
+
+        kept = [interaction for interaction in self.data if not is_stale(*interaction)]
+        self.refreshed = len(self.data) - len(kept)
+        self.data = kept
+        self._old_interactions = list(kept)
+
+    def can_play_response_for(self, request):
+        if not self.write_protected:
+            started = time.perf_counter()
+            with self._lock:
+                self._started.setdefault(request, (started, len(self._started) + 1))
+        report = current_report()
+        if report is None:
+            return super().can_play_response_for(request)
+        start = time.perf_counter()
+        try:
+            return super().can_play_response_for(request)
+        finally:
+            report.http.add_seconds('match', time.perf_counter() - start)
+
+    def append(self, request, response):
+        """
+        Add a request, response pair to this cassette, writing it right away to cassettes in a streaming format.
+        """
+        with self._lock:
+            size = len(self.data)
+            super().append(request, response)
+            if self._loading or len(self.data) == size:
+                return
+            if request in self._started:
+                started, concurrency = self._started.pop(request)
+                body = (self.data[-1][1].get('body') or {}).get('string')
+                self.data[-1][1]['timeline'] = {
+                    'started': round(started - self._clock_start, 6),
+                    'finished': round(time.perf_counter() - self._clock_start, 6),
+                    'concurrency': concurrency,
+                    'size': len(body) if body else 0,
+                    'recorded_at': round(time.time(), 3),
+                }
+            if self._used is not None:
+                self._used.append(len(self.data) - 1)
+            elif size == 0:
+                open_writer = getattr(self._persister, 'open_writer', None)
+                self._writer = open_writer(self._path) if open_writer else None
+            report = current_report()
+            if report is not None:
+                report.http.add_request(*self.data[-1], recorded=True)
+            if self._writer is not None:
+                start = time.perf_counter()
+                self._writer.append(*self.data[-1])
+                if report is not None:
+                    report.http.add_seconds('save', time.perf_counter() - start)
+
+    def _save(self, force=False):
+        if self._incremental:
+            self._save_incremental()
+            return
+        if self._writer is None:
+            super()._save(force=force)
+            return
+        self._writer.close()
+        self._writer = None
+        self.dirty = False
+
+    def _save_incremental(self):
+        """
+        Replace the file with the interactions used, through a temporary file so that it is never left incomplete.
+        """
+        used = list(self._used)
+        if self.keep_unused:
+            used_positions = set(used)
+            used.extend(position for position in range(len(self.data)) if position not in used_positions)
+        if used == list(range(len(self._old_interactions))) and not self.refreshed:
+            # Every interaction was played in order, the file is unchanged
+            return
+        interactions = [self.data[position] for position in used]
+        if getattr(self._persister, 'atomic_save', False):
+            self._persister.save_interactions(self._path, interactions)
+            self.dirty = False
+            return
+        tmp_path = f'{self._path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            self._persister.save_interactions(tmp_path, interactions)
+            os.replace(tmp_path, self._path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self.dirty = False
+
+    def _build_index(self):
+        self._cursors = {}
+        self._index = {}
+        self._identity_index = {} if self._prefer_exact_match else None
+        if self._request_key is None:
+            return
+        self._index = self._index_by(self._request_key)
+        if self._prefer_exact_match:
+            self._identity_index = self._index_by(_identity_key)
+
+    def _index_by(self, key_function, start=0):
+        index = collections.defaultdict(list)
+        for position in range(start, len(self.data)):
+            index[key_function(self.data[position][0])].append(position)
+        return {key: tuple(positions) for key, positions in index.items()}
+
+    def _first_unplayed(self, index, key):
+        """
+        First interaction of an index entry that can be played, moving the cursor of the entry past the played ones.
+        """
+        positions = index.get(key)
+        if not positions:
+            return None
+        if self.allow_playback_repeats:
+            return positions[0]
+        cursor = (index is self._identity_index, key)
+        offset = self._cursors.get(cursor, 0)
+        while offset < len(positions) and self.play_counts[positions[offset]] >= self._plays(positions[offset]):
+            offset += 1
+        self._cursors[cursor] = offset
+        return positions[offset] if offset < len(positions) else None
+
+    def snapshot(self):
+        """
+        :return: The loaded interactions and their index, shared by the cassettes restored from it.
+        """
+        shards = {key: tuple(shards) for key, shards in self._shards.items()} if self._shards is not None else None
+        return tuple(self.data), self._index, self._identity_index, (self._shard_key, shards)
+
+    def restore(self, snapshot):
+        """
+        Load the cassette from the snapshot of a cassette loaded with the same configuration, instead of its file.
+        Play counts are kept by each cassette.
+        """
+        data, self._index, self._identity_index, (self._shard_key, shards) = snapshot
+        self._shards = dict(shards) if shards is not None else None
+        self.data = list(data)
+        self._old_interactions = list(data)
+        self._cursors = {}
+        self.dirty = False
+        self.rewound = True
+
+    def _next_index(self, request):
+        """
+        Index of the next playable interaction for an already filtered request, None if there is no such interaction.
+        """
+        if self._shards:
+            shards = self._shards.pop(self._shard_key(request), None)
+            if shards:
+                self._load_shards(shards)
+        if self._request_key is not None:
+            index = None
+            if self._identity_index is not None:
+                index = self._first_unplayed(self._identity_index, _identity_key(request))
+            if index is None:
+                index = self._first_unplayed(self._index, self._request_key(request))
+            if index is not None:
+                return index
+        # Linear vcr matching for requests that are equal only for a lenient matcher
+        for index, _ in super()._responses(request):
+            if self.play_counts[index] < self._plays(index) or self.allow_playback_repeats:
+                return index
+        return None
+
+    def play_response(self, request):
+        """
+        Get the response corresponding to a request, but only if it hasn't been played back before, and mark it as
+        played.
+        """
+        report = current_report()
+        start = time.perf_counter()
+        filtered_request = self._before_record_request(request)
+        with self._lock:
+            index = self._next_index(filtered_request) if filtered_request else None
+            if index is None:
+                raise UnhandledHTTPRequestError(
+                    "The cassette (%r) doesn't contain the request (%r) asked for" % (self._path, request)
+                )
+            # Injected responses leave the recorded interaction to a retry of the request
+            injected = self.faults.inject(request, self.fault_report) if self.faults is not None else None
+            if injected is None:
+                self.play_counts[index] += 1
+                if self._used is not None:
+                    self._used.append(index)
+                    self._started.pop(request, None)
+        response = injected if injected is not None else self.data[index][1]
+        if report is not None:
+            report.http.add_seconds('match', time.perf_counter() - start)
+            if injected is None:
+                report.http.add_request(request, response)
+        delay = self.timing.delay(response) if self.timing is not None else 0.0
+        if self.faults is not None:
+            delay += self.faults.delay(request, response, self.fault_report, injected=injected is not None)
+        if self.timing_report is not None:
+            self.timing_report.add(request, delay)
+        wait(delay)
+        return response
+
+    def rewind(self):
+        super().rewind()
+        self._build_index()
+
+    def __contains__(self, request):
+        with self._lock:
+            return self._next_index(request) is not None
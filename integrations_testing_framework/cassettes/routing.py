@@ -0,0 +1,99 @@
+"""
+Routes intercepted requests to the cassette of the calling context.
+
+vcr patches HTTP libraries process wide for a single cassette. Instead, the patches are installed once for a router
+while any cassette is in use, and the router hands every request to the cassette used by the calling thread or
+asyncio task, so that decorated functions can run concurrently.
+"""
+import contextlib
+import inspect
+import threading
+from unittest import mock
+
+from vcr.patch import CassettePatcherBuilder, reset_patchers
+
+from integrations_testing_framework.cassettes.timing import awaiting_delays
+from integrations_testing_framework.context import ContextLocal
+
+
+class _CassetteRouter:
+    """
+    Cassette given to the vcr patches, delegating to the cassette of the calling context.
+    """
+    custom_patches = ()
+
+    @property
+    def _path(self):
+        cassette = _CASSETTE.get()
+        return cassette._path if cassette is not None else 'context'
+
+    def __getattr__(self, name):
+        cassette = _CASSETTE.get()
+        if cassette is None:
+            raise RuntimeError('Request made outside of the cassettes in use, requests made from new threads are only '
+                               'routed when a single cassette is in use')
+        return getattr(cassette, name)
+
+
+_ROUTER = _CassetteRouter()
+_PATCHES = contextlib.ExitStack()
+# Module attributes reset while real connections are used, by the threads using them
+_RESET_PATCHES = contextlib.ExitStack()
+_RESET_LOCK = threading.Lock()
+_resets = 0
+
+
+@contextlib.contextmanager
+def _reset_connection_classes():
+    """
+    Reset the connection classes of the patched modules (e.g. `http.client.HTTPSConnection`, or
+    `urllib3.connection.HTTPConnection` before urllib3 2) while real connections are created or send requests, as they
+    are looked up by the `super(Class, self)` calls of the real classes. Connection pools create their connections from
+    their own patched attributes, so their requests of other threads are still routed meanwhile.
+    """
+    global _resets
+    with _RESET_LOCK:
+        if not _resets:
+            for patcher in reset_patchers():
+                if inspect.ismodule(patcher.getter()):
+                    _RESET_PATCHES.enter_context(patcher)
+        _resets += 1
+    try:
+        yield
+    finally:
+        with _RESET_LOCK:
+            _resets -= 1
+            if not _resets:
+                _RESET_PATCHES.close()
+
+
+def _install_patches():
+    for patcher in CassettePatcherBuilder(_ROUTER).build():
+        if inspect.isfunction(getattr(patcher, 'new', None)):
+            # Asynchronous clients await the delays of replayed responses
+            patcher.new = awaiting_delays(patcher.new)
+        _PATCHES.enter_context(patcher)
+    # vcr removes its patches process wide while sending a request to the real server, which would let requests of
+    # other threads through unrecorded: only the connection classes of modules are reset.
+    _PATCHES.enter_context(mock.patch('vcr.patch.force_reset', _reset_connection_classes))
+
+
+def _uninstall_patches():
+    _PATCHES.close()
+
+
+_CASSETTE = ContextLocal('cassette', install=_install_patches, uninstall=_uninstall_patches)
+
+
+def use_cassette(cassette):
+    """
+    Context manager intercepting the requests of the current context with the cassette.
+    """
+    return _CASSETTE.use(cassette)
+
+
+def current_cassette():
+    """
+    :return: The cassette used by the current context, None if there is none.
+    """
+    return _CASSETTE.get()
@@ -0,0 +1,227 @@
+"""
+Cassettes sharded into a directory of cassette files.
+
+A sharded cassette is a directory holding its interactions in several files of an underlying format (the shards), and
+a small manifest, `manifest.json`, listing them in order:
+    {"version": 1, "format": "jsonl", "shard_by": "path", "shards": [
+        {"file": "api.example.com_v1_users-5c1e2a9b.jsonl", "key": "api.example.com/v1/users", "interactions": 120},
+        ...]}
+Interactions are split by host, by host and path, or in chunks of a number of interactions, and keep their recorded
+order within each shard. Shards are named after their key, so that recording again only changes the shards of the
+requests whose responses changed, and diffs stay as small as the change.
+
+When requests are matched on the attributes the shards are split by, a played back cassette only reads the manifest
+on load, and opens the shard of a request the first time a request for it is made (see `IndexedCassette`), so that
+loading does not grow with the recording. Otherwise, and while recording, all shards are loaded, in parallel in a
+thread pool. Parsed shards are kept in a process wide cache bounded in size, shared by the tests playing them.
+"""
+import collections
+import filecmp
+import hashlib
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from vcr.persisters.filesystem import CassetteDecodeError, CassetteNotFoundError
+
+MANIFEST = 'manifest.json'
+_MANIFEST_VERSION = 1
+# Threads loading shards in parallel
+_MAX_WORKERS = 8
+# Maximum total size in bytes of the files of the cached shards
+_MAX_CACHED_SIZE = 256 << 20
+_SHARDS = collections.OrderedDict()
+_SHARDS_SIZE = 0
+_SHARDS_LOCK = threading.Lock()
+
+# Key of the shard of a request and matchers selecting the shard, by `shard_by`
+_SHARD_KEYS = {
+    'host': (lambda request: request.host, {'host'}),
+    'path': (lambda request: f'{request.host}{request.path}', {'host', 'path'}),
+}
+
+
+class ShardedFormat:
+    """
+    Cassette format storing cassettes as a directory of shards in another format, see the module documentation.
+    """
+    #: Saves replace each file of the cassette atomically, the manifest last
+    atomic_save = True
+
+    def __init__(self, cassette_format, shard_by='path'):
+        """
+        :param cassette_format: Format of the shards.
+        :param shard_by: 'host' or 'path' to split interactions by host or by host and path, or the number of
+        interactions per shard.
+        :raises ValueError: for unknown values of shard_by.
+        """
+        by_count = isinstance(shard_by, int) and not isinstance(shard_by, bool)
+        if not (by_count and shard_by > 0 or not by_count and shard_by in _SHARD_KEYS):
+            raise ValueError(f'Invalid shard_by {shard_by!r}, expected one of {sorted(_SHARD_KEYS)} or a number '
+                             f'of interactions')
+        self.name = cassette_format.name
+        self.cassette_format = cassette_format
+        self.shard_by = shard_by
+
+    @property
+    def cache_key(self):
+        """
+        Key of the format in the cassette cache.
+        """
+        return getattr(self.cassette_format, 'cache_key', self.cassette_format), self.shard_by
+
+    def shard_route(self, matcher_names):
+        """
+        :param set matcher_names: Names of the matchers requests are matched on.
+        :return: Function returning the key of the shard holding the interactions that can match a request, None if
+        requests can match interactions of any shard.
+        :type: callable
+        """
+        if self.shard_by not in _SHARD_KEYS:
+            return None
+        key_function, required = _SHARD_KEYS[self.shard_by]
+        return key_function if required <= set(matcher_names) else None
+
+    def read_manifest(self, cassette_path):
+        """
+        :return: Manifest of a sharded cassette.
+        :type: dict
+        :raises CassetteNotFoundError: if the cassette has no manifest.
+        :raises CassetteDecodeError: if it is not a manifest of this format.
+        """
+        path = Path(cassette_path) / MANIFEST
+        if not path.is_file():
+            raise CassetteNotFoundError()
+        try:
+            manifest = json.loads(path.read_text())
+        except ValueError as err:
+            raise CassetteDecodeError(f'Cannot read the manifest of {cassette_path}') from err
+        if not isinstance(manifest, dict) or manifest.get('version') != _MANIFEST_VERSION \
+                or manifest.get('format') != self.name:
+            raise CassetteDecodeError(f'{cassette_path} is not a sharded {self.name} cassette')
+        return manifest
+
+    def load_cassette(self, cassette_path, serializer=None):
+        requests, responses = [], []
+        for request, response in self.load_shards(cassette_path, self.read_manifest(cassette_path)['shards']):
+            requests.append(request)
+            responses.append(response)
+        return requests, responses
+
+    def load_shards(self, cassette_path, shards):
+        """
+        Load shards of a cassette, in parallel when there are several of them.
+        :param list shards: Entries of the shards in the manifest.
+        :return: (request, response) pairs of the shards, in order.
+        :type: list
+        """
+        if len(shards) == 1:
+            return list(self._load_shard(cassette_path, shards[0]))
+        with ThreadPoolExecutor(max_workers=min(_MAX_WORKERS, len(shards) or 1)) as executor:
+            loaded = list(executor.map(lambda shard: self._load_shard(cassette_path, shard), shards))
+        return [interaction for interactions in loaded for interaction in interactions]
+
+    def _load_shard(self, cassette_path, shard):
+        global _SHARDS_SIZE
+        path = os.path.realpath(Path(cassette_path) / shard['file'])
+        try:
+            stat = os.stat(path)
+        except OSError as err:
+            raise CassetteDecodeError(f'Shard {shard["file"]} of {cassette_path} is missing') from err
+        key = (self.cache_key, path, stat.st_mtime_ns, stat.st_size)
+        with _SHARDS_LOCK:
+            interactions = _SHARDS.get(key)
+            if interactions is not None:
+                _SHARDS.move_to_end(key)
+                return interactions
+        requests, responses = self.cassette_format.load_cassette(path)
+        interactions = tuple(zip(requests, responses))
+        with _SHARDS_LOCK:
+            if key not in _SHARDS and stat.st_size <= _MAX_CACHED_SIZE:
+                _SHARDS[key] = interactions
+                _SHARDS_SIZE += stat.st_size
+                while _SHARDS_SIZE > _MAX_CACHED_SIZE:
+                    _SHARDS_SIZE -= _SHARDS.popitem(last=False)[0][3]
+        return interactions
+
+    def iter_interactions(self, cassette_path):
+        for shard in self.read_manifest(cassette_path)['shards']:
+            yield from self.cassette_format.iter_interactions(Path(cassette_path) / shard['file'])
+
+    def save_cassette(self, cassette_path, cassette_dict, serializer=None):
+        self.save_interactions(cassette_path, zip(cassette_dict['requests'], cassette_dict['responses']))
+
+    def save_interactions(self, cassette_path, interactions):
+        """
+        Write (request, response) pairs to the shards of a cassette, then its manifest. Shards whose content is
+        unchanged are kept as they are, shards of the previous manifest that are not used anymore are removed.
+        """
+        directory = Path(cassette_path)
+        directory.mkdir(parents=True, exist_ok=True)
+        try:
+            previous = {shard['file'] for shard in self.read_manifest(directory)['shards']}
+        except (CassetteNotFoundError, CassetteDecodeError):
+            previous = set()
+        shards = []
+        for key, shard_interactions in self._split(interactions):
+            file_name = self._file_name(key, len(shards))
+            self._write_shard(directory / file_name, shard_interactions)
+            shards.append({'file': file_name, 'key': key, 'interactions': len(shard_interactions)})
+        manifest = {'version': _MANIFEST_VERSION, 'format': self.name, 'shard_by': self.shard_by, 'shards': shards}
+        tmp_path = directory / f'{MANIFEST}.{os.getpid()}.{threading.get_ident()}.tmp'
+        tmp_path.write_text(json.dumps(manifest, indent=2) + '\n')
+        os.replace(tmp_path, directory / MANIFEST)
+        for file_name in previous - {shard['file'] for shard in shards}:
+            (directory / file_name).unlink(missing_ok=True)
+
+    def _split(self, interactions):
+        """
+        :return: (shard key, interactions) pairs, keys being None for shards split by count.
+        """
+        if self.shard_by not in _SHARD_KEYS:
+            interactions = list(interactions)
+            return [(None, interactions[start:start + self.shard_by])
+                    for start in range(0, len(interactions), self.shard_by)]
+        key_function, _ = _SHARD_KEYS[self.shard_by]
+        shards = {}
+        for request, response in interactions:
+            shards.setdefault(key_function(request), []).append((request, response))
+        return list(shards.items())
+
+    def _file_name(self, key, position):
+        if key is None:
+            return f'part-{position:05d}.{self.name}'
+        slug = re.sub(r'[^\w.-]+', '_', key).strip('_')[:80]
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=4).hexdigest()
+        return f'{slug}-{digest}.{self.name}'
+
+    def _write_shard(self, path, interactions):
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            self.cassette_format.save_interactions(tmp_path, interactions)
+            if path.is_file() and filecmp.cmp(tmp_path, path, shallow=False):
+                # Keep the unchanged file, and its cached interactions
+                return
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def remove_cassette(self, cassette_path):
+        """
+        Remove the manifest and the shards of a cassette, leaving other files of its directory.
+        """
+        try:
+            manifest = self.read_manifest(cassette_path)
+        except (CassetteNotFoundError, CassetteDecodeError):
+            return
+        for shard in manifest['shards']:
+            (Path(cassette_path) / shard['file']).unlink(missing_ok=True)
+        (Path(cassette_path) / MANIFEST).unlink(missing_ok=True)
+
+    def open_writer(self, cassette_path):
+        # Shards are written when the cassette is saved
+        return None
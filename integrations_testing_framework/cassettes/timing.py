@@ -0,0 +1,214 @@
+"""
+Playback of cassettes with the timing of the recorded interactions.
+
+While recording, every interaction stores its timeline in the response (see `IndexedCassette`). On playback with a
+`ReplayTiming`, each response is returned after the recorded latency, scaled or replaced by a simulated latency and
+bandwidth, so that the tap runs as it would against the actual server and performance regressions (serial pagination,
+retries, ...) show up in its wall time. A `TimingReport` of every playback gives the wall time, the concurrency of the
+requests and the critical path: the chain of requests each started once the previous one had finished, ending with the
+last response.
+
+Synchronous clients sleep in the thread making the request. Asynchronous clients run in an event loop that must keep
+running other tasks meanwhile, so the delays of their responses are awaited by the patched client method instead.
+"""
+import asyncio
+import contextvars
+import functools
+import inspect
+import threading
+import time
+
+# Delays of the responses played while an asynchronous patched client method is awaited, None outside of them
+_DEFERRED_DELAYS = contextvars.ContextVar('deferred_delays', default=None)
+
+
+def wait(seconds):
+    """
+    Delay a played response, sleeping unless it is played within an asynchronous client method.
+    :param float seconds: Delay in seconds.
+    """
+    if seconds <= 0:
+        return
+    deferred = _DEFERRED_DELAYS.get()
+    if deferred is not None:
+        deferred.append(seconds)
+    else:
+        time.sleep(seconds)
+
+
+def awaiting_delays(function):
+    """
+    Wrap a patched client method so that, when it is asynchronous, the delays of the responses it plays are awaited.
+    """
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        result = function(*args, **kwargs)
+        return _awaiting_delays(result) if inspect.isawaitable(result) else result
+
+    return wrapper
+
+
+async def _awaiting_delays(awaitable):
+    token = _DEFERRED_DELAYS.set([])
+    try:
+        result = await awaitable
+    finally:
+        delays = _DEFERRED_DELAYS.get()
+        _DEFERRED_DELAYS.reset(token)
+    if delays:
+        await asyncio.sleep(sum(delays))
+    return result
+
+
+class ReplayTiming:
+    """
+    Timing of the responses played back from cassettes.
+    """
+
+    def __init__(self, scale=1.0, latency=None, bandwidth=None, max_seconds=None):
+        """
+        :param float scale: Factor applied to the recorded latency of the interactions, e.g. 0.1 to play 10 times
+        faster.
+        :param float latency: Latency of every response in seconds, in place of the recorded latency.
+        :param float bandwidth: Simulated bandwidth in bytes per second, the transfer time of the response body is
+        added to its latency.
+        :param float max_seconds: Playback fails if the wall time of the decorated method exceeds it.
+        """
+        self.scale = scale
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.max_seconds = max_seconds
+        #: Reports of the finished playbacks
+        self.reports = []
+        self._lock = threading.Lock()
+
+    def delay(self, response):
+        """
+        :return: Delay in seconds before the response is returned.
+        :type: float
+        """
+        timeline = response.get('timeline') or {}
+        if self.latency is not None:
+            seconds = self.latency
+        else:
+            seconds = max(timeline.get('finished', 0) - timeline.get('started', 0), 0) * self.scale
+        if self.bandwidth:
+            seconds += response_size(response) / self.bandwidth
+        return seconds
+
+    def finish(self, report, responses):
+        """
+        Complete the report of a playback and check its wall time.
+        :param TimingReport report: Report of the playback.
+        :param list responses: Responses of the played cassette.
+        """
+        report.finish(responses)
+        with self._lock:
+            self.reports.append(report)
+        if self.max_seconds is not None:
+            assert report.wall_seconds <= self.max_seconds, \
+                f"playback took {report.wall_seconds:.3f}s, more than {self.max_seconds}s"
+
+
+def response_size(response):
+    """
+    :return: Size of the body of a response in bytes, as recorded in its timeline if it has one.
+    """
+    timeline = response.get('timeline') or {}
+    if 'size' in timeline:
+        return timeline['size']
+    body = response.get('body')
+    # Lazy bodies are empty dictionaries until read
+    body = body.get('string') if isinstance(body, dict) else None
+    return len(body) if body else 0
+
+
+class TimingReport:
+    """
+    Requests played during a playback, with their start time and latency.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.wall_seconds = None
+        #: Wall time of the interactions when they were recorded, None without recorded timeline
+        self.recorded_seconds = None
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add(self, request, seconds):
+        """
+        :param request: Played request.
+        :param float seconds: Latency of its response.
+        """
+        started = time.perf_counter() - self._start
+        with self._lock:
+            self.requests.append((started, started + seconds, f'{request.method} {request.uri}'))
+
+    def finish(self, responses):
+        self.wall_seconds = time.perf_counter() - self._start
+        timelines = [response['timeline'] for response in responses if response.get('timeline')]
+        if timelines:
+            self.recorded_seconds = (max(timeline['finished'] for timeline in timelines)
+                                     - min(timeline['started'] for timeline in timelines))
+
+    @property
+    def max_concurrency(self):
+        """
+        Maximum number of requests in flight at once.
+        """
+        events = sorted([(started, 1) for started, _, _ in self.requests]
+                        + [(finished, -1) for _, finished, _ in self.requests])
+        concurrency = maximum = 0
+        for _, change in events:
+            concurrency += change
+            maximum = max(maximum, concurrency)
+        return maximum
+
+    @property
+    def critical_path(self):
+        """
+        Chain of requests ending with the last response, each request following the last response received before it
+        was made. Responses received at the instant a request is made, e.g. the request itself when played without
+        latency, do not precede it.
+        :return: List of (started, finished, request) tuples.
+        """
+        by_start = sorted(self.requests)
+        by_finish = sorted(self.requests, key=lambda request: request[1])
+        previous = {}
+        last_finished, position = None, 0
+        for request in by_start:
+            while position < len(by_finish) and by_finish[position][1] < request[0]:
+                last_finished = by_finish[position]
+                position += 1
+            previous[request] = last_finished
+        path = []
+        request = by_finish[-1] if by_finish else None
+        while request is not None:
+            path.append(request)
+            request = previous[request]
+        return path[::-1]
+
+    def to_dict(self):
+        request_seconds = sum(finished - started for started, finished, _ in self.requests)
+        critical_path = self.critical_path
+        return {
+            'wall_seconds': round(self.wall_seconds or 0, 6),
+            'recorded_seconds': round(self.recorded_seconds, 6) if self.recorded_seconds is not None else None,
+            'requests': len(self.requests),
+            'request_seconds': round(request_seconds, 6),
+            'mean_concurrency': round(request_seconds / self.wall_seconds, 3) if self.wall_seconds else 0,
+            'max_concurrency': self.max_concurrency,
+            'critical_path_seconds': round(sum(finished - started for started, finished, _ in critical_path), 6),
+            'critical_path': [
+                {'request': request, 'started': round(started, 6), 'seconds': round(finished - started, 6)}
+                for started, finished, request in critical_path
+            ],
+        }
+
+    def summary(self):
+        report = self.to_dict()
+        return (f"{report['requests']} requests played in {report['wall_seconds']:.3f}s (recorded in "
+                f"{report['recorded_seconds'] or 0:.3f}s), concurrency {report['mean_concurrency']} mean / "
+                f"{report['max_concurrency']} max, critical path of {len(report['critical_path'])} requests taking "
+                f"{report['critical_path_seconds']:.3f}s")
@@ -0,0 +1,240 @@
+"""
+Selection of streams and properties in Singer catalogs.
+
+Catalogs are parsed once per process and cached (keyed on the path, modification time and size of their file), with
+an index of their streams by stream key, so that selecting streams costs time proportional to the selected streams
+rather than to the catalog. Selected catalogs are built copy-on-write: only the selected streams are copied and
+encoded again, the JSON of the other streams is encoded once per catalog.
+
+Selected catalogs are written atomically to files of a temporary directory named after the version of the catalog
+file and the selection, so that tests and parallel test workers making the same selection share a file, written
+once, and never read a partial one.
+"""
+import collections
+import fnmatch
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+from pathlib import Path
+
+# Number of parsed catalogs kept by the process
+_MAX_CATALOGS = 32
+_CATALOGS = collections.OrderedDict()
+_CATALOGS_LOCK = threading.Lock()
+# Directory of the selected catalogs
+CATALOG_DIR = Path(tempfile.gettempdir()) / 'integrations-testing-catalogs'
+
+
+class Catalog:
+    """
+    Parsed catalog, with its streams indexed by stream key. The catalog is shared and must not be modified.
+    """
+
+    def __init__(self, catalog, key=None):
+        """
+        :param dict catalog: Parsed catalog.
+        :param tuple key: (path, modification time, size) of the catalog file.
+        """
+        self.catalog = catalog
+        self.key = key
+        self.streams = catalog.get('streams', [])
+        # Stream positions by value, by stream key
+        self._indexes = {}
+        # JSON of each stream, encoded once
+        self._encoded = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, catalog_path):
+        """
+        :param str catalog_path: Path of a catalog file.
+        :return: The catalog of the file, parsed once until the file changes.
+        :type: Catalog
+        """
+        path = os.path.realpath(catalog_path)
+        stat = os.stat(path)
+        key = (path, stat.st_mtime_ns, stat.st_size)
+        with _CATALOGS_LOCK:
+            catalog = _CATALOGS.get(key)
+            if catalog is not None:
+                _CATALOGS.move_to_end(key)
+                return catalog
+        with open(path, 'r') as file:
+            catalog = cls(json.load(file), key=key)
+        with _CATALOGS_LOCK:
+            catalog = _CATALOGS.setdefault(key, catalog)
+            while len(_CATALOGS) > _MAX_CATALOGS:
+                _CATALOGS.popitem(last=False)
+        return catalog
+
+    def positions(self, stream_key, value):
+        """
+        :return: Positions of the streams whose stream_key is value.
+        :type: list
+        """
+        index = self._indexes.get(stream_key)
+        if index is None:
+            index = collections.defaultdict(list)
+            for position, stream in enumerate(self.streams):
+                if stream_key in stream:
+                    index[stream[stream_key]].append(position)
+            index = self._indexes[stream_key] = dict(index)
+        return index.get(value, [])
+
+    def select(self, streams, stream_key='name', select_by_property=False, exclude=None, properties=None,
+               strict=True):
+        """
+        Select streams, as a catalog sharing the streams that are not selected with this catalog.
+        :param list streams: Values of stream_key of the selected streams.
+        :param str stream_key: Key identifying streams.
+        :param bool select_by_property: True to select every metadata entry of the streams, False to only select the
+        first one (the stream).
+        :param exclude: Metadata entries not selected by property, see `_entry_matcher`.
+        :param list properties: Breadcrumb patterns of the metadata entries selected by property, e.g.
+        'properties/address/*'. All entries are selected by default, the stream entry always is.
+        :param bool strict: True to fail on unknown streams.
+        :return: (selected catalog, selected streams by position).
+        :type: tuple
+        :raises KeyError: for unknown streams, when strict.
+        """
+        selected = {}
+        excluded = _entry_matcher(exclude)
+        included = _entry_matcher(properties) if properties else None
+        for name in streams:
+            positions = self.positions(stream_key, name)
+            if not positions and strict:
+                raise KeyError(f'No stream with {stream_key} "{name}" in the catalog')
+            for position in positions:
+                stream = selected.get(position, self.streams[position])
+                selected[position] = _select_stream(stream, select_by_property or bool(properties), excluded,
+                                                    included)
+        catalog = dict(self.catalog)
+        if selected:
+            catalog['streams'] = [selected.get(position, stream) for position, stream in enumerate(self.streams)]
+        return catalog, selected
+
+    def dumps(self, selected):
+        """
+        :param dict selected: Selected streams by position, as returned by `select`.
+        :return: JSON of the catalog with the selected streams, as `json.dumps` would encode it.
+        :type: str
+        """
+        with self._lock:
+            if self._encoded is None:
+                self._encoded = [json.dumps(stream) for stream in self.streams]
+        encoded = []
+        for key, value in self.catalog.items():
+            if key == 'streams' and isinstance(value, list):
+                streams = [json.dumps(selected[position]) if position in selected else stream
+                           for position, stream in enumerate(self._encoded)]
+                value = f'[{", ".join(streams)}]'
+            else:
+                value = json.dumps(value)
+            encoded.append(f'{json.dumps(key)}: {value}')
+        return f'{{{", ".join(encoded)}}}'
+
+
+def _entry_matcher(patterns):
+    """
+    :param patterns: Pattern, or list of patterns, matching a metadata entry if it is a key of its metadata, an
+    element of its breadcrumb, or a glob pattern matching its breadcrumb joined with '/' (patterns holding '/' or
+    wildcards).
+    :return: Function of a metadata entry returning whether it matches, None without patterns.
+    """
+    if patterns is None:
+        return None
+    if isinstance(patterns, str):
+        patterns = [patterns]
+    names = set(patterns)
+    globs = [pattern for pattern in patterns if any(char in pattern for char in '/*?[')]
+    breadcrumb_regex = re.compile('|'.join(fnmatch.translate(pattern) for pattern in globs)) if globs else None
+
+    def matches(entry):
+        breadcrumb = entry.get('breadcrumb', [])
+        if not names.isdisjoint(entry.get('metadata', {})) or not names.isdisjoint(breadcrumb):
+            return True
+        return breadcrumb_regex is not None and breadcrumb_regex.match('/'.join(breadcrumb)) is not None
+
+    return matches
+
+
+def _selected(entry):
+    return {**entry, 'metadata': {**entry['metadata'], 'selected': True}}
+
+
+def _select_stream(stream, select_by_property, excluded, included):
+    """
+    :return: Copy of the stream with its selected metadata entries, other entries are shared.
+    """
+    stream = dict(stream)
+    metadata = list(stream['metadata'])
+    if select_by_property:
+        for position, entry in enumerate(metadata):
+            if excluded is not None and excluded(entry):
+                continue
+            if included is not None and entry.get('breadcrumb') and not included(entry):
+                continue
+            metadata[position] = _selected(entry)
+    else:
+        metadata[0] = _selected(metadata[0])
+    stream['metadata'] = metadata
+    return stream
+
+
+def select_catalog(catalog_path, streams, stream_key='name', select_by_property=False, exclude=None,
+                   properties=None):
+    """
+    Select streams of a catalog, in memory.
+    See `select_streams` for the parameters.
+    :return: The selected catalog, sharing the streams that are not selected with the cached catalog: it must not be
+    modified.
+    :type: dict
+    """
+    catalog, _ = Catalog.load(catalog_path).select(streams, stream_key=stream_key,
+                                                   select_by_property=select_by_property, exclude=exclude,
+                                                   properties=properties)
+    return catalog
+
+
+def select_streams(catalog_path, streams, stream_key='name', select_by_property=False, exclude=None,
+                   properties=None, path=None, strict=True):
+    """
+    Create a catalog file with streams selected.
+    Example: @with_sys_args(['--config', config_path, '--catalog', select_streams('catalog.json', ['epics', 'users'])])
+
+    :param str catalog_path: Path of the catalog.
+    :param list streams: Values of stream_key of the selected streams.
+    :param str stream_key: Key identifying streams.
+    :param bool select_by_property: True to select every metadata entry of the streams, False to only select the
+    stream.
+    :param exclude: Metadata key, breadcrumb element or breadcrumb glob pattern (e.g. 'properties/*_url'), or list of
+    them, of the metadata entries not selected by property.
+    :param list properties: Breadcrumb glob patterns of the metadata entries selected by property, implies
+    select_by_property. The stream entry is always selected.
+    :param str path: Path of the created catalog, a file named after the selection in `CATALOG_DIR` by default.
+    :param bool strict: True to fail on unknown streams.
+    :return: Path of the created catalog.
+    :rtype: str
+    :raises KeyError: for unknown streams, when strict.
+    """
+    catalog = Catalog.load(catalog_path)
+    if path is None:
+        selection = json.dumps([catalog.key, list(streams), stream_key, select_by_property, exclude, properties])
+        digest = hashlib.blake2b(selection.encode('utf-8'), digest_size=12).hexdigest()
+        name = re.sub(r'[^\w.-]', '_', '_'.join(map(str, streams)))[:64]
+        path = CATALOG_DIR / f'{name}-{digest}.json'
+        if path.exists():
+            return str(path)
+    _, selected = catalog.select(streams, stream_key=stream_key, select_by_property=select_by_property,
+                                 exclude=exclude, properties=properties, strict=strict)
+    text = catalog.dumps(selected)
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w') as file:
+        file.write(text)
+    os.replace(tmp_path, path)
+    return str(path)
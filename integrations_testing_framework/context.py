@@ -0,0 +1,61 @@
+"""
+Context local state shared by the decorators, allowing them to run concurrently in threads and asyncio tasks.
+
+Process wide hooks (e.g. the sys.stdout replacement) are installed while at least one context uses a value and resolve
+the value of the calling context. Threads do not inherit the context of the thread starting them, so threads without a
+value of their own resolve to the value in use when exactly one context uses one.
+"""
+import contextlib
+import contextvars
+import threading
+
+
+class ContextLocal:
+    """
+    Value local to the current context, with a process wide hook installed while the value is used by any context.
+    """
+
+    def __init__(self, name, install=None, uninstall=None):
+        """
+        :param str name: Name of the context variable.
+        :param callable install: Called without arguments when the first context starts using a value.
+        :param callable uninstall: Called without arguments when the last context stops using its value.
+        """
+        self._var = contextvars.ContextVar(name, default=None)
+        self._install = install
+        self._uninstall = uninstall
+        self._lock = threading.Lock()
+        self._active = []
+
+    def get(self, default=None):
+        """
+        :return: The value of the current context, the only value in use when the context has none, else default.
+        """
+        value = self._var.get()
+        if value is not None:
+            return value
+        active = self._active
+        return active[0] if len(active) == 1 else default
+
+    @property
+    def active(self):
+        return bool(self._active)
+
+    @contextlib.contextmanager
+    def use(self, value):
+        """
+        Use a value in the current context.
+        """
+        with self._lock:
+            if not self._active and self._install:
+                self._install()
+            self._active.append(value)
+        token = self._var.set(value)
+        try:
+            yield value
+        finally:
+            self._var.reset(token)
+            with self._lock:
+                del self._active[next(i for i, active in enumerate(self._active) if active is value)]
+                if not self._active and self._uninstall:
+                    self._uninstall()
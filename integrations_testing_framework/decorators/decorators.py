@@ -1,59 +1,125 @@
+import inspect
 import os
 import os.path
 import sys
+from contextlib import contextmanager
 from functools import wraps
 from typing import List
-from integrations_testing_framework import utils, intercepted_stdout
+from integrations_testing_framework.capture import FileSink, MatchingSink, redirect_stdout
+from integrations_testing_framework.instrumentation import current_report, instrumenting
+from integrations_testing_framework.sys_args import use_sys_args
+from integrations_testing_framework.singer import MAX_READ_AHEAD, SingerMatchingSink
 
 
 def write_stdout(file_uri: str):
-    def decorator(func):
+    """
+    A decorator that will temporary redirect the stdout to the supplied file, written line by line while the wrapped
+    function runs. The file is only replaced once the wrapped function has returned.
+    """
 
-        @wraps(func)
-        def inner():
-            sys.stdout = intercepted_stdout
-            sys.stdout.truncate(0)
-            sys.stdout.seek(0)
-            try:
-                func()
-                sys.stdout.seek(0)
-                with open(file_uri, 'w') as file:
-                    lines = sys.stdout.readlines()
-                    if len(lines) == 0:
-                        raise Exception("Stdout is empty")
-                    file.writelines(lines)
-            finally:
-                sys.stdout.truncate(0)  # ensure stdout is cleared
-
-        return inner
+    def decorator(func):
+        return _wrap(func, lambda: _stdout_sink(FileSink(file_uri)))
 
     return decorator
 
 
 def assert_stdout_matches(file_uri: str):
     """
-    A decorator that will temporary redirect the stdout to an in-memory file, and then assert whether
-    the contents written to stdout match the contents of the supplied matching file.
+    A decorator that will temporary redirect the stdout to a sink comparing each line written to stdout with the
+    contents of the supplied matching file, failing on the first line that does not match.
     """
 
     if not os.path.isfile(file_uri):
         raise FileNotFoundError(f'File does not exist: {file_uri}')
 
     def decorator(func):
+        return _wrap(func, lambda: _stdout_sink(MatchingSink(file_uri)))
+
+    return decorator
+
+
+def assert_singer_output_matches(file_uri: str, ignore_record_order=False, max_read_ahead=MAX_READ_AHEAD):
+    """
+    A decorator that will temporary redirect the stdout to a sink parsing the Singer messages written by the wrapped
+    function, and then assert whether they match the messages of the supplied file.
+    Messages are compared per stream on canonical JSON, ignoring key order, number formatting and the position of
+    STATE messages between records. A summary of the differences is reported once the wrapped function has returned.
+
+    :param str file_uri: File holding the expected tap output.
+    :param bool ignore_record_order: True to compare the records of each stream regardless of their order.
+    :param int max_read_ahead: Maximum number of expected messages held in memory while looking for the next message
+    of a stream, the comparison fails beyond.
+    """
+
+    if not os.path.isfile(file_uri):
+        raise FileNotFoundError(f'File does not exist: {file_uri}')
+
+    def decorator(func):
+        return _wrap(func, lambda: _stdout_sink(SingerMatchingSink(file_uri, ignore_record_order=ignore_record_order,
+                                                                         max_read_ahead=max_read_ahead)))
+
+    return decorator
+
+
+@contextmanager
+def _stdout_sink(sink):
+    """
+    Redirect sys.stdout to the sink, and finish the sink once the wrapped function has returned.
+    """
+    report = current_report()
+    if report is not None:
+        sink.stats = report.output_stats()
+    try:
+        with redirect_stdout(sink):
+            yield sink
+    except BaseException:
+        sink.close()
+        raise
+    sink.finish()
+
+
+def _wrap(func, context):
+    """
+    Wrap a function, or a coroutine function, to run in the context manager created by `context()` on each call.
+    """
+    if inspect.iscoroutinefunction(func):
         @wraps(func)
-        def inner():
-            sys.stdout = intercepted_stdout
-            sys.stdout.truncate(0)
-            sys.stdout.seek(0)
-            try:
-                func()
-                sys.stdout.seek(0)
-                with open(file_uri, 'r') as file:
-                    utils.assert_matching_file_contents(file, sys.stdout)
-            finally:
-                sys.stdout.truncate(0)  # ensure stdout is cleared
-
-        return inner
+        async def async_inner():
+            with context():
+                await func()
+
+        return async_inner
+
+    @wraps(func)
+    def inner():
+        with context():
+            func()
+
+    return inner
+
+
+def instrument(report_dir=None, profile=False, trace_memory=False):
+    """
+    A decorator that will collect a performance report of the wrapped function, filled in by the decorators it wraps:
+    intercepted requests and the time spent matching, loading, saving and redacting them, and the messages written
+    to stdout. Reports are added to `integrations_testing_framework.instrumentation.SESSION_REPORT`.
+
+    :param str report_dir: Directory the JSON report of the test, its profile and, when the process exits, the session
+    report are written to.
+    :param bool profile: True to profile the wrapped function with cProfile.
+    :param bool trace_memory: True to trace the memory allocations of the wrapped function with tracemalloc.
+        Example:
+            @instrument('./reports', profile=True)
+            @write_stdout('./output/example.txt')
+            @intercept_requests('./requests/example.txt')
+            def test_stream_example():
+                tap_example.main()
+    """
+
+    def decorator(func):
+        name = f'{func.__module__}.{func.__qualname__}'.replace('.<locals>', '')
+        return _wrap(func, lambda: instrumenting(name, report_dir=report_dir, profile=profile,
+                                                 trace_memory=trace_memory))
 
     return decorator
 
@@ -61,19 +127,10 @@ def assert_stdout_matches(file_uri: str):
 def with_sys_args(args: List[str]):
     """
     This decorator sets the supplied arguments to the sys.argv variable, executes the wrapped function and resets to the original sys.argv value.
+    The arguments are only visible to the calling thread (or asyncio task), so decorated functions can run concurrently.
     """
 
     def decorator(func):
-        @wraps(func)
-        def inner():
-            original_args = sys.argv
-            try:
-                sys.argv = original_args[:1]
-                sys.argv.extend(args)
-                func()
-            finally:
-                sys.argv = original_args
-
-        return inner
+        return _wrap(func, lambda: use_sys_args(sys.argv[:1] + list(args)))
 
     return decorator
@@ -1,22 +1,47 @@
 import sys
+import inspect
 import vcr
-import json
 import logging
+from contextlib import contextmanager
+from datetime import timedelta
 from functools import wraps, partial
 from pathlib import Path
 
+from integrations_testing_framework.cassettes.blobs import BlobStore, BlobStoreFormat
+from integrations_testing_framework.cassettes.cache import CASSETTE_CACHE
+from integrations_testing_framework.cassettes.compression import CompressedFormat
+from integrations_testing_framework.cassettes.faults import FaultProfile
+from integrations_testing_framework.cassettes.formats import get_format
+from integrations_testing_framework.cassettes.playback import IndexedCassette
+from integrations_testing_framework.cassettes.routing import use_cassette
+from integrations_testing_framework.cassettes.sharding import ShardedFormat
+from integrations_testing_framework.cassettes.timing import ReplayTiming
+from integrations_testing_framework.instrumentation import current_report, timed
+from integrations_testing_framework.mocking import MockResponse, MockServer
+from integrations_testing_framework.redaction import Redactor
+from integrations_testing_framework.response_filters import RESPONSE_FILTERS, filter_body
+
 LOGGER = logging.getLogger()
-LOGGER.addHandler(logging.StreamHandler(sys.stderr))
+# The handler is added once per process, even if the module is imported again (e.g. reloaded)
+if not any(getattr(handler, 'integrations_testing_framework', False) for handler in LOGGER.handlers):
+    _HANDLER = logging.StreamHandler(sys.stderr)
+    _HANDLER.integrations_testing_framework = True
+    LOGGER.addHandler(_HANDLER)
 
 # Default match
 _MATCH_ON = {'method', 'scheme', 'host', 'port', 'path', 'query', 'body'}
-# Preserve characters during string update
-_PRESERVE_CHARS = set(r'!@#$%^&*_-+=()[]{}\/<>,.?')
+# Provides vcr default configuration for cassettes used by the decorators
+_VCR = vcr.VCR()
+# vcr configuration that is not passed to cassettes
+_NON_CASSETTE_ARGUMENTS = ('path_transformer', 'func_path_generator', 'record_on_exception')
 
 
 def intercept_requests(file_uri: str, generate=False, ignore_on_match=None, filter_req_headers=['authorization'],
                        filter_req_params=None, filter_req_data=None, filter_resp_data=None,
-                       filter_resp_data_except=None):
+                       filter_resp_data_except=None, format='yaml', prefer_exact_match=None, response_filters=None,
+                       blob_store=None, replay_timing=None, incremental=False, refresh_after=None,
+                       refresh_paths=None, shard_by=None, compression=None, compression_min_size=1024,
+                       faults=None):
     """
     A decorator that will intercept HTTP calls and depending on the supplied configuration will either save the call
     data to a file or will mock the request with data from the given file.
@@ -55,61 +80,265 @@ def intercept_requests(file_uri: str, generate=False, ignore_on_match=None, filt
         Example:
             Replace 'email' and 'cell_number' with dummy values
             filter_resp_data=['email', 'cell_number']
-        Note: Only works for content-type JSON at the moment.
+        Keys can also be dotted paths from the root of the body, where '*' matches any key or array index.
+        Example:
+            Replace 'email' of every item in 'data' only
+            filter_resp_data=['data.*.email']
+        Note: Works for the content-types of `integrations_testing_framework.response_filters.RESPONSE_FILTERS`:
+              JSON, NDJSON, CSV (keys are columns) and XML (keys are element and attribute names), possibly gzipped.
               Decorated method would still receive actual response.
     :param list filter_resp_data_except: Everything in response body other than these keys should be replaced with dummy
     value before saving to the file.
         Example:
             Replace everything in response body with dummy values other than 'id' and 'sync_timestamp' keys
             filter_resp_data_except=['id', 'sync_timestamp']
-        Note: Only works for content-type JSON at the moment.
+        Keys can be dotted paths as in filter_resp_data.
+        Note: Works for the same content-types as filter_resp_data.
               Decorated method would still receive actual response.
+    :param str format: Storage format of the file.
+        Possible values:
+            'yaml': vcr YAML cassette (default).
+            'jsonl': JSON Lines, written one interaction at a time, response bodies are read only when played.
+            'msgpack': Same as 'jsonl' using msgpack records, requires the msgpack package.
+        Existing files can be migrated with `integrations_testing_framework.cassettes.formats.convert_cassette`.
+    :param bool prefer_exact_match: True: a request is first matched with the interactions recorded for a request
+    equal in all attributes, including those in ignore_on_match, before falling back to the next unplayed match.
+    Responses played to concurrent requests then do not depend on the order requests are made in.
+    Defaults to True for async functions and to False otherwise.
+    :param dict response_filters: Filters redacting response bodies by content type, added to the registered filters.
+    A filter is a function `filter(source, target, redactor)` writing the redacted body read from the binary file
+    `source` to the binary file `target`, see `integrations_testing_framework.response_filters`.
+        Example:
+            Redact 'text/tab-separated-values' bodies as CSV
+            response_filters={'text/tab-separated-values': filter_csv}
+    :param blob_store: Directory, or `integrations_testing_framework.cassettes.blobs.BlobStore`, storing response
+    bodies by content so that identical bodies recorded by any cassette are stored once. The file then references
+    the bodies, which are read from the directory when played.
+        Example:
+            Share response bodies between the cassettes of a tap, compressed with zstd
+            blob_store=BlobStore('./requests/blobs', compression='zstd')
+    :param replay_timing: True, or `integrations_testing_framework.cassettes.timing.ReplayTiming`, to play back every
+    response after the latency it was recorded with, or a scaled or simulated latency, instead of instantly. The wall
+    time, concurrency and critical path of the requests are logged, and kept in `ReplayTiming.reports`.
+        Example:
+            Play back twice as fast with a simulated bandwidth of 1MB/s, failing above 5 seconds
+            replay_timing=ReplayTiming(scale=0.5, bandwidth=1e6, max_seconds=5)
+    :param bool incremental: With generate, keep the interactions of the file that match the requests made and only
+    send the requests missing from the file to the actual server, instead of recording everything again. The file is
+    rewritten atomically with the interactions used, in the order of the requests.
+    :param refresh_after: With incremental, seconds (or `datetime.timedelta`) after which recorded interactions are
+    stale and recorded again.
+    :param list refresh_paths: With incremental, regular expressions of the request paths recorded again.
+        Example:
+            Record again the interactions older than a week and the requests to '/v1/users'
+            generate=True, incremental=True, refresh_after=timedelta(days=7), refresh_paths=['^/v1/users']
+    :param shard_by: Store the cassette as a directory of shards with a manifest, file_uri being the directory, see
+    `integrations_testing_framework.cassettes.sharding`.
+        Possible values:
+            'host': One shard per host.
+            'path': One shard per host and path.
+            int: Shards of that number of interactions.
+        Shards are loaded in parallel. When the shards are split by host or path and requests are matched on them,
+        only the shards of the requests made are loaded on playback.
+        Example:
+            Record a cassette per API endpoint
+            format='jsonl', shard_by='path'
+    :param str compression: 'gzip' or 'zstd' (requires zstandard) to store response bodies compressed, as base64 in
+    'yaml' and 'jsonl' files and as is in 'msgpack' files. Bodies are compressed once redacted, when the file is
+    written, and decompressed on playback only when they are read, whether compression is set or not.
+    :param int compression_min_size: With compression, bodies smaller than this number of bytes are stored as they are.
+    :param faults: `integrations_testing_framework.cassettes.faults.FaultProfile`, or list of faults, injected in the
+    responses played back: rate limits, server errors, latency, dropped connections and throttling. The faults,
+    retries, backoff and throughput of the requests are logged, kept in `FaultProfile.reports` and added to the
+    report of instrumented tests.
+        Example:
+            Rate limit every 10th request and drop 1% of the connections, failing below 20 responses per second
+            faults=FaultProfile(RateLimit(every=10, retry_after=0.5), DropConnections(rate=0.01), seed=1,
+                                min_throughput=20)
     """
     if filter_resp_data and filter_resp_data_except:
         raise ValueError('One of (filter_resp_data, filter_resp_data_except) can be used at a time')
-    record_mode = 'all' if generate else 'none'
+    if (refresh_after is not None or refresh_paths) and not incremental:
+        raise ValueError('refresh_after and refresh_paths require incremental recording')
+    incremental = bool(incremental and generate)
+    if isinstance(refresh_after, timedelta):
+        refresh_after = refresh_after.total_seconds()
+    record_mode = 'new_episodes' if incremental else 'all' if generate else 'none'
     match_on = _MATCH_ON - set(ignore_on_match) if ignore_on_match else _MATCH_ON
-    match_on = list(match_on)
+    match_on = sorted(match_on)
     filter_req_data = _to_list_of_tuple(filter_req_data or [])
     filter_req_params = _to_list_of_tuple(filter_req_params or [])
     filter_req_headers = _to_list_of_tuple(filter_req_headers or [])
     # Response processing hook
-    resp_configs = {'data_update_keys': filter_resp_data, 'data_skip_keys': filter_resp_data_except}
     update_resp_data = filter_resp_data or filter_resp_data_except
-    before_record_response = partial(_before_record_response, **resp_configs) if update_resp_data and generate else None
+    redactor = Redactor(update_keys=filter_resp_data, skip_keys=filter_resp_data_except)
+    before_record_response = None
+    if update_resp_data and generate:
+        filters = {**RESPONSE_FILTERS, **{key.lower(): value for key, value in (response_filters or {}).items()}}
+        before_record_response = partial(_before_record_response, redactor=redactor, filters=filters)
+    # Compressed bodies are decompressed on playback whatever the compression option
+    persister = CompressedFormat(get_format(format), compression, min_size=compression_min_size)
+    if blob_store is not None:
+        store = blob_store if isinstance(blob_store, BlobStore) else BlobStore(blob_store)
+        persister = BlobStoreFormat(persister, store)
+    if shard_by is not None:
+        persister = ShardedFormat(persister, shard_by)
+    timing = None
+    if replay_timing and not generate:
+        timing = replay_timing if isinstance(replay_timing, ReplayTiming) else ReplayTiming()
+    if faults is not None and not isinstance(faults, FaultProfile):
+        faults = FaultProfile(*faults)
+    if generate:
+        faults = None
 
     def decorator(func):
-        @wraps(func)
-        def interceptor(*args, **kwargs):
-            if generate:
+        is_async = inspect.iscoroutinefunction(func)
+        exact_match = is_async if prefer_exact_match is None else prefer_exact_match
+
+        @contextmanager
+        def intercepting():
+            if generate and not incremental:
                 # Emptying file as vcr does not do this by default
-                Path(file_uri).unlink(missing_ok=True)
-            with vcr.use_cassette(file_uri,
-                                  record_mode=record_mode,
-                                  filter_headers=filter_req_headers,
-                                  filter_query_parameters=filter_req_params,
-                                  filter_post_data_parameters=filter_req_data,
-                                  before_record_response=before_record_response,
-                                  decode_compressed_response=True,
-                                  match_on=match_on) as cass:
-                if generate is False:
+                if shard_by is not None:
+                    persister.remove_cassette(file_uri)
+                else:
+                    Path(file_uri).unlink(missing_ok=True)
+            with _use_cassette(file_uri,
+                               record_mode=record_mode,
+                               filter_headers=filter_req_headers,
+                               filter_query_parameters=filter_req_params,
+                               filter_post_data_parameters=filter_req_data,
+                               before_record_response=before_record_response,
+                               decode_compressed_response=True,
+                               match_on=match_on,
+                               persister=persister,
+                               prefer_exact_match=exact_match,
+                               timing=timing,
+                               incremental=incremental,
+                               refresh_after=refresh_after,
+                               refresh_paths=refresh_paths,
+                               faults=faults) as cass:
+                if generate is False or incremental:
                     cass.allow_playback_repeats = False
-                func(*args, **kwargs)
+                yield
                 if generate is False:
                     assert cass.all_played is True, "not all previously recorded requests were made"
+                if timing is not None:
+                    timing.finish(cass.timing_report, [response for _, response in cass.data])
+                    LOGGER.info('%s: %s', file_uri, cass.timing_report.summary())
+                if faults is not None:
+                    report = current_report()
+                    if report is not None:
+                        report.faults = cass.fault_report
+                    LOGGER.info('%s: %s', file_uri, cass.fault_report.summary())
+                    faults.finish(cass.fault_report)
+
+        if is_async:
+            @wraps(func)
+            async def async_interceptor(*args, **kwargs):
+                with intercepting():
+                    await func(*args, **kwargs)
+            return async_interceptor
+
+        @wraps(func)
+        def interceptor(*args, **kwargs):
+            with intercepting():
+                func(*args, **kwargs)
         return interceptor
 
     return decorator
 
 
-def _before_record_response(response, **kwargs):
+def mock_requests(server):
+    """
+    A decorator that will answer HTTP calls with the routes of a mock server instead of the actual server.
+
+    :param MockServer server: Server answering requests, see `integrations_testing_framework.mocking`.
+        Example:
+            server = MockServer()
+            server.get('/v1/users/{user_id}', {'name': 'Jane'})
+
+            @mock_requests(server)
+            def test_users():
+                tap_example.main()
+    """
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_mocking(*args, **kwargs):
+                with server:
+                    await func(*args, **kwargs)
+            return async_mocking
+
+        @wraps(func)
+        def mocking(*args, **kwargs):
+            with server:
+                func(*args, **kwargs)
+        return mocking
+
+    return decorator
+
+
+@contextmanager
+def _use_cassette(file_uri, persister, prefer_exact_match=False, timing=None, incremental=False, refresh_after=None,
+                  refresh_paths=None, faults=None, **kwargs):
+    """
+    Same as `vcr.use_cassette`, but plays back requests through an indexed cassette intercepting only the requests of
+    the calling context. Played back cassettes are loaded through the process wide cassette cache.
+    :param persister: Cassette format storing the file.
+    :param bool prefer_exact_match: Play interactions recorded for requests with the same full identity first.
+    :param ReplayTiming timing: Timing of the played responses.
+    :param bool incremental: Record only the requests missing from the file, see `IndexedCassette`.
+    :param float refresh_after: Age in seconds of the interactions recorded again.
+    :param list refresh_paths: Regular expressions of the paths of the interactions recorded again.
+    :param FaultProfile faults: Faults injected in the played responses.
+    """
+    config = _VCR.get_merged_config(path=file_uri, **kwargs)
+    for key in _NON_CASSETTE_ARGUMENTS:
+        config.pop(key, None)
+    config['persister'] = persister
+    config['prefer_exact_match'] = prefer_exact_match
+    config['timing'] = timing
+    config['faults'] = faults
+    config.update(incremental=incremental, refresh_after=refresh_after, refresh_paths=refresh_paths)
+    cassette = IndexedCassette(**config)
+    with timed('load'):
+        CASSETTE_CACHE.load(cassette, _cache_key(persister, prefer_exact_match=prefer_exact_match, **kwargs))
+    try:
+        with use_cassette(cassette):
+            yield cassette
+    except BaseException:
+        # Interactions not reached by an interrupted incremental recording are still valid
+        cassette.keep_unused = True
+        raise
+    finally:
+        with timed('save'):
+            cassette._save()
+        if incremental:
+            loaded = len(cassette._old_interactions)
+            LOGGER.info('%s: %d interactions kept, %d recorded, %d refreshed', file_uri,
+                        len({position for position in cassette._used if position < loaded}),
+                        len(cassette.data) - loaded, cassette.refreshed)
+
+
+def _cache_key(persister, **kwargs):
+    """
+    :return: Hashable key of the cassette configuration, None if it holds functions.
+    """
+    config = []
+    for name, value in sorted(kwargs.items()):
+        if callable(value):
+            return None
+        config.append((name, tuple(value) if isinstance(value, list) else value))
+    return getattr(persister, 'cache_key', persister), tuple(config)
+
+
+def _before_record_response(response, redactor, filters):
     """
     Callback for processing response before recording to the file.
+    :param Redactor redactor: Redacts the response body.
+    :param dict filters: Response filters by content type.
     """
-    # Supported content-types
-    supported_content_types = {
-        'application/json': _filter_json
-    }
     # Read content-type
     headers = response.get('headers', {})
     content_type = headers.get('Content-Type') or headers.get('content-type')
@@ -117,19 +346,19 @@ def _before_record_response(response, **kwargs):
         LOGGER.warning('Could not get content-type from response headers')
         return response
     content_type = content_type[0].split(';')[0].lower().strip()
-    if content_type not in supported_content_types:
-        LOGGER.warning('Unsupported content-type "%s" for response update', content_type)
-        return response
-    # Replace content in response body, currently works only for JSON
-    body = response['body']['string']
-    update_function = supported_content_types[content_type]
+    # Replace content in response body
     try:
-        updated_body = update_function(body,
-                                       update_keys=kwargs.get('data_update_keys'),
-                                       skip_keys=kwargs.get('data_skip_keys'))
+        with timed('redaction'):
+            updated_body = filter_body(response['body']['string'], content_type, redactor, filters)
     except ValueError as err:
         raise ValueError('Failed to update response body') from err
+    if updated_body is None:
+        LOGGER.warning('Unsupported content-type "%s" for response update', content_type)
+        return response
     response['body']['string'] = updated_body
+    for header in ('Content-Length', 'content-length'):
+        if header in headers:
+            headers[header] = [str(len(updated_body))]
     return response
 
 
@@ -143,38 +372,7 @@ def _filter_json(data, update_keys=None, skip_keys=None):
     :type: string
     :raises ValueError: for invalid JSON.
     """
-    update_keys = set(update_keys) if update_keys else {}
-    skip_keys = set(skip_keys) if skip_keys else {}
-    if update_keys and skip_keys:
-        raise ValueError('Only one of (update_keys, skip_keys) can be used at a time')
-
-    def update_data(_data):
-        # Simple types
-        if _data is None:
-            return None
-        # Invert bool value
-        if isinstance(_data, bool):
-            return not _data
-        # Replace number with 0
-        if isinstance(_data, (int, float)):
-            return _data * 0
-        # Replace characters in string with 'X'
-        if isinstance(_data, str):
-            return ''.join([x if x in _PRESERVE_CHARS else 'X' for x in _data])
-        # Complex types
-        if isinstance(_data, list):
-            return [update_data(item) for item in _data]
-        if isinstance(_data, dict):
-            if skip_keys:
-                return {key: update_data(value) if isinstance(value, dict) or key not in skip_keys else value
-                        for key, value in _data.items()}
-            if update_keys:
-                return {key: update_data(value) if isinstance(value, dict) or key in update_keys else value
-                        for key, value in _data.items()}
-            # Update everything
-            return {key: update_data(value) for key, value in _data.items()}
-    json_data = json.loads(data)
-    return json.dumps(update_data(json_data))
+    return Redactor(update_keys=update_keys, skip_keys=skip_keys).redact_json(data)
 
 
 def _to_list_of_tuple(list_of_strings):
@@ -0,0 +1,397 @@
+"""
+Performance instrumentation of decorated tests.
+
+A test decorated with `instrument` collects a `TestReport` that the other decorators running within it fill in:
+    intercept_requests: requests per host and path, bytes sent and received, and the seconds spent matching requests,
+        loading and saving the cassette and redacting responses, and the faults injected in played responses.
+    write_stdout, assert_stdout_matches, assert_singer_output_matches: lines and bytes written, Singer messages per
+        type and records per stream, and records per second.
+Optionally the wrapped function is profiled with cProfile, and its memory allocations traced with tracemalloc.
+Reports are written as JSON per test, and aggregated in the report of the session (see `SessionReport`).
+
+Nothing is collected, and the decorators do not pay for instrumentation, outside of an instrumented test.
+"""
+import atexit
+import collections
+import contextlib
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+
+from integrations_testing_framework.context import ContextLocal
+
+# Leading type and stream of messages formatted by singer-python, parsed without decoding the whole message
+_SINGER_PREFIX = re.compile(r'\{"type":\s*"([A-Z_]+)"(?:,\s*"stream":\s*"((?:[^"\\]|\\.)*)")?')
+# Number of functions and allocation sites reported by the profile and memory trace
+_TOP = 20
+
+
+class HttpStats:
+    """
+    Requests intercepted by `intercept_requests`.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.recorded = 0
+        self.played = 0
+        # Requests by host and path
+        self.hosts = collections.defaultdict(collections.Counter)
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.match_seconds = 0.0
+        self.load_seconds = 0.0
+        self.save_seconds = 0.0
+        self.redaction_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add_request(self, request, response, recorded=False):
+        """
+        :param request: vcr request.
+        :param dict response: vcr response played or recorded.
+        :param bool recorded: True if the response comes from the actual server.
+        """
+        # Imported once requests are intercepted, vcr is not imported with the output decorators
+        from vcr.util import read_body
+        sent = read_body(request)
+        body = response.get('body')
+        received = body.get('string') if isinstance(body, dict) else None
+        with self._lock:
+            self.requests += 1
+            if recorded:
+                self.recorded += 1
+            else:
+                self.played += 1
+            self.hosts[request.host][request.path] += 1
+            self.bytes_sent += len(sent) if sent else 0
+            self.bytes_received += len(received) if received else 0
+
+    def add_seconds(self, name, seconds):
+        """
+        :param str name: 'match', 'load', 'save' or 'redaction'.
+        """
+        with self._lock:
+            setattr(self, f'{name}_seconds', getattr(self, f'{name}_seconds') + seconds)
+
+    def to_dict(self):
+        return {
+            'requests': self.requests,
+            'recorded': self.recorded,
+            'played': self.played,
+            'hosts': {host: {'requests': sum(paths.values()), 'paths': dict(paths)}
+                      for host, paths in sorted(self.hosts.items())},
+            'bytes_sent': self.bytes_sent,
+            'bytes_received': self.bytes_received,
+            'match_seconds': round(self.match_seconds, 6),
+            'load_seconds': round(self.load_seconds, 6),
+            'save_seconds': round(self.save_seconds, 6),
+            'redaction_seconds': round(self.redaction_seconds, 6),
+        }
+
+
+class OutputStats:
+    """
+    Lines written to stdout through the output decorators.
+    """
+
+    def __init__(self):
+        self.lines = 0
+        self.bytes = 0
+        self.messages = collections.Counter()
+        # Records by stream
+        self.streams = collections.Counter()
+        self._started = time.perf_counter()
+        self._finished = None
+
+    def add_line(self, line):
+        """
+        Count a line written to stdout, called by sinks holding their lock.
+        """
+        self.lines += 1
+        self.bytes += len(line.encode('utf-8'))
+        match = _SINGER_PREFIX.match(line)
+        if match is not None:
+            message_type, stream = match.group(1), match.group(2)
+            if stream is not None and '\\' in stream:
+                stream = json.loads(f'"{stream}"')
+        elif line.startswith('{'):
+            try:
+                message = json.loads(line)
+            except ValueError:
+                return
+            if not isinstance(message, dict) or not isinstance(message.get('type'), str):
+                return
+            message_type, stream = message['type'], message.get('stream')
+        else:
+            return
+        self.messages[message_type] += 1
+        if message_type == 'RECORD':
+            self.streams[stream] += 1
+
+    def finish(self):
+        self._finished = time.perf_counter()
+
+    def to_dict(self):
+        seconds = (self._finished or time.perf_counter()) - self._started
+        records = sum(self.streams.values())
+        return {
+            'lines': self.lines,
+            'bytes': self.bytes,
+            'messages': dict(self.messages),
+            'records': records,
+            'streams': dict(self.streams),
+            'seconds': round(seconds, 6),
+            'records_per_second': round(records / seconds, 1) if seconds > 0 else None,
+        }
+
+
+class TestReport:
+    """
+    Instrumentation of a test.
+    """
+    __test__ = False
+
+    def __init__(self, name):
+        """
+        :param str name: Name of the test.
+        """
+        self.name = name
+        self.http = HttpStats()
+        self.output = None
+        self.wall_seconds = None
+        self.error = None
+        self.profile = None
+        self.memory = None
+        #: `FaultReport` of the playback, when faults are injected
+        self.faults = None
+
+    def output_stats(self):
+        """
+        :return: Statistics of the output of the test, shared by the output decorators of the test.
+        :type: OutputStats
+        """
+        if self.output is None:
+            self.output = OutputStats()
+        return self.output
+
+    def to_dict(self):
+        report = {
+            'test': self.name,
+            'wall_seconds': round(self.wall_seconds, 6) if self.wall_seconds is not None else None,
+            'error': self.error,
+            'http': self.http.to_dict(),
+            'output': self.output.to_dict() if self.output is not None else None,
+        }
+        if self.faults is not None:
+            report['faults'] = self.faults.to_dict()
+        if self.profile is not None:
+            report['profile'] = self.profile
+        if self.memory is not None:
+            report['memory'] = self.memory
+        return report
+
+
+class SessionReport:
+    """
+    Aggregate of the reports of the tests run by the process, written to the report directories of the tests
+    (`session.json`) when the process exits.
+    """
+
+    def __init__(self):
+        self.reports = []
+        self.report_dirs = set()
+        self._lock = threading.Lock()
+
+    def add(self, report, report_dir=None):
+        """
+        :param TestReport report: Report of a test.
+        :param str report_dir: Directory the session report is written to, if any.
+        """
+        with self._lock:
+            self.reports.append(report.to_dict())
+            if report_dir is not None:
+                self.report_dirs.add(str(report_dir))
+
+    def to_dict(self):
+        with self._lock:
+            reports = list(self.reports)
+        output = _sum(report['output'] for report in reports if report['output'])
+        if output:
+            # Rates are not summed, the rate of the session is computed from its totals
+            seconds = output.get('seconds', 0)
+            output['records_per_second'] = round(output.get('records', 0) / seconds, 1) if seconds > 0 else None
+        return {
+            'tests': len(reports),
+            'failed': sum(1 for report in reports if report['error']),
+            'wall_seconds': round(sum(report['wall_seconds'] or 0 for report in reports), 6),
+            'http': _sum(report['http'] for report in reports),
+            'output': output,
+            'slowest': [{'test': report['test'], 'wall_seconds': report['wall_seconds']}
+                        for report in sorted(reports, key=lambda report: -(report['wall_seconds'] or 0))[:10]],
+        }
+
+    def write(self, path):
+        """
+        Write the aggregated report as JSON, replacing the file atomically.
+        """
+        _write_json(path, self.to_dict())
+
+    def write_all(self):
+        """
+        Write the aggregated report to the report directory of every test, called when the process exits.
+        """
+        with self._lock:
+            report_dirs = sorted(self.report_dirs)
+        for report_dir in report_dirs:
+            self.write(Path(report_dir) / 'session.json')
+
+    def clear(self):
+        with self._lock:
+            self.reports.clear()
+            self.report_dirs.clear()
+
+
+def _sum(dicts):
+    """
+    Sum of dictionaries of numbers, nested dictionaries being summed key by key. Rates (`*_per_second`) are skipped.
+    """
+    total = {}
+    for values in dicts:
+        for key, value in values.items():
+            if isinstance(value, dict):
+                total[key] = _sum([total.get(key, {}), value])
+            elif isinstance(value, (int, float)) and not isinstance(value, bool) and not key.endswith('_per_second'):
+                total[key] = round(total.get(key, 0) + value, 6)
+    return total
+
+
+def _write_json(path, value):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w') as file:
+        json.dump(value, file, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+# Reports of the tests instrumented by the process
+SESSION_REPORT = SessionReport()
+atexit.register(SESSION_REPORT.write_all)
+
+_REPORT = ContextLocal('instrumentation_report')
+
+
+def current_report():
+    """
+    :return: Report of the instrumented test running in the current context, None outside of instrumented tests.
+    :type: TestReport
+    """
+    return _REPORT.get()
+
+
+@contextlib.contextmanager
+def timed(name):
+    """
+    Add the seconds spent in the block to the HTTP statistics of the current test, if instrumented.
+    :param str name: 'match', 'load', 'save' or 'redaction'.
+    """
+    report = _REPORT.get()
+    if report is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        report.http.add_seconds(name, time.perf_counter() - start)
+
+
+def _reset_peak():
+    """
+    Reset the peak of the traced memory, restarting tracing on Python < 3.9.
+    """
+    if hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+    else:
+        tracemalloc.stop()
+        tracemalloc.start()
+
+
+@contextlib.contextmanager
+def instrumenting(name, report_dir=None, profile=False, trace_memory=False):
+    """
+    Collect the report of a test running in the block.
+    :param str name: Name of the test, and of its report file.
+    :param str report_dir: Directory the report of the test (`<name>.json`), its profile (`<name>.prof`) and, when the
+    process exits, the session report (`session.json`) are written to, None to only add the report to `SESSION_REPORT`.
+    :param bool profile: True to profile the test with cProfile.
+    :param bool trace_memory: True to trace the memory allocations of the test with tracemalloc.
+    """
+    report = TestReport(name)
+    profiler = cProfile.Profile() if profile else None
+    started_tracing = trace_memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    elif trace_memory:
+        _reset_peak()
+    if trace_memory:
+        memory_start = tracemalloc.take_snapshot()
+    start = time.perf_counter()
+    try:
+        with _REPORT.use(report):
+            if profiler is not None:
+                profiler.enable()
+            try:
+                yield report
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+    except BaseException as err:
+        report.error = repr(err)
+        raise
+    finally:
+        report.wall_seconds = time.perf_counter() - start
+        if report.output is not None:
+            report.output.finish()
+        if trace_memory:
+            report.memory = _memory_report(memory_start)
+            if started_tracing:
+                tracemalloc.stop()
+        if profiler is not None:
+            report.profile = _profile_report(profiler)
+        SESSION_REPORT.add(report, report_dir)
+        if report_dir is not None:
+            _write_json(Path(report_dir) / f'{name}.json', report.to_dict())
+            if profiler is not None:
+                profiler.dump_stats(str(Path(report_dir) / f'{name}.prof'))
+
+
+def _profile_report(profiler):
+    """
+    :return: Functions taking the most cumulative time.
+    """
+    stats = pstats.Stats(profiler, stream=io.StringIO())
+    functions = sorted(stats.stats.items(), key=lambda item: -item[1][3])[:_TOP]
+    return [{'function': f'{path}:{line}({function})', 'calls': calls, 'total_seconds': round(total, 6),
+             'cumulative_seconds': round(cumulative, 6)}
+            for (path, line, function), (_, calls, total, cumulative, _) in functions]
+
+
+def _memory_report(start):
+    """
+    :return: Peak traced memory and the allocation sites that grew the most since the start snapshot.
+    """
+    _, peak = tracemalloc.get_traced_memory()
+    differences = tracemalloc.take_snapshot().compare_to(start, 'lineno')[:_TOP]
+    return {
+        'peak_bytes': peak,
+        'allocations': [{'location': str(difference.traceback), 'size_bytes': difference.size_diff,
+                         'count': difference.count_diff} for difference in differences],
+    }
@@ -0,0 +1,408 @@
+"""
+Programmatic mocking of HTTP requests.
+
+A `MockServer` answers intercepted requests with the handler of the first route matching their method and URL, without
+any recorded file. Handlers are functions of the request returning the response, or generator functions producing
+the responses of successive requests lazily, e.g. the pages of a paginated endpoint:
+
+    server = MockServer()
+
+    @server.get('/v1/items')
+    def items(request):
+        for page in range(1, 1001):
+            request = yield {'data': [{'id': page}], 'next_page': page + 1 if page < 1000 else None}
+
+    @server.get('https://api.example.com/v1/items/{item_id}')
+    def item(request):
+        return {'id': request.params['item_id']}
+
+    with server:
+        tap.main()
+
+Routes are compiled into a trie of path segments, so that dispatch does not slow down with the number of routes.
+"""
+import contextvars
+import http
+import json
+import re
+import threading
+from inspect import isgeneratorfunction
+from urllib.parse import urlsplit
+
+from vcr.errors import UnhandledHTTPRequestError
+from vcr.record_mode import RecordMode
+from vcr.util import read_body
+
+from integrations_testing_framework.cassettes.routing import use_cassette
+
+_ANY_METHOD = '*'
+# Path parameter, matching a path segment, or the rest of the path with the 'path' converter
+_PARAMETER = re.compile(r'\{(\w+)(?::(path))?\}')
+_CONVERTERS = {None: '[^/]+', 'path': '.+'}
+# Kinds of path segments of route patterns
+_LITERAL, _SEGMENT, _REST, _PATTERN = 'literal', 'segment', 'rest', 'pattern'
+_DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+class MockResponse:
+    """
+    Response returned by a route handler. Handlers can also return a dict or a list (JSON), str (text), bytes or None
+    (204 No Content).
+    """
+
+    def __init__(self, body=b'', status=200, headers=None, content_type=None):
+        """
+        :param body: Response body, JSON encoded unless str or bytes.
+        :param int status: Status code.
+        :param dict headers: Response headers, values can be lists of values.
+        :param str content_type: Content type, guessed from the body by default.
+        """
+        if isinstance(body, str):
+            body, default_type = body.encode('utf-8'), 'text/plain; charset=utf-8'
+        elif isinstance(body, (bytes, bytearray)):
+            body, default_type = bytes(body), 'application/octet-stream'
+        else:
+            body, default_type = json.dumps(body).encode('utf-8'), 'application/json'
+        self.body = body
+        self.status = status
+        self.headers = {name: value if isinstance(value, list) else [str(value)]
+                        for name, value in (headers or {}).items()}
+        if not any(name.lower() == 'content-type' for name in self.headers):
+            self.headers['Content-Type'] = [content_type or default_type]
+
+    def to_vcr(self):
+        """
+        :return: The response as recorded by vcr.
+        """
+        try:
+            message = http.HTTPStatus(self.status).phrase
+        except ValueError:
+            message = ''
+        headers = {**self.headers, 'Content-Length': [str(len(self.body))]}
+        return {'status': {'code': self.status, 'message': message}, 'headers': headers, 'body': {'string': self.body}}
+
+
+def _to_response(value):
+    if isinstance(value, MockResponse):
+        return value
+    if value is None:
+        return MockResponse(status=204)
+    return MockResponse(value)
+
+
+class MockRequest:
+    """
+    Request passed to route handlers.
+    """
+
+    def __init__(self, request, params):
+        self._request = request
+        #: Values of the path parameters of the route
+        self.params = params
+
+    method = property(lambda self: self._request.method)
+    url = property(lambda self: self._request.uri)
+    scheme = property(lambda self: self._request.scheme)
+    host = property(lambda self: self._request.host)
+    port = property(lambda self: self._request.port)
+    path = property(lambda self: self._request.path)
+    headers = property(lambda self: self._request.headers)
+
+    @property
+    def query(self):
+        """
+        :return: Query parameters, the last value of parameters given several times.
+        :type: dict
+        """
+        return dict(self._request.query)
+
+    @property
+    def body(self):
+        """
+        :type: bytes
+        """
+        body = read_body(self._request)
+        return body.encode('utf-8') if isinstance(body, str) else body or b''
+
+    def json(self):
+        return json.loads(self.body)
+
+
+class Route:
+    """
+    Handler of the requests matching a method and URL pattern.
+    """
+
+    def __init__(self, order, method, pattern, handler):
+        self.order = order
+        self.method = method
+        self.pattern = pattern
+        self.handler = handler
+        #: Number of requests handled
+        self.calls = 0
+        # Routes of exhausted generators do not match anymore
+        self.active = True
+        self._lock = threading.Lock()
+        self._generator = None
+        url = urlsplit(pattern)
+        self.origin = _origin(url.scheme, url.hostname, url.port) if url.netloc else None
+        self.segments = []
+        self.params = []
+        for segment in (url.path or '/').split('/'):
+            match = _PARAMETER.fullmatch(segment)
+            if match is None and _PARAMETER.search(segment) is None:
+                self.segments.append((_LITERAL, segment))
+            elif match is not None and match.group(2) is None:
+                self.segments.append((_SEGMENT, None))
+                self.params.append(match.group(1))
+            elif match is not None:
+                self.segments.append((_REST, None))
+                self.params.append(match.group(1))
+            else:
+                # Parameters within a segment
+                regex, position = [], 0
+                for param in _PARAMETER.finditer(segment):
+                    regex.append(re.escape(segment[position:param.start()]))
+                    regex.append(f'({_CONVERTERS[param.group(2)]})')
+                    self.params.append(param.group(1))
+                    position = param.end()
+                regex.append(re.escape(segment[position:]))
+                self.segments.append((_PATTERN, ''.join(regex)))
+        if any(kind == _REST for kind, _ in self.segments[:-1]):
+            raise ValueError(f'Path parameters matching the rest of the path must end the pattern "{pattern}"')
+
+    def accepts(self, method, origin):
+        return (self.method == _ANY_METHOD or self.method == method) and self.origin in (None, origin)
+
+    def respond(self, request):
+        """
+        :return: The vcr response to the request, None if the generator of the route is exhausted.
+        """
+        if not isgeneratorfunction(self.handler):
+            response = self.handler(request)
+            with self._lock:
+                self.calls += 1
+            return _to_response(response).to_vcr()
+        # Generators cannot run in several threads at once
+        with self._lock:
+            if not self.active:
+                return None
+            try:
+                if self._generator is None:
+                    self._generator = self.handler(request)
+                    response = next(self._generator)
+                else:
+                    response = self._generator.send(request)
+            except StopIteration:
+                self.active = False
+                return None
+            self.calls += 1
+        return _to_response(response).to_vcr()
+
+
+def _origin(scheme, host, port):
+    return f'{scheme}://{host}:{port or _DEFAULT_PORTS.get(scheme)}'
+
+
+class _Node:
+    """
+    Node of the routes trie, for a path segment.
+    """
+    __slots__ = ('literals', 'segment', 'patterns', 'rest', 'routes')
+
+    def __init__(self):
+        self.literals = {}
+        self.segment = None
+        self.patterns = {}
+        # Routes whose pattern ends at the node, or continues with the rest of the path
+        self.rest = []
+        self.routes = []
+
+    def child(self, kind, value):
+        if kind == _LITERAL:
+            return self.literals.setdefault(value, _Node())
+        if kind == _SEGMENT:
+            self.segment = self.segment or _Node()
+            return self.segment
+        if value not in self.patterns:
+            self.patterns[value] = (re.compile(value), _Node())
+        return self.patterns[value][1]
+
+
+class _Router:
+    """
+    Routes compiled into a trie of path segments, so that requests are matched in time proportional to the number of
+    segments of their path rather than to the number of routes.
+    """
+
+    def __init__(self, routes):
+        self._root = _Node()
+        for route in routes:
+            if not route.active:
+                continue
+            node = self._root
+            for kind, value in route.segments:
+                if kind == _REST:
+                    node.rest.append(route)
+                    break
+                node = node.child(kind, value)
+            else:
+                node.routes.append(route)
+
+    def match(self, request):
+        """
+        :return: (route, path parameters) of the first route matching the request, None if no route matches.
+        """
+        best = None
+        origin = _origin(request.scheme, request.host, request.port)
+        segments = request.path.split('/')
+        # Depth first walk of the trie, with the values of the parameters met
+        stack = [(self._root, 0, ())]
+        while stack:
+            node, position, values = stack.pop()
+            candidates = [(route, values) for route in node.routes] if position == len(segments) else []
+            if node.rest and position < len(segments) and '/'.join(segments[position:]):
+                rest = values + ('/'.join(segments[position:]),)
+                candidates.extend((route, rest) for route in node.rest)
+            for route, route_values in candidates:
+                if (best is None or route.order < best[0].order) and route.accepts(request.method, origin):
+                    best = (route, route_values)
+            if position == len(segments):
+                continue
+            segment = segments[position]
+            if segment in node.literals:
+                stack.append((node.literals[segment], position + 1, values))
+            if node.segment is not None and segment:
+                stack.append((node.segment, position + 1, values + (segment,)))
+            for regex, child in node.patterns.values():
+                match = regex.fullmatch(segment)
+                if match is not None:
+                    stack.append((child, position + 1, values + match.groups()))
+        if best is None:
+            return None
+        route, values = best
+        return route, dict(zip(route.params, values))
+
+
+class MockServer:
+    """
+    Answers intercepted requests with the handlers of its routes. Used as context manager, or through the
+    `mock_requests` decorator, it intercepts the requests of the current context as `intercept_requests` does.
+
+    Routes are matched in registration order. Patterns are paths, matching requests to any host, or URLs with scheme
+    and host, holding path parameters: '{name}' matches a path segment and '{name:path}' the rest of the path.
+    """
+    record_mode = RecordMode.NONE
+    allow_playback_repeats = True
+
+    def __init__(self, passthrough=False):
+        """
+        :param bool passthrough: True: requests not matching any route are sent to the actual server, False: they
+        fail.
+        """
+        self.routes = []
+        self.passthrough = passthrough
+        self._router = None
+        self._lock = threading.Lock()
+        self._path = f'<MockServer {id(self):#x}>'
+        # Contexts entered through the server in the current context
+        self._contexts = contextvars.ContextVar(f'mock_server_{id(self)}', default=())
+
+    def route(self, method, pattern, response=None):
+        """
+        Register a route, as decorator of the handler unless a response is supplied.
+        :param str method: HTTP method, '*' for any method.
+        :param str pattern: Path or URL pattern.
+        :param response: Handler of the route (see `add_route`), or response returned to every matching request (see
+        `MockResponse`).
+        :return: The route if response is supplied, a decorator registering the handler otherwise.
+        """
+        if callable(response):
+            return self.add_route(method, pattern, response)
+        if response is not None:
+            return self.add_route(method, pattern, lambda request: response)
+
+        def decorator(handler):
+            self.add_route(method, pattern, handler)
+            return handler
+
+        return decorator
+
+    def get(self, pattern, response=None):
+        return self.route('GET', pattern, response)
+
+    def post(self, pattern, response=None):
+        return self.route('POST', pattern, response)
+
+    def put(self, pattern, response=None):
+        return self.route('PUT', pattern, response)
+
+    def patch(self, pattern, response=None):
+        return self.route('PATCH', pattern, response)
+
+    def delete(self, pattern, response=None):
+        return self.route('DELETE', pattern, response)
+
+    def add_route(self, method, pattern, handler):
+        """
+        :param str method: HTTP method, '*' for any method.
+        :param str pattern: Path or URL pattern.
+        :param handler: Function of a `MockRequest` returning the response, or generator function receiving the first
+        request and yielding the responses, receiving every following request from `yield`.
+        :return: The registered route.
+        :type: Route
+        """
+        with self._lock:
+            route = Route(len(self.routes), method.upper(), pattern, handler)
+            self.routes.append(route)
+            self._router = None
+        return route
+
+    def _match(self, request):
+        router = self._router
+        if router is None:
+            with self._lock:
+                router = self._router = _Router(self.routes)
+        return router.match(request)
+
+    # Cassette interface used by the vcr patches
+
+    @property
+    def write_protected(self):
+        return not self.passthrough
+
+    def can_play_response_for(self, request):
+        return self._match(request) is not None
+
+    def play_response(self, request):
+        while True:
+            match = self._match(request)
+            if match is None:
+                raise UnhandledHTTPRequestError(f'No route of {self._path} matches the request ({request!r})')
+            route, params = match
+            response = route.respond(MockRequest(request, params))
+            if response is not None:
+                return response
+            # The generator of the route is exhausted
+            with self._lock:
+                self._router = None
+
+    def filter_request(self, request):
+        return request
+
+    def append(self, request, response):
+        pass
+
+    def find_requests_with_most_matches(self, request):
+        return []
+
+    def __enter__(self):
+        context = use_cassette(self)
+        context.__enter__()
+        self._contexts.set(self._contexts.get() + (context,))
+        return self
+
+    def __exit__(self, *exc_info):
+        *contexts, context = self._contexts.get()
+        self._contexts.set(tuple(contexts))
+        return context.__exit__(*exc_info)
@@ -0,0 +1,362 @@
+"""
+Redaction of recorded JSON response bodies.
+
+Values are replaced with dummy data of the same shape: strings keep only the characters in PRESERVE_CHARS and have
+every other character replaced with 'X', numbers become 0, booleans are inverted and None is kept.
+
+Keys are either plain keys, matching a key at any depth, or dotted paths from the root of the body, where '*' matches
+any key or array index, e.g. 'data.*.email'. Values of keys holding objects are always descended into, so that the
+rules apply to their own keys.
+"""
+import json
+import re
+
+# Preserve characters during string update
+PRESERVE_CHARS = frozenset(r'!@#$%^&*_-+=()[]{}\/<>,.?')
+# Bodies from this size on are redacted one top level member at a time
+STREAMING_THRESHOLD = 1 << 20
+
+_PLACEHOLDER = 'X'
+_WILDCARD = '*'
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_DECODER = json.JSONDecoder()
+
+# What is redacted in objects
+_ALL, _UPDATE, _SKIP = 'all', 'update', 'skip'
+# What is done with a value
+_REDACT, _PARTIAL, _KEEP = 'redact', 'partial', 'keep'
+
+
+class _RedactionTable(dict):
+    """
+    `str.translate` table keeping the preserved characters. Entries replacing other characters are added as characters
+    are met, as the table cannot hold every unicode character upfront.
+    """
+
+    def __missing__(self, char):
+        self[char] = _PLACEHOLDER
+        return _PLACEHOLDER
+
+
+_TABLE = _RedactionTable({ord(char): char for char in PRESERVE_CHARS})
+
+
+def redact_string(value):
+    """
+    :return: The string with every character outside of PRESERVE_CHARS replaced with 'X'.
+    """
+    return value.translate(_TABLE)
+
+
+class _PathState:
+    """
+    Position in the path rules of a value: the nodes of the rules trie reached by the keys leading to the value.
+    Transitions are cached, so that walking values at the same paths of an array costs one dict lookup per key.
+    """
+    __slots__ = ('nodes', 'matched', '_steps', '_index_step')
+
+    def __init__(self, nodes):
+        self.nodes = nodes
+        self.matched = any(None in node for node in nodes)
+        self._steps = {}
+        self._index_step = None
+
+    def step(self, key):
+        """
+        :return: The state of the value at the key, None if no rule can match it or its descendants.
+        """
+        try:
+            return self._steps[key]
+        except KeyError:
+            pass
+        nodes = [child for node in self.nodes for child in (node.get(key), node.get(_WILDCARD)) if child]
+        state = _PathState(nodes) if nodes else None
+        self._steps[key] = state
+        return state
+
+    def step_index(self, index):
+        """
+        :return: The state of the array item at the index.
+        """
+        if self._index_step is None:
+            # Array items of the same array share their state unless a rule names an index
+            named = any(segment.isdigit() for node in self.nodes for segment in node if segment)
+            self._index_step = () if named else (self.step(_WILDCARD),)
+        if not self._index_step:
+            return self.step(str(index))
+        return self._index_step[0]
+
+
+def _compile_plain(mode, keys):
+    """
+    :return: A function redacting a value with plain keys only, dispatching on exact types as values decoded from JSON
+    are never subclasses, and redacting strings in objects and arrays without a call per string.
+    """
+    table = _TABLE
+
+    def redact(value):
+        cls = type(value)
+        if cls is str:
+            return value.translate(table)
+        if cls is dict:
+            return redact_object(value)
+        if cls is list:
+            return [item.translate(table) if type(item) is str else redact(item) for item in value]
+        # Invert bool value
+        if cls is bool:
+            return not value
+        # Replace number with 0
+        if cls is int or cls is float:
+            return value * 0
+        return redact_other(value)
+
+    if mode == _UPDATE:
+        def redact_object(value):
+            return {key: (item.translate(table) if type(item) is str else redact(item))
+                    if key in keys or type(item) is dict else item
+                    for key, item in value.items()}
+    elif mode == _SKIP:
+        def redact_object(value):
+            return {key: (item.translate(table) if type(item) is str else redact(item))
+                    if key not in keys or type(item) is dict else item
+                    for key, item in value.items()}
+    else:
+        def redact_object(value):
+            return {key: item.translate(table) if type(item) is str else redact(item) for key, item in value.items()}
+
+    def redact_other(value):
+        # Subclasses of the JSON types
+        if isinstance(value, str):
+            return value.translate(table)
+        if isinstance(value, dict):
+            return redact_object(value)
+        if isinstance(value, list):
+            return [redact(item) for item in value]
+        if isinstance(value, bool):
+            return not value
+        if isinstance(value, (int, float)):
+            return value * 0
+        return None
+
+    return redact
+
+
+class Redactor:
+    """
+    Redacts JSON values, compiled once for the keys to update or to skip.
+    """
+
+    def __init__(self, update_keys=None, skip_keys=None):
+        """
+        :param list update_keys: Keys that should be updated, rest would be not be altered.
+        :param list skip_keys: Keys that should not be altered, rest would be updated.
+        :raises ValueError: if both update_keys and skip_keys are supplied.
+        """
+        if update_keys and skip_keys:
+            raise ValueError('Only one of (update_keys, skip_keys) can be used at a time')
+        self._mode = _UPDATE if update_keys else _SKIP if skip_keys else _ALL
+        self._keys = frozenset(update_keys or skip_keys or ())
+        # Dotted keys are kept as plain keys as well, as keys can contain dots
+        trie = {}
+        for key in self._keys:
+            if '.' not in key:
+                continue
+            node = trie
+            for segment in key.split('.'):
+                node = node.setdefault(segment, {})
+            node[None] = True
+        self._root = _PathState([trie]) if trie else None
+        self._redact_plain = _compile_plain(self._mode, self._keys)
+
+    def redacts_key(self, *path):
+        """
+        :param path: Keys leading to a scalar value, e.g. the column of a CSV cell.
+        :return: Whether the value at the path is redacted.
+        :type: bool
+        """
+        state = self._root
+        for key in path:
+            state = state.step(key) if state is not None else None
+        matched = path[-1] in self._keys or (state is not None and state.matched)
+        return self._mode == _ALL or matched is (self._mode == _UPDATE)
+
+    def redact(self, value):
+        """
+        :param value: Value decoded from JSON.
+        :return: A redacted copy of the value.
+        """
+        return self._redact(value, self._root)
+
+    def redact_json(self, data):
+        """
+        :param data: JSON document, as str or bytes.
+        :return: The redacted document, serialized as `json.dumps` does.
+        :type: str
+        :raises ValueError: for invalid JSON.
+        """
+        if isinstance(data, (bytes, bytearray)):
+            data = data.decode(json.detect_encoding(data))
+        if len(data) >= STREAMING_THRESHOLD:
+            try:
+                return ''.join(self._redact_stream(data))
+            except _DuplicateKey:
+                pass
+        return json.dumps(self.redact(json.loads(data)))
+
+    def _action(self, value, state, matched, inherited=False):
+        """
+        :param state: Path state of the value.
+        :param bool matched: Whether the key of the value or its path is one of the keys.
+        :param bool inherited: Whether the value is an item of an array that is redacted.
+        :return: _REDACT to redact the value, _PARTIAL to redact only the items of an array matched by a path, or
+        _KEEP to keep the value.
+        """
+        if self._mode == _ALL or isinstance(value, dict):
+            return _REDACT
+        if self._mode == _SKIP:
+            return _KEEP if matched else _REDACT
+        if matched or inherited:
+            return _REDACT
+        # Arrays under keys that are not updated are kept, unless a path leads through them
+        return _PARTIAL if state is not None and isinstance(value, list) else _KEEP
+
+    def _member(self, value, state, matched, inherited=False):
+        """
+        :return: The redacted value of an object member or array item.
+        """
+        action = self._action(value, state, matched, inherited)
+        if action is _REDACT:
+            return self._redact(value, state)
+        if action is _PARTIAL:
+            return [self._item(item, state, index, False) for index, item in enumerate(value)]
+        return value
+
+    def _item(self, item, state, index, inherited):
+        item_state = state.step_index(index) if state is not None else None
+        return self._member(item, item_state, item_state is not None and item_state.matched, inherited)
+
+    def _redact(self, value, state):
+        if state is None:
+            return self._redact_plain(value)
+        if isinstance(value, dict):
+            redacted = {}
+            for key, item in value.items():
+                item_state = state.step(key)
+                matched = key in self._keys or (item_state is not None and item_state.matched)
+                redacted[key] = self._member(item, item_state, matched)
+            return redacted
+        if isinstance(value, list):
+            return [self._item(item, state, index, True) for index, item in enumerate(value)]
+        return self._redact_plain(value)
+
+    def _redact_array(self, scanner, state, action):
+        """
+        Yields the serialized items of the array at the scanner position, decoding one item at a time.
+        """
+        yield '['
+        for index, item in enumerate(scanner.array_items()):
+            if index:
+                yield ', '
+            if action is not _KEEP:
+                item = self._item(item, state, index, action is _REDACT)
+            yield json.dumps(item)
+        yield ']'
+
+    def _redact_stream(self, text):
+        """
+        Yields the redacted document in parts, without decoding the top level array or the arrays of the top level
+        object at once.
+        :raises _DuplicateKey: if the top level object has duplicate keys, which JSON decoding collapses.
+        """
+        scanner = _Scanner(text)
+        char = scanner.skip()
+        if char == '[':
+            yield from self._redact_array(scanner, self._root, _REDACT)
+        elif char == '{':
+            seen = set()
+            yield '{'
+            for key in scanner.object_keys():
+                if key in seen:
+                    raise _DuplicateKey(key)
+                if seen:
+                    yield ', '
+                seen.add(key)
+                yield f'{json.dumps(key)}: '
+                state = self._root.step(key) if self._root is not None else None
+                matched = key in self._keys or (state is not None and state.matched)
+                if scanner.skip() == '[':
+                    yield from self._redact_array(scanner, state, self._action([], state, matched))
+                else:
+                    yield json.dumps(self._member(scanner.value(), state, matched))
+            yield '}'
+        else:
+            yield json.dumps(self.redact(scanner.value()))
+        scanner.end()
+
+
+class _DuplicateKey(Exception):
+    pass
+
+
+class _Scanner:
+    """
+    Reads a JSON document one value at a time.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.index = 0
+
+    def skip(self):
+        """
+        :return: The next character after whitespace, '' at the end of the document.
+        """
+        self.index = _WHITESPACE.match(self.text, self.index).end()
+        return self.text[self.index:self.index + 1]
+
+    def value(self):
+        self.skip()
+        value, self.index = _DECODER.raw_decode(self.text, self.index)
+        return value
+
+    def _expect(self, chars, message):
+        char = self.skip()
+        if not char or char not in chars:
+            raise json.JSONDecodeError(message, self.text, self.index)
+        self.index += 1
+        return char
+
+    def array_items(self):
+        """
+        Yields the items of the array at the current position.
+        """
+        self._expect('[', 'Expecting value')
+        if self.skip() == ']':
+            self.index += 1
+            return
+        while True:
+            yield self.value()
+            if self._expect(',]', "Expecting ',' delimiter") == ']':
+                return
+
+    def object_keys(self):
+        """
+        Yields the keys of the object at the current position, the value of each key is read by the caller before the
+        next key is read.
+        """
+        self._expect('{', 'Expecting value')
+        if self.skip() == '}':
+            self.index += 1
+            return
+        while True:
+            if self.skip() != '"':
+                raise json.JSONDecodeError('Expecting property name enclosed in double quotes', self.text, self.index)
+            key = self.value()
+            self._expect(':', "Expecting ':' delimiter")
+            yield key
+            if self._expect(',}', "Expecting ',' delimiter") == '}':
+                return
+
+    def end(self):
+        if self.skip():
+            raise json.JSONDecodeError('Extra data', self.text, self.index)
@@ -0,0 +1,226 @@
+"""
+Filters redacting recorded response bodies, registered by content type.
+
+A filter is a function `filter(source, target, redactor)` reading the body from the binary file `source` and writing the
+redacted body to the binary file `target`, redacting values with the `Redactor` built for the decorator. Filters read
+their source incrementally, so that memory used besides the body itself stays bounded for line based formats.
+
+Gzip compressed bodies are decompressed and compressed again around the filter of their content, which is guessed
+from the body for 'application/gzip' responses.
+"""
+import csv
+import gzip
+import io
+import json
+import xml.sax
+from xml.sax.saxutils import XMLGenerator
+
+from integrations_testing_framework.redaction import redact_string
+
+_GZIP_MAGIC = b'\x1f\x8b'
+_GZIP_CONTENT_TYPES = {'application/gzip', 'application/x-gzip'}
+_ENCODING = 'utf-8'
+# Delimiters recognized in CSV bodies
+_CSV_DELIMITERS = ',;\t|'
+
+
+def filter_json(source, target, redactor):
+    """
+    Redacts a JSON document, decoding large documents one item of their top level arrays at a time.
+    """
+    target.write(redactor.redact_json(source.read()).encode(_ENCODING))
+
+
+def filter_ndjson(source, target, redactor):
+    """
+    Redacts newline delimited JSON one line at a time, keeping blank lines and line separators.
+    """
+    for line in source:
+        content = line.rstrip(b'\r\n')
+        if content.strip():
+            target.write(redactor.redact_json(content).encode(_ENCODING))
+        else:
+            target.write(content)
+        target.write(line[len(content):])
+
+
+def filter_csv(source, target, redactor):
+    """
+    Redacts CSV one row at a time. The first row names the columns, which are redacted as keys of the redactor.
+    Cells past the named columns are redacted as unnamed columns.
+    """
+    text = io.TextIOWrapper(source, encoding=_ENCODING, newline='')
+    output = io.TextIOWrapper(target, encoding=_ENCODING, newline='')
+    try:
+        header = text.readline()
+        if not header:
+            return
+        try:
+            dialect = csv.Sniffer().sniff(header, delimiters=_CSV_DELIMITERS)
+        except csv.Error:
+            dialect = csv.excel
+        line_separator = '\r\n' if header.endswith('\r\n') else '\n'
+        columns = next(csv.reader([header], dialect))
+        redacted = [redactor.redacts_key(column) for column in columns]
+        unnamed = redactor.redacts_key('')
+        writer = csv.writer(output, dialect, lineterminator=line_separator)
+        writer.writerow(columns)
+        for row in csv.reader(text, dialect):
+            writer.writerow([redact_string(cell) if (redacted[i] if i < len(redacted) else unnamed) else cell
+                             for i, cell in enumerate(row)])
+    except csv.Error as err:
+        raise ValueError('Invalid CSV body') from err
+    finally:
+        # Leave the files open for the caller
+        output.flush()
+        output.detach()
+        text.detach()
+
+
+class _XmlRedactor(XMLGenerator):
+    """
+    Writes the parsed document back, redacting the text of elements and the values of attributes by their path of
+    element names below the root element, attributes being keys of their element.
+    """
+
+    def __init__(self, output, redactor):
+        super().__init__(output, encoding=_ENCODING, short_empty_elements=True)
+        self._redactor = redactor
+        self._path = []
+        self._redacted = []
+        self._decisions = {}
+
+    def _redacts(self, path):
+        try:
+            return self._decisions[path]
+        except KeyError:
+            decision = self._decisions[path] = self._redactor.redacts_key(*path)
+            return decision
+
+    def startElement(self, name, attrs):
+        # The root element stands for the body
+        path = tuple(self._path[1:]) + (name,) if self._path else ()
+        self._path.append(name)
+        self._redacted.append(bool(path) and self._redacts(path))
+        if attrs:
+            attrs = {key: redact_string(value) if self._redacts(path + (key,)) else value
+                     for key, value in attrs.items()}
+        super().startElement(name, attrs)
+
+    def endElement(self, name):
+        self._path.pop()
+        self._redacted.pop()
+        super().endElement(name)
+
+    def characters(self, content):
+        if self._redacted and self._redacted[-1] and not content.isspace():
+            content = redact_string(content)
+        super().characters(content)
+
+
+def filter_xml(source, target, redactor):
+    """
+    Redacts XML one parsing event at a time. Comments and processing instructions are not kept.
+    """
+    output = io.TextIOWrapper(target, encoding=_ENCODING, write_through=True)
+    try:
+        parser = xml.sax.make_parser()
+        parser.setContentHandler(_XmlRedactor(output, redactor))
+        parser.parse(source)
+    except xml.sax.SAXException as err:
+        raise ValueError('Invalid XML body') from err
+    finally:
+        output.flush()
+        output.detach()
+
+
+# Filters of the supported content types
+RESPONSE_FILTERS = {
+    'application/json': filter_json,
+    'application/x-ndjson': filter_ndjson,
+    'application/ndjson': filter_ndjson,
+    'application/jsonl': filter_ndjson,
+    'text/csv': filter_csv,
+    'application/csv': filter_csv,
+    'application/xml': filter_xml,
+    'text/xml': filter_xml,
+}
+
+
+def register_response_filter(content_type, response_filter):
+    """
+    Registers the filter of a content type for every decorator.
+    :param str content_type: Media type, without parameters.
+    :param response_filter: Function `filter(source, target, redactor)`.
+    """
+    RESPONSE_FILTERS[content_type.lower()] = response_filter
+
+
+def get_response_filter(content_type, filters=None):
+    """
+    :param str content_type: Media type, without parameters.
+    :param dict filters: Filters by content type, defaults to the registered filters.
+    :return: The filter of the content type, falling back to the '+json' and '+xml' structured syntax suffixes.
+    None if the content type is not supported.
+    """
+    filters = RESPONSE_FILTERS if filters is None else filters
+    content_type = content_type.lower()
+    if content_type in filters:
+        return filters[content_type]
+    for suffix, base_type in (('+json', 'application/json'), ('+xml', 'application/xml')):
+        if content_type.endswith(suffix):
+            return filters.get(base_type)
+    return None
+
+
+def _guess_content_type(head):
+    """
+    :param bytes head: Start of a decompressed body.
+    :return: The content type of the body.
+    """
+    head = head.lstrip()
+    if head.startswith(b'<'):
+        return 'application/xml'
+    if head.startswith((b'{', b'[')):
+        first_line, separator, rest = head.partition(b'\n')
+        if separator and rest.strip():
+            try:
+                json.loads(first_line)
+                return 'application/x-ndjson'
+            except ValueError:
+                pass
+        return 'application/json'
+    return 'text/csv'
+
+
+def filter_body(body, content_type, redactor, filters=None):
+    """
+    :param bytes body: Response body.
+    :param str content_type: Media type of the response, without parameters.
+    :param Redactor redactor: Redacts the values of the body.
+    :param dict filters: Filters by content type, defaults to the registered filters.
+    :return: The redacted body, None if the content type is not supported.
+    :type: bytes
+    :raises ValueError: if the body cannot be parsed.
+    """
+    if isinstance(body, str):
+        body = body.encode(_ENCODING)
+    source, target = io.BytesIO(body), io.BytesIO()
+    if not body.startswith(_GZIP_MAGIC):
+        response_filter = get_response_filter(content_type, filters)
+        if response_filter is None:
+            return None
+        response_filter(source, target, redactor)
+        return target.getvalue()
+    try:
+        with gzip.GzipFile(fileobj=source, mode='rb') as decompressed:
+            if content_type.lower() in _GZIP_CONTENT_TYPES:
+                content_type = _guess_content_type(decompressed.peek(io.DEFAULT_BUFFER_SIZE))
+            response_filter = get_response_filter(content_type, filters)
+            if response_filter is None:
+                return None
+            with gzip.GzipFile(fileobj=target, mode='wb', mtime=0) as compressed:
+                response_filter(decompressed, compressed, redactor)
+    except (OSError, EOFError) as err:
+        raise ValueError('Invalid gzip body') from err
+    return target.getvalue()
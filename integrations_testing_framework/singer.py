@@ -0,0 +1,306 @@
+"""
+Semantic comparison of Singer tap output.
+
+Messages are parsed and compared per (message type, stream) channel on their canonical JSON form, so that key order,
+number formatting and the interleaving of streams and STATE messages do not matter:
+    RECORD: the record, compared in order or as multiset when record order is ignored.
+    SCHEMA: the schema, key properties and bookmark properties.
+    STATE: the state value, compared in order with the other STATE messages.
+    Other messages: all keys except time_extracted and version.
+Lines that are not JSON are compared in order as text.
+Both outputs are streamed, the expected file is read ahead only as far as needed to find the next message of a channel.
+Comparison fails once more than `max_read_ahead` expected messages are held in memory, when the streams are interleaved
+very differently or messages of a channel are missing, so that memory stays bounded.
+"""
+import collections
+import hashlib
+import json
+from decimal import Decimal
+
+from integrations_testing_framework.capture import StdoutSink
+
+# Number of differences reported per channel
+_MAX_SAMPLES = 5
+# Number of expected messages held in memory while looking for the next message of a channel
+MAX_READ_AHEAD = 100000
+# Keys of other message types that are not compared, as they identify the channel or change on every run
+_IGNORED_KEYS = {'type', 'stream', 'time_extracted', 'version'}
+
+
+def _parse_float(text):
+    number = Decimal(text)
+    if number == number.to_integral_value() and abs(number) < 2 ** 63:
+        return int(number)
+    return float(text)
+
+
+def canonical_json(value):
+    """
+    Serialize a value with sorted keys and without whitespace.
+    """
+    return json.dumps(value, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+
+
+def parse_message(line):
+    """
+    Parse a line of tap output.
+    :param str line: Line written by the tap.
+    :return: Tuple of (channel, canonical message), None for blank lines.
+    :type: tuple
+    """
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        message = json.loads(line, parse_float=_parse_float)
+    except ValueError:
+        return ('LINE', None), line
+    if not isinstance(message, dict) or 'type' not in message:
+        return ('LINE', None), canonical_json(message)
+    message_type = message['type']
+    stream = message.get('stream')
+    if message_type == 'RECORD':
+        value = message.get('record')
+    elif message_type == 'SCHEMA':
+        value = {key: message.get(key) for key in ('schema', 'key_properties', 'bookmark_properties')}
+    elif message_type == 'STATE':
+        value = message.get('value')
+    else:
+        value = {key: item for key, item in message.items() if key not in _IGNORED_KEYS}
+    return (message_type, stream), canonical_json(value)
+
+
+def _digest(canonical):
+    return hashlib.blake2b(canonical.encode('utf-8'), digest_size=16).digest()
+
+
+class ChannelDiff:
+    """
+    Comparison result of the messages of a channel.
+    """
+
+    def __init__(self):
+        self.expected = 0
+        self.actual = 0
+        self.mismatched = 0
+        self.missing = 0
+        self.unexpected = 0
+        self.samples = []
+
+    @property
+    def differences(self):
+        return self.mismatched + self.missing + self.unexpected
+
+    def add_sample(self, kind, position, expected=None, actual=None):
+        if len(self.samples) < _MAX_SAMPLES:
+            self.samples.append((kind, position, expected, actual))
+
+
+class SingerDiff:
+    """
+    Structured summary of the differences between two tap outputs, keyed by (message type, stream) channel.
+    """
+
+    def __init__(self):
+        self.channels = collections.defaultdict(ChannelDiff)
+
+    def __bool__(self):
+        return any(channel.differences for channel in self.channels.values())
+
+    @property
+    def expected(self):
+        return sum(channel.expected for channel in self.channels.values())
+
+    def __str__(self):
+        lines = ['Singer output does not match.', '',
+                 f'{"message":<10} {"stream":<30} {"expected":>9} {"actual":>9} {"mismatch":>9} {"missing":>9} '
+                 f'{"unexpect":>9}']
+        for (message_type, stream), channel in sorted(self.channels.items(), key=lambda item: str(item[0])):
+            if channel.differences:
+                lines.append(f'{message_type:<10} {str(stream):<30} {channel.expected:>9} {channel.actual:>9} '
+                             f'{channel.mismatched:>9} {channel.missing:>9} {channel.unexpected:>9}')
+        for (message_type, stream), channel in sorted(self.channels.items(), key=lambda item: str(item[0])):
+            for kind, position, expected, actual in channel.samples:
+                position = f' #{position}' if position is not None else ''
+                lines.append(f'\n{message_type} {stream}{position} {kind}:')
+                if expected is not None:
+                    lines.append(f'Expected: \n{expected}')
+                if actual is not None:
+                    lines.append(f'Actual: \n{actual}')
+        return '\n'.join(lines)
+
+
+class SingerComparator:
+    """
+    Compares tap output fed line by line with the messages of an expected file.
+    """
+
+    def __init__(self, file_uri, ignore_record_order=False, max_read_ahead=MAX_READ_AHEAD):
+        """
+        :param int max_read_ahead: Maximum number of expected messages read ahead of the actual output.
+        """
+        self.diff = SingerDiff()
+        self._file_uri = file_uri
+        self._ignore_record_order = ignore_record_order
+        self._max_read_ahead = max_read_ahead
+        self._file = open(file_uri, 'r')
+        # Expected messages read ahead of the actual output, by channel, and their number
+        self._pending = collections.defaultdict(collections.deque)
+        self._read_ahead = 0
+        # Multisets of expected record digests, by channel
+        self._records = collections.defaultdict(collections.Counter)
+        if ignore_record_order:
+            with open(file_uri, 'r') as file:
+                for line in file:
+                    parsed = parse_message(line)
+                    if parsed and self._is_unordered(parsed[0]):
+                        self._records[parsed[0]][_digest(parsed[1])] += 1
+                        self.diff.channels[parsed[0]].expected += 1
+
+    def _is_unordered(self, channel):
+        return self._ignore_record_order and channel[0] == 'RECORD'
+
+    def _next_expected(self, channel):
+        pending = self._pending.get(channel)
+        if pending:
+            self._read_ahead -= 1
+            return pending.popleft()
+        for line in self._file:
+            parsed = parse_message(line)
+            if parsed is None or self._is_unordered(parsed[0]):
+                continue
+            self.diff.channels[parsed[0]].expected += 1
+            if parsed[0] == channel:
+                return parsed[1]
+            if self._read_ahead >= self._max_read_ahead:
+                raise AssertionError(
+                    f'Singer output does not match: more than {self._max_read_ahead} expected messages were read '
+                    f'ahead looking for the next {channel[0]} message of {channel[1]}, streams are interleaved '
+                    f'differently or messages are missing (see max_read_ahead).')
+            self._pending[parsed[0]].append(parsed[1])
+            self._read_ahead += 1
+        return None
+
+    def add_line(self, line):
+        parsed = parse_message(line)
+        if parsed is None:
+            return
+        channel, canonical = parsed
+        channel_diff = self.diff.channels[channel]
+        channel_diff.actual += 1
+        if self._is_unordered(channel):
+            digest = _digest(canonical)
+            records = self._records[channel]
+            if records[digest] > 0:
+                records[digest] -= 1
+            else:
+                channel_diff.unexpected += 1
+                channel_diff.add_sample('unexpected', channel_diff.actual, actual=canonical)
+            return
+        expected = self._next_expected(channel)
+        if expected is None:
+            channel_diff.unexpected += 1
+            channel_diff.add_sample('unexpected', channel_diff.actual, actual=canonical)
+        elif expected != canonical:
+            channel_diff.mismatched += 1
+            channel_diff.add_sample('mismatch', channel_diff.actual, expected=expected, actual=canonical)
+
+    def finish(self):
+        """
+        Account for the expected messages that were not written.
+        :return: The differences found.
+        :type: SingerDiff
+        """
+        for channel, pending in self._pending.items():
+            for canonical in pending:
+                self._add_missing(channel, canonical)
+        self._pending.clear()
+        self._read_ahead = 0
+        for line in self._file:
+            parsed = parse_message(line)
+            if parsed and not self._is_unordered(parsed[0]):
+                self.diff.channels[parsed[0]].expected += 1
+                self._add_missing(*parsed)
+        missing = {channel: +records for channel, records in self._records.items() if +records}
+        if missing:
+            self._collect_missing_records(missing)
+        self.close()
+        return self.diff
+
+    def _add_missing(self, channel, canonical):
+        channel_diff = self.diff.channels[channel]
+        channel_diff.missing += 1
+        channel_diff.add_sample('missing', channel_diff.actual + channel_diff.missing, expected=canonical)
+
+    def _collect_missing_records(self, missing):
+        """
+        Count missing records and read samples of them from the expected file.
+        """
+        for channel, records in missing.items():
+            self.diff.channels[channel].missing += sum(records.values())
+        with open(self._file_uri, 'r') as file:
+            for line in file:
+                parsed = parse_message(line)
+                if parsed is None or parsed[0] not in missing:
+                    continue
+                digest = _digest(parsed[1])
+                if missing[parsed[0]][digest] > 0:
+                    missing[parsed[0]][digest] -= 1
+                    self.diff.channels[parsed[0]].add_sample('missing', None, expected=parsed[1])
+
+    def close(self):
+        self._file.close()
+
+
+def compare_singer_output(expected_uri, actual_lines, ignore_record_order=False, max_read_ahead=MAX_READ_AHEAD):
+    """
+    Compare tap output with the messages of a file.
+    :param str expected_uri: File holding the expected tap output.
+    :param actual_lines: Iterable of lines written by the tap, e.g. an open file.
+    :param bool ignore_record_order: True to compare the records of each stream as multiset.
+    :param int max_read_ahead: Maximum number of expected messages read ahead of the actual output.
+    :return: The differences found, falsy when the outputs match.
+    :type: SingerDiff
+    :raises AssertionError: when more than max_read_ahead expected messages are read ahead.
+    """
+    comparator = SingerComparator(expected_uri, ignore_record_order=ignore_record_order, max_read_ahead=max_read_ahead)
+    try:
+        for line in actual_lines:
+            comparator.add_line(line)
+    except BaseException:
+        comparator.close()
+        raise
+    return comparator.finish()
+
+
+class SingerMatchingSink(StdoutSink):
+    """
+    Compares the Singer messages written to stdout with the messages of a file.
+    """
+
+    def __init__(self, file_uri, ignore_record_order=False, max_read_ahead=MAX_READ_AHEAD):
+        super().__init__()
+        self._comparator = SingerComparator(file_uri, ignore_record_order=ignore_record_order,
+                                            max_read_ahead=max_read_ahead)
+
+    def write_line(self, line):
+        self._comparator.add_line(line)
+
+    def finish(self):
+        """
+        :raises AssertionError: with a summary of the differences when the outputs do not match.
+        """
+        try:
+            super().finish()
+        except BaseException:
+            self.close()
+            raise
+        diff = self._comparator.finish()
+        if diff.expected == 0:
+            raise Exception("File is empty.")
+        if diff:
+            raise AssertionError(str(diff))
+
+    def close(self):
+        self._comparator.close()
+        super().close()
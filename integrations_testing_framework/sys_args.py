@@ -0,0 +1,65 @@
+import copy
+import sys
+
+from integrations_testing_framework.context import ContextLocal
+
+
+def _delegate(name):
+    def method(self, *args, **kwargs):
+        return getattr(self._target(), name)(*args, **kwargs)
+
+    method.__name__ = name
+    return method
+
+
+class _ArgvProxy(list):
+    """
+    Replaces sys.argv while arguments are set, behaving as the argument list of the calling context.
+    """
+
+    def __init__(self, argv):
+        super().__init__()
+        self.argv = argv
+
+    def _target(self):
+        return _ARGV.get(self.argv)
+
+    def __iadd__(self, other):
+        self._target().extend(other)
+        return self
+
+    # Copies are plain lists of the arguments of the calling context, rather than list subclasses rebuilt through the
+    # proxy
+    def __copy__(self):
+        return list(self._target())
+
+    def __deepcopy__(self, memo):
+        return copy.deepcopy(self._target(), memo)
+
+    def __reduce_ex__(self, protocol):
+        return list, (list(self._target()),)
+
+
+for _name in ('__getitem__', '__setitem__', '__delitem__', '__len__', '__iter__', '__reversed__', '__contains__',
+              '__add__', '__mul__', '__eq__', '__ne__', '__lt__', '__le__', '__gt__', '__ge__', '__repr__', '__str__',
+              'append', 'extend', 'insert', 'pop', 'remove', 'clear', 'index', 'count', 'copy', 'sort', 'reverse'):
+    setattr(_ArgvProxy, _name, _delegate(_name))
+
+
+def _install_proxy():
+    sys.argv = _ArgvProxy(sys.argv)
+
+
+def _uninstall_proxy():
+    if isinstance(sys.argv, _ArgvProxy):
+        sys.argv = sys.argv.argv
+
+
+_ARGV = ContextLocal('sys_args', install=_install_proxy, uninstall=_uninstall_proxy)
+
+
+def use_sys_args(args):
+    """
+    Context manager setting sys.argv of the current context to the supplied list.
+    """
+    return _ARGV.use(list(args))
@@ -1,4 +1,4 @@
-import json
+from integrations_testing_framework.catalog import select_streams
 
 
 def assert_matching_file_contents(file_1, file_2):
@@ -19,44 +19,16 @@ def select_schema(catalog_path: str, stream_name: str, stream_key: str = 'name',
     """
     Creates a catalog file with the stream_name selected.
     Example: @with_sys_args(['--config', config_path, '--catalog', utils.select_schema('all-streams.json', 'epics')])
+    The catalog is parsed once per process and the file is written to a path unique to its content, see
+    `integrations_testing_framework.catalog.select_streams` to select several streams or properties at once.
 
     :param str catalog_path: a path of a catalog
     :param str stream_name: the name of the stream to be modified
     :param str stream_key: the key that is using for stream dict to select the desired stream
     :param select_by_property : True , when need to select : true each property metadata
+    :param exclude: metadata key or breadcrumb element of the properties not selected by property
     :return: the path of the catalog created as string
     :rtype: str
     """
-    f = open(catalog_path, "r")
-    catalog = f.read()
-    f.close()
-
-    catalog = json.loads(catalog)
-
-    #Selected : True added on each property metadata
-    # Add select_property = True as parameter
-    if select_by_property is True:
-        for stream in catalog['streams']:
-            if stream[stream_key] == stream_name:
-                for property in stream['metadata']:
-                    #Exclude some properties in schema metadata
-                    if exclude is not None:
-                        if exclude in property['metadata'] or exclude in property['breadcrumb']:
-                            pass
-                        else:
-                            property['metadata']['selected'] = True
-                    else:
-                        property['metadata']['selected'] = True
-
-    #Selected: True added on the metadata of the stream
-    else:
-        for stream in catalog['streams']:
-            if stream[stream_key] == stream_name:
-                stream['metadata'][0]['metadata']['selected'] = True
-
-    # Open the file for writing.
-    f = open(f"tests/catalogs/{stream_name}.json", "w")
-    f.write(json.dumps(catalog))
-    f.close()
-
-    return f"tests/catalogs/{stream_name}.json"
+    return select_streams(catalog_path, [stream_name], stream_key=stream_key,
+                          select_by_property=select_by_property is True, exclude=exclude, strict=False)
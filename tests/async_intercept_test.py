@@ -0,0 +1,85 @@
+import asyncio
+import random
+import sys
+from importlib.util import find_spec
+
+from integrations_testing_framework.cassettes.formats import get_format
+from integrations_testing_framework.decorators.decorators import assert_stdout_matches, with_sys_args, write_stdout
+from integrations_testing_framework.decorators.http_mocking_decorators import intercept_requests
+import pytest
+
+requires_httpx = pytest.mark.skipif(find_spec('httpx') is None, reason='httpx is not installed')
+requires_aiohttp = pytest.mark.skipif(find_spec('aiohttp') is None, reason='aiohttp is not installed')
+
+
+async def _fetch_httpx(url, pages):
+    import httpx
+
+    async with httpx.AsyncClient() as client:
+        async def fetch(page):
+            await asyncio.sleep(random.random() / 100)
+            response = await client.get(url, params={'page': page})
+            return response.json()['args']['page']
+
+        return await asyncio.gather(*[fetch(page) for page in pages])
+
+
+async def _fetch_aiohttp(url, pages):
+    import aiohttp
+
+    async with aiohttp.ClientSession() as session:
+        async def fetch(page):
+            await asyncio.sleep(random.random() / 100)
+            async with session.get(url, params={'page': page}) as response:
+                return (await response.json())['args']['page']
+
+        return await asyncio.gather(*[fetch(page) for page in pages])
+
+
+@pytest.mark.parametrize('fetch', [pytest.param(_fetch_httpx, marks=requires_httpx),
+                                   pytest.param(_fetch_aiohttp, marks=requires_aiohttp)])
+def test_concurrent_async_requests(echo_server, tmp_path, fetch):
+    """
+    Test that concurrent requests of an async function are played back regardless of the order they are made in.
+    """
+    cassette = str(tmp_path / 'cassette')
+    pages = [str(page) for page in range(10)]
+
+    @intercept_requests(cassette, generate=True)
+    async def actual_requests():
+        assert await fetch(f'{echo_server}/items', pages) == pages
+
+    # Requests are told apart through their full identity although the query is ignored
+    @intercept_requests(cassette, generate=False, ignore_on_match=['query'])
+    async def mocked_requests():
+        assert await fetch(f'{echo_server}/items', pages) == pages
+
+    asyncio.run(actual_requests())
+    _, responses = get_format('yaml').load_cassette(cassette)
+    timelines = [response['timeline'] for response in responses]
+    assert all(timeline['started'] <= timeline['finished'] for timeline in timelines)
+    assert max(timeline['concurrency'] for timeline in timelines) > 1
+    for _ in range(3):
+        asyncio.run(mocked_requests())
+
+
+@requires_httpx
+def test_async_decorators(echo_server, tmp_path):
+    cassette = str(tmp_path / 'cassette')
+    output = str(tmp_path / 'output.txt')
+
+    @write_stdout(output)
+    @intercept_requests(cassette, generate=True)
+    @with_sys_args(['--page', '1'])
+    async def actual_tap():
+        print(await _fetch_httpx(f'{echo_server}/items', [sys.argv[2]]))
+
+    asyncio.run(actual_tap())
+
+    @assert_stdout_matches(output)
+    @intercept_requests(cassette, generate=False)
+    @with_sys_args(['--page', '1'])
+    async def mocked_tap():
+        print(await _fetch_httpx(f'{echo_server}/items', [sys.argv[2]]))
+
+    asyncio.run(mocked_tap())
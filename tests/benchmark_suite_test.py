@@ -0,0 +1,57 @@
+import os
+import subprocess
+import sys
+
+from benchmarks.suite import _DEFAULT_BASELINE, compare, environment, load_baseline, run_suite
+import pytest
+
+# Scale of the run compared with the committed baseline
+_SCALE = 0.1
+
+
+@pytest.mark.benchmark
+def test_run_suite():
+    results = run_suite(['match', 'to_list_of_tuple'], scale=0.01, repeat=1)
+    assert set(results) >= {'match[none]@10', 'match[body_query]@100', 'to_list_of_tuple@10',
+                            'match[body_host_method_path_port_query_scheme]@10'}
+    assert all(result['throughput'] > 0 and result['peak_bytes'] >= 0 and result['calibration'] > 0
+               for result in results.values())
+
+
+def test_compare():
+    baseline = {'case@10': {'unit': 'lines/s', 'throughput': 100.0, 'peak_bytes': 1 << 20}}
+    assert compare({'case@10': {'unit': 'lines/s', 'throughput': 80.0, 'peak_bytes': 1 << 20}}, baseline) == []
+    assert compare({'other@10': {'unit': 'lines/s', 'throughput': 1.0, 'peak_bytes': 0}}, baseline) == []
+    regressions = compare({'case@10': {'unit': 'lines/s', 'throughput': 70.0, 'peak_bytes': 2 << 20}}, baseline)
+    assert len(regressions) == 2 and regressions[0].startswith('case@10: throughput 70.0 lines/s')
+    # Throughput of a case as a whole, relative to the speed of the machine
+    assert compare({'case@10': {'unit': 'lines/s', 'throughput': 70.0, 'peak_bytes': 1 << 20},
+                    'case@20': {'unit': 'lines/s', 'throughput': 130.0, 'peak_bytes': 1 << 20}},
+                   {**baseline, 'case@20': baseline['case@10']}, by_case=True) == []
+    assert compare({'case@10': {'unit': 'lines/s', 'throughput': 70.0, 'peak_bytes': 1 << 20}}, baseline,
+                   by_case=True) == ['case: throughput -30% of the baseline relative to the speed of the machine '
+                                     '(geometric mean of 1 measurements)']
+    assert compare({'case@10': {'unit': 'lines/s', 'throughput': 50.0, 'peak_bytes': 1 << 20, 'calibration': 1.0}},
+                   {'case@10': {**baseline['case@10'], 'calibration': 2.0}}, by_case=True) == []
+    # Small peak memory increases are noise
+    assert compare({'case@10': {'unit': 'lines/s', 'throughput': 100.0, 'peak_bytes': 10}},
+                   {'case@10': {'unit': 'lines/s', 'throughput': 100.0, 'peak_bytes': 1}}) == []
+
+
+@pytest.mark.benchmark
+def test_no_regression():
+    """
+    Test that no case regressed against the baseline, see `benchmarks.suite`. The suite runs in a fresh interpreter,
+    as when the baseline was stored, rather than along the state left by other tests.
+    """
+    baseline_path = os.environ.get('BENCHMARK_BASELINE', str(_DEFAULT_BASELINE))
+    baseline_environment = load_baseline(baseline_path)[1]
+    if baseline_environment != environment():
+        pytest.skip(f'Baseline stored with {baseline_environment}, not comparable with {environment()}')
+    command = [sys.executable, '-m', 'benchmarks.suite', '--scale', str(_SCALE),
+               '--baseline', baseline_path,
+               '--by-case', '--threshold', os.environ.get('BENCHMARK_THRESHOLD', '0.3'),
+               '--memory-threshold', os.environ.get('BENCHMARK_MEMORY_THRESHOLD', '0.25')]
+    result = subprocess.run(command, cwd=_DEFAULT_BASELINE.parent.parent, capture_output=True, text=True)
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert 'No baseline' not in result.stdout, result.stdout
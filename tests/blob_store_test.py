@@ -0,0 +1,58 @@
+from importlib.util import find_spec
+
+from vcr.persisters.filesystem import CassetteDecodeError
+
+from integrations_testing_framework.cassettes.blobs import BLOB_CACHE, BlobStore
+from integrations_testing_framework.cassettes.formats import get_format
+from integrations_testing_framework.decorators.http_mocking_decorators import intercept_requests
+import pytest
+import requests
+
+requires_zstandard = pytest.mark.skipif(find_spec('zstandard') is None, reason='zstandard is not installed')
+
+
+@pytest.mark.parametrize('cassette_format', ['yaml', 'jsonl'])
+@pytest.mark.parametrize('compression', [None, 'gzip', pytest.param('zstd', marks=requires_zstandard)])
+def test_shared_bodies(echo_server, tmp_path, cassette_format, compression):
+    """
+    Test that identical bodies recorded by several cassettes are stored once and played from the blob directory.
+    """
+    store = BlobStore(str(tmp_path / 'blobs'), compression=compression, min_size=0)
+    cassettes = [str(tmp_path / f'cassette_{i}') for i in range(2)]
+    payload = {'items': list(range(100))}
+
+    for cassette in cassettes:
+        @intercept_requests(cassette, generate=True, format=cassette_format, blob_store=store)
+        def actual_request():
+            for _ in range(2):
+                requests.post(f'{echo_server}/items', json=payload, timeout=10)
+
+        actual_request()
+
+    blobs = [path for path in (tmp_path / 'blobs').rglob('*') if path.is_file()]
+    assert len(blobs) == 1
+    _, responses = get_format(cassette_format).load_cassette(cassettes[0])
+    assert all('blob' in response['body'] for response in responses)
+
+    BLOB_CACHE.clear()
+    misses = BLOB_CACHE.misses
+    for cassette in cassettes:
+        @intercept_requests(cassette, generate=False, format=cassette_format, blob_store=str(tmp_path / 'blobs'))
+        def mocked_request():
+            for _ in range(2):
+                assert requests.post(f'{echo_server}/items', json=payload, timeout=10).json()['json'] == payload
+
+        mocked_request()
+    assert BLOB_CACHE.misses == misses + 1
+
+
+def test_blob_store(tmp_path):
+    store = BlobStore(str(tmp_path), min_size=4)
+    assert store.reference({'body': {'string': b'abc'}}) == {'body': {'string': b'abc'}}
+    response = store.reference({'status': 200, 'body': {'string': 'abcd'}})
+    assert store.resolve(response)['body']['string'] == b'abcd'
+    assert store.resolve(response)['status'] == 200
+    with pytest.raises(CassetteDecodeError):
+        store.get('0' * 64)
+    with pytest.raises(ValueError):
+        BlobStore(str(tmp_path), compression='lz4')
@@ -0,0 +1,82 @@
+import json
+
+from vcr.request import Request
+
+from integrations_testing_framework.cassettes.analysis import analyze_cassette, detect_format, main, rewrite_cassette
+from integrations_testing_framework.cassettes.formats import get_format
+from integrations_testing_framework.cassettes.sharding import ShardedFormat
+from integrations_testing_framework.decorators.http_mocking_decorators import intercept_requests
+import requests
+
+# Requests made by the tap, and the body of their response
+_CALLS = [('items?page=0', b'[1, 2]'), ('items?page=0', b'[1, 2]'), ('items?page=1', b'[1, 2]'),
+          ('items?page=0', b'[3]'), ('users', b'[]'), ('users', b'[]')]
+
+
+def _save_cassette(path, cassette_format='yaml'):
+    interactions = []
+    for position, (path_query, body) in enumerate(_CALLS):
+        request = Request('GET', f'https://api.example.com/{path_query}', None, {})
+        response = {'status': {'code': 200, 'message': 'OK'},
+                    'headers': {'Content-Type': ['application/json'], 'Date': [f'Mon, 01 Jan 2024 00:00:0{position}']},
+                    'body': {'string': body}}
+        interactions.append((request, response))
+    get_format(cassette_format).save_interactions(path, interactions)
+
+
+def _tap():
+    for path_query, body in _CALLS:
+        assert requests.get(f'https://api.example.com/{path_query}', timeout=10).content == body
+
+
+def test_analyze_cassette(tmp_path):
+    cassette = str(tmp_path / 'cassette')
+    _save_cassette(cassette)
+    report = analyze_cassette(cassette)
+    assert (report['format'], report['interactions'], report['plays']) == ('yaml', 6, 6)
+    assert report['hosts'] == {'api.example.com': {'interactions': 6, 'paths': {'/items': 4, '/users': 2}}}
+    assert report['body_bytes'] == {'count': 6, 'total': 25, 'min': 2, 'max': 6, 'p50': 6, 'p90': 6, 'p99': 6}
+    assert report['duplicate_bodies'] == {'bodies': 2, 'interactions': 3, 'bytes': 14}
+    # The second request of page 0 and users are played the same response again, the third one is not
+    assert (report['repeated'], report['redundant'], report['unplayed']) == (3, 2, 0)
+
+    # Ignoring the query, page 1 repeats the requests of page 0
+    report = analyze_cassette(cassette, ignore_on_match=['query'])
+    assert (report['repeated'], report['redundant'], report['unplayed']) == (4, 3, 0)
+
+
+def test_rewrite_cassette(tmp_path):
+    """
+    Test that a cassette migrated to another format with its redundant interactions merged plays back the same.
+    """
+    cassette = str(tmp_path / 'cassette')
+    _save_cassette(cassette)
+    assert rewrite_cassette(cassette, target_format='jsonl', dedup=True) == (6, 4)
+    assert detect_format(cassette).name == 'jsonl'
+    plays = [response.get('plays', 1) for _, response in get_format('jsonl').iter_interactions(cassette)]
+    assert plays == [2, 1, 1, 2]
+    intercept_requests(cassette, format='jsonl')(_tap)()
+
+
+def test_main(tmp_path, capsys):
+    """
+    Test that the command analyzes and rewrites the cassettes of directories in parallel, sharded ones included.
+    """
+    _save_cassette(str(tmp_path / 'first'))
+    (tmp_path / 'nested').mkdir()
+    _save_cassette(str(tmp_path / 'nested' / 'second'), 'jsonl')
+    ShardedFormat(get_format('msgpack'), shard_by='path').save_interactions(
+        str(tmp_path / 'sharded'), get_format('yaml').iter_interactions(str(tmp_path / 'first')))
+    (tmp_path / 'notes.txt').write_text('not a cassette')
+
+    assert main(['analyze', str(tmp_path), '--json', '--jobs', '2']) == 1
+    output = json.loads(capsys.readouterr().out)
+    assert sorted((report['path'][len(str(tmp_path)) + 1:], report['format']) for report in output['cassettes']) == [
+        ('first', 'yaml'), ('nested/second', 'jsonl'), ('sharded', 'msgpack/sharded')]
+    assert output['summary']['interactions'] == 18 and output['summary']['endpoints'] == {
+        'api.example.com/items': 12, 'api.example.com/users': 6}
+
+    assert main(['rewrite', str(tmp_path / 'first'), str(tmp_path / 'sharded'), '--format', 'jsonl', '--dedup']) == 0
+    assert detect_format(str(tmp_path / 'first')).name == 'jsonl'
+    assert detect_format(str(tmp_path / 'sharded')).cassette_format.name == 'jsonl'
+    intercept_requests(str(tmp_path / 'sharded'), format='jsonl', shard_by='path')(_tap)()
@@ -0,0 +1,86 @@
+import os
+
+from vcr import matchers
+from vcr.record_mode import RecordMode
+from vcr.request import Request
+
+from integrations_testing_framework.cassettes.cache import CASSETTE_CACHE, CassetteCache, _file_size
+from integrations_testing_framework.cassettes.formats import get_format
+from integrations_testing_framework.cassettes.playback import IndexedCassette
+from integrations_testing_framework.cassettes.sharding import ShardedFormat
+from integrations_testing_framework.decorators.http_mocking_decorators import intercept_requests
+import pytest
+import requests
+
+
+def test_cached_playback(echo_server, tmp_path):
+    """
+    Test that tests playing back the same cassette share the loaded interactions, but not their play counts.
+    """
+    cassette = str(tmp_path / 'cassette')
+
+    @intercept_requests(cassette, generate=True)
+    def actual_request():
+        for page in range(3):
+            requests.get(f'{echo_server}/items', params={'page': page}, timeout=10)
+
+    def mocked_request(pages, **kwargs):
+        @intercept_requests(cassette, generate=False, **kwargs)
+        def test():
+            for page in pages:
+                assert requests.get(f'{echo_server}/items', params={'page': page}, timeout=10).json()['args'] == {
+                    'page': str(page)}
+
+        test()
+
+    actual_request()
+    stats = CASSETTE_CACHE.stats()
+    mocked_request(range(3))
+    mocked_request(range(3))
+    with pytest.raises(AssertionError, match='not all previously recorded requests were made'):
+        mocked_request(range(2))
+    assert CASSETTE_CACHE.stats()['misses'] == stats['misses'] + 1
+    assert CASSETTE_CACHE.stats()['hits'] == stats['hits'] + 2
+
+    # Another configuration and a recorded again file are loaded again
+    mocked_request(range(3), ignore_on_match=['body'])
+    actual_request()
+    mocked_request(range(3))
+    assert CASSETTE_CACHE.stats()['misses'] == stats['misses'] + 3
+
+
+def test_eviction(tmp_path):
+    cache = CassetteCache(max_file_size=1)
+    paths = []
+    for name in ('a', 'b'):
+        paths.append(str(tmp_path / name))
+        request = Request('GET', f'https://api.example.com/{name}', None, {})
+        get_format('jsonl').save_interactions(paths[-1], [(request, {'status': {'code': 200, 'message': 'OK'},
+                                                                     'headers': {}, 'body': {'string': b'{}'}})])
+
+    def load(path):
+        cassette = IndexedCassette(path, record_mode=RecordMode.NONE, match_on=[matchers.path],
+                                   persister=get_format('jsonl'))
+        cache.load(cassette, 'config')
+        assert len(cassette) == 1
+
+    cache.max_file_size = 10 ** 6
+    load(paths[0])
+    load(paths[0])
+    cache.max_file_size = cache.file_size + 1
+    load(paths[1])
+    load(paths[0])
+    assert (cache.hits, cache.misses) == (1, 3)
+
+
+def test_sharded_file_size(tmp_path):
+    """
+    Test that sharded cassettes count the size of their shards.
+    """
+    cassette = tmp_path / 'sharded'
+    ShardedFormat(get_format('jsonl'), shard_by='path').save_interactions(str(cassette), [
+        (Request('GET', f'https://api.example.com/{name}', None, {}),
+         {'status': {'code': 200, 'message': 'OK'}, 'headers': {}, 'body': {'string': b'x' * 10000}})
+        for name in ('a', 'b')])
+    assert _file_size(str(cassette), os.stat(cassette)) == sum(path.stat().st_size for path in cassette.iterdir())
+    assert _file_size(str(cassette), os.stat(cassette)) > 20000
@@ -0,0 +1,119 @@
+from concurrent.futures import ThreadPoolExecutor
+from importlib.util import find_spec
+
+from vcr.request import Request
+
+from integrations_testing_framework.cassettes.formats import LazyBody, convert_cassette, get_format
+from integrations_testing_framework.decorators.http_mocking_decorators import intercept_requests
+import pytest
+import requests
+
+requires_msgpack = pytest.mark.skipif(find_spec('msgpack') is None, reason='msgpack is not installed')
+
+
+@pytest.mark.parametrize('cassette_format', ['yaml', 'jsonl', pytest.param('msgpack', marks=requires_msgpack)])
+def test_record_and_playback(echo_server, tmp_path, cassette_format):
+    """
+    Test recording and playing back requests for each format.
+    """
+    cassette = str(tmp_path / 'cassette')
+
+    @intercept_requests(cassette, generate=True, format=cassette_format)
+    def actual_request():
+        requests.get(f'{echo_server}/anything', params={'param1': 'value1'}, timeout=10)
+        requests.post(f'{echo_server}/anything', json={'key1': 'välue1'}, timeout=10)
+
+    @intercept_requests(cassette, generate=False, format=cassette_format)
+    def mocked_request():
+        assert requests.get(f'{echo_server}/anything', params={'param1': 'value1'},
+                            timeout=10).json()['args'] == {'param1': 'value1'}
+        assert requests.post(f'{echo_server}/anything', json={'key1': 'välue1'},
+                             timeout=10).json()['json'] == {'key1': 'välue1'}
+
+    actual_request()
+    mocked_request()
+
+
+@pytest.mark.parametrize('cassette_format', ['jsonl', pytest.param('msgpack', marks=requires_msgpack)])
+def test_lazy_body(tmp_path, cassette_format):
+    """
+    Test that response bodies, including binary ones, are read only when accessed.
+    """
+    streaming_format = get_format(cassette_format)
+    cassette = str(tmp_path / 'cassette')
+    bodies = [b'{"id": 1}', b'\x00\xff binary', b'']
+    streaming_format.save_cassette(cassette, {
+        'requests': [Request('GET', f'http://localhost/{i}', None, {}) for i in range(len(bodies))],
+        'responses': [{'status': {'code': 200, 'message': 'OK'}, 'headers': {}, 'body': {'string': body}}
+                      for body in bodies]})
+
+    requests_, responses = streaming_format.load_cassette(cassette)
+    assert [request.uri for request in requests_] == ['http://localhost/0', 'http://localhost/1', 'http://localhost/2']
+    assert all(isinstance(response['body'], LazyBody) and not dict.__contains__(response['body'], 'string')
+               for response in responses)
+    assert [response['body']['string'] for response in responses] == bodies
+
+
+def test_convert_cassette(tmp_path):
+    """
+    Test migrating a YAML cassette and playing back the converted file.
+    """
+    cassette = str(tmp_path / 'cassette.jsonl')
+    assert convert_cassette('tests/cassette', cassette, target_format='jsonl') == 1
+
+    @intercept_requests(cassette, generate=False, format='jsonl')
+    def mocked_request():
+        response = requests.get('https://www.iana.org/domains/reserved', timeout=10)
+        assert 'domains' in response.text
+
+    mocked_request()
+    converted_back = str(tmp_path / 'cassette.yaml')
+    convert_cassette(cassette, converted_back, source_format='jsonl', target_format='yaml')
+    assert get_format('yaml').load_cassette(converted_back)[1][0]['body']['string'] == \
+        get_format('yaml').load_cassette('tests/cassette')[1][0]['body']['string']
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        intercept_requests('tests/cassette', format='xml')
+
+
+def test_concurrent_saves(tmp_path):
+    """
+    Test that workers saving the same cassette at once do not share a temporary file.
+    """
+    cassette = str(tmp_path / 'cassette')
+    interactions = [(Request('GET', f'https://api.example.com/items?page={page}', None, {}),
+                     {'status': {'code': 200, 'message': 'OK'}, 'headers': {}, 'body': {'string': b'x' * 10000}})
+                    for page in range(50)]
+    with ThreadPoolExecutor(4) as executor:
+        for future in [executor.submit(get_format('jsonl').save_interactions, cassette, interactions)
+                       for _ in range(8)]:
+            future.result()
+    assert len(list(get_format('jsonl').iter_interactions(cassette))) == 50
+    assert [path.name for path in tmp_path.iterdir()] == ['cassette']
+
+
+
+def test_interrupted_writer(tmp_path):
+    """
+    Test that recording to a streaming cassette leaves the previous cassette untouched until it completes.
+    """
+    cassette = str(tmp_path / 'cassette')
+    interaction = (Request('GET', 'https://api.example.com/items', None, {}),
+                   {'status': {'code': 200, 'message': 'OK'}, 'headers': {}, 'body': {'string': b'[]'}})
+    get_format('jsonl').save_interactions(cassette, [interaction])
+    content = (tmp_path / 'cassette').read_bytes()
+
+    with pytest.raises(RuntimeError), get_format('jsonl').open_writer(cassette) as writer:
+        writer.append(*interaction)
+        writer.append(*interaction)
+        assert (tmp_path / 'cassette').read_bytes() == content
+        raise RuntimeError('interrupted')
+    assert (tmp_path / 'cassette').read_bytes() == content
+    assert [path.name for path in tmp_path.iterdir()] == ['cassette']
+
+    with get_format('jsonl').open_writer(cassette) as writer:
+        writer.append(*interaction)
+        writer.append(*interaction)
+    assert len(list(get_format('jsonl').iter_interactions(cassette))) == 2
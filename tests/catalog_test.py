@@ -0,0 +1,80 @@
+import copy
+import json
+import threading
+
+from integrations_testing_framework.catalog import Catalog, select_catalog, select_streams
+from integrations_testing_framework.utils import select_schema
+import pytest
+
+
+def _catalog(streams=20, properties=10):
+    return {'streams': [{
+        'tap_stream_id': f'stream_{i}',
+        'stream': f'stream_{i}',
+        'schema': {'properties': {f'field_{j}': {'type': 'string'} for j in range(properties)}},
+        'metadata': [{'breadcrumb': [], 'metadata': {'table-key-properties': ['field_0']}}] + [
+            {'breadcrumb': ['properties', f'field_{j}'], 'metadata': {'inclusion': 'available'}}
+            for j in range(properties)],
+    } for i in range(streams)]}
+
+
+def _legacy_select(catalog, stream_name, stream_key, select_by_property, exclude):
+    """
+    Selection of `select_schema` before the catalog module.
+    """
+    catalog = copy.deepcopy(catalog)
+    for stream in catalog['streams']:
+        if stream[stream_key] == stream_name:
+            if select_by_property is True:
+                for entry in stream['metadata']:
+                    if exclude is None or not (exclude in entry['metadata'] or exclude in entry['breadcrumb']):
+                        entry['metadata']['selected'] = True
+            else:
+                stream['metadata'][0]['metadata']['selected'] = True
+    return json.dumps(catalog)
+
+
+@pytest.mark.parametrize('stream_name, stream_key, select_by_property, exclude', [
+    ('stream_3', 'stream', None, None),
+    ('stream_3', 'tap_stream_id', True, None),
+    ('stream_3', 'stream', True, 'field_2'),
+    ('stream_3', 'stream', True, 'table-key-properties'),
+    ('missing', 'stream', True, None),
+])
+def test_select_schema(tmp_path, stream_name, stream_key, select_by_property, exclude):
+    """
+    Test that select_schema writes the same catalog as before, without modifying the cached catalog.
+    """
+    catalog_path = tmp_path / 'catalog.json'
+    catalog_path.write_text(json.dumps(_catalog()))
+    expected = _legacy_select(_catalog(), stream_name, stream_key, select_by_property, exclude)
+    for _ in range(2):
+        with open(select_schema(str(catalog_path), stream_name, stream_key, select_by_property, exclude)) as file:
+            assert file.read() == expected
+
+
+def test_select_streams(tmp_path):
+    catalog_path = tmp_path / 'catalog.json'
+    catalog_path.write_text(json.dumps(_catalog()))
+    catalog = select_catalog(str(catalog_path), ['stream_1', 'stream_2'], stream_key='stream',
+                             properties=['properties/field_[12]'], exclude='properties/field_2')
+    selected = [[entry['breadcrumb'] for entry in stream['metadata'] if entry['metadata'].get('selected')]
+                for stream in catalog['streams'][:3]]
+    assert selected == [[], [[], ['properties', 'field_1']], [[], ['properties', 'field_1']]]
+    assert Catalog.load(str(catalog_path)) is Catalog.load(str(catalog_path))
+    with pytest.raises(KeyError):
+        select_streams(str(catalog_path), ['missing'])
+
+    # Parallel selections of the same streams share a file
+    paths = []
+    threads = [threading.Thread(target=lambda: paths.append(select_streams(str(catalog_path), ['stream_1'],
+                                                                           stream_key='stream')))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(paths)) == 1
+    assert select_streams(str(catalog_path), ['stream_2'], stream_key='stream') != paths[0]
+    with open(paths[0]) as file:
+        assert json.load(file)['streams'][1]['metadata'][0]['metadata']['selected'] is True
@@ -0,0 +1,64 @@
+from importlib.util import find_spec
+import json
+
+from integrations_testing_framework.cassettes.compression import CompressedFormat, decompress
+from integrations_testing_framework.cassettes.formats import get_format
+from integrations_testing_framework.decorators.http_mocking_decorators import intercept_requests
+from integrations_testing_framework.redaction import redact_string
+import pytest
+import requests
+
+requires_zstandard = pytest.mark.skipif(find_spec('zstandard') is None, reason='zstandard is not installed')
+requires_msgpack = pytest.mark.skipif(find_spec('msgpack') is None, reason='msgpack is not installed')
+
+
+@pytest.mark.parametrize('cassette_format', ['yaml', 'jsonl', pytest.param('msgpack', marks=requires_msgpack)])
+@pytest.mark.parametrize('compression', ['gzip', pytest.param('zstd', marks=requires_zstandard)])
+def test_compressed_bodies(echo_server, tmp_path, cassette_format, compression):
+    """
+    Test that bodies are redacted, then stored compressed, and decompressed when played.
+    """
+    cassette = tmp_path / 'cassette'
+    items = [{'id': item, 'email': f'user{item}@example.com'} for item in range(500)]
+    redacted = [{**item, 'email': redact_string(item['email'])} for item in items]
+
+    def tap():
+        for payload in (items, []):
+            response = requests.post(f'{echo_server}/items', params={'content_type': 'application/json'},
+                                     json=payload, timeout=10)
+            assert response.json() == payload
+
+    intercept_requests(str(cassette), generate=True, format=cassette_format, filter_resp_data=['email'],
+                       compression=compression)(tap)()
+    _, responses = get_format(cassette_format).load_cassette(str(cassette))
+    body = responses[0]['body']['string']
+    assert responses[0]['body_compression'] == compression
+    assert len(body) < len(json.dumps(redacted)) // 4
+    assert json.loads(decompress(body, compression)) == redacted
+
+    stored = CompressedFormat(get_format(cassette_format), compression)
+    _, responses = stored.load_cassette(str(cassette))
+    # Bodies are decompressed when read
+    assert dict.get(responses[0]['body'], 'string') is None and 'body_compression' not in responses[0]
+    assert json.loads(responses[0]['body']['string']) == redacted
+    assert 'body_compression' not in responses[1] and responses[1]['body']['string'] == b'[]'
+
+    def play():
+        for payload, played in ((items, redacted), ([], [])):
+            assert requests.post(f'{echo_server}/items', params={'content_type': 'application/json'},
+                                 json=payload, timeout=10).json() == played
+
+    intercept_requests(str(cassette), format=cassette_format, compression=compression)(play)()
+    # Bodies are decompressed without the option
+    intercept_requests(str(cassette), format=cassette_format)(play)()
+
+
+def test_compression_options():
+    with pytest.raises(ValueError):
+        CompressedFormat(get_format('yaml'), 'lz4')
+    stored = CompressedFormat(get_format('yaml'), 'gzip', min_size=8)
+    response = {'status': 200, 'body': {'string': 'a' * 100}}
+    assert stored.compress({'body': {'string': b'abc'}}) == {'body': {'string': b'abc'}}
+    assert stored.decompress(stored.compress(response))['body']['string'] == b'a' * 100
+    assert stored.decompress(response) is response
+    assert CompressedFormat(get_format('yaml'), None, min_size=8).compress(response) is response
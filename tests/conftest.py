@@ -0,0 +1,76 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import pytest
+
+
+class _EchoHandler(BaseHTTPRequestHandler):
+    """
+    Local stand-in for httpbin.org/anything, echoes the request back as JSON.
+    """
+
+    def _echo(self):
+        url = urlsplit(self.path)
+        self.server.received.append(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode() if length else ''
+        try:
+            json_body = json.loads(body) if body else None
+        except ValueError:
+            json_body = None
+        args = dict(parse_qsl(url.query))
+        content_type = 'application/json'
+        if 'content_type' in args:
+            # Echo the body itself with the requested content type
+            content_type = args['content_type']
+            payload = body.encode()
+        else:
+            payload = json.dumps({
+                'method': self.command,
+                'path': url.path,
+                'args': args,
+                'data': body,
+                'json': json_body,
+            }).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _echo
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope='session')
+def echo_server():
+    """
+    Base URL of a local HTTP server echoing requests back as JSON.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _EchoHandler)
+    server.received = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f'http://127.0.0.1:{server.server_address[1]}'
+    url_received[url] = server.received
+    yield url
+    server.shutdown()
+    server.server_close()
+
+
+# Paths of the requests received by each echo server
+url_received = {}
+
+
+@pytest.fixture
+def received_requests(echo_server):
+    """
+    Paths of the requests received by the echo server during the test.
+    """
+    received = url_received[echo_server]
+    received.clear()
+    return received
@@ -0,0 +1,87 @@
+import time
+
+from vcr.request import Request
+
+from integrations_testing_framework.cassettes.faults import (DropConnections, FaultProfile, Latency, RateLimit,
+                                                             ServerErrors, Throttle, error_response)
+from integrations_testing_framework.cassettes.formats import get_format
+from integrations_testing_framework.decorators.http_mocking_decorators import intercept_requests
+import pytest
+import requests
+
+_PAGES = 6
+
+
+def _save_cassette(path):
+    interactions = []
+    for page in range(_PAGES):
+        request = Request('GET', f'https://api.example.com/items?page={page}', None, {})
+        response = {'status': {'code': 200, 'message': 'OK'}, 'headers': {'Content-Type': ['application/json']},
+                    'body': {'string': b'{"items": [1, 2, 3]}'}}
+        interactions.append((request, response))
+    get_format('jsonl').save_interactions(path, interactions)
+
+
+def _tap():
+    """
+    Request every page, retrying failed requests after their Retry-After or 10ms.
+    """
+    for page in range(_PAGES):
+        while True:
+            try:
+                response = requests.get('https://api.example.com/items', params={'page': page}, timeout=10)
+            except requests.ConnectionError:
+                time.sleep(0.01)
+                continue
+            if response.status_code == 200:
+                assert response.json() == {'items': [1, 2, 3]}
+                break
+            time.sleep(float(response.headers.get('Retry-After', 0.01)))
+
+
+def test_rate_limit(tmp_path):
+    """
+    Test that rate limited requests are retried and answered with the recorded responses.
+    """
+    cassette = str(tmp_path / 'cassette')
+    _save_cassette(cassette)
+    profile = FaultProfile(RateLimit(every=3, retry_after=0.02))
+    intercept_requests(cassette, format='jsonl', faults=profile)(_tap)()
+    report = profile.reports[0].to_dict()
+    assert (report['requests'], report['faults'], report['retries'], report['responses']) == (8, {'429': 2}, 2, 6)
+    assert report['backoff_seconds'] >= 0.04
+    assert report['bytes'] == 6 * len(b'{"items": [1, 2, 3]}')
+
+
+def test_seeded_faults(tmp_path):
+    """
+    Test that random faults are the same on every run with the same seed.
+    """
+    cassette = str(tmp_path / 'cassette')
+    _save_cassette(cassette)
+    reports = []
+    for _ in range(2):
+        profile = FaultProfile(ServerErrors(rate=0.3, burst=2), DropConnections(rate=0.3), seed=7)
+        intercept_requests(cassette, format='jsonl', faults=profile)(_tap)()
+        reports.append(profile.reports[0].to_dict())
+    assert reports[0]['faults'] == reports[1]['faults'] and reports[0]['requests'] == reports[1]['requests']
+    assert sum(reports[0]['faults'].values()) == reports[0]['retries'] > 0
+    assert set(reports[0]['faults']) <= {'503', 'drop'}
+
+
+def test_latency_and_throughput(tmp_path):
+    cassette = str(tmp_path / 'cassette')
+    _save_cassette(cassette)
+    profile = FaultProfile(Latency(0.01, jitter=0.01), Throttle(bandwidth=2000, paths=['^/items$']))
+    intercept_requests(cassette, format='jsonl', faults=[*profile.faults])(_tap)()
+    slow = FaultProfile(*profile.faults, min_throughput=1000)
+    with pytest.raises(AssertionError, match='throughput'):
+        intercept_requests(cassette, format='jsonl', faults=slow)(_tap)()
+    report = slow.reports[0].to_dict()
+    # 10ms of latency and 10ms of transfer per response at least
+    assert report['wall_seconds'] >= report['delay_seconds'] >= _PAGES * 0.02
+
+
+@pytest.mark.parametrize('status, message', [(429, 'Too Many Requests'), (503, 'Service Unavailable'), (520, '')])
+def test_error_response(status, message):
+    assert error_response(status)['status'] == {'code': status, 'message': message}
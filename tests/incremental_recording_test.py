@@ -0,0 +1,62 @@
+import time
+
+from integrations_testing_framework.cassettes.formats import get_format
+from integrations_testing_framework.decorators.http_mocking_decorators import intercept_requests
+import pytest
+import requests
+
+
+def _record(echo_server, received, cassette, pages, cassette_format='yaml', **kwargs):
+    """
+    :return: Pages requested to the server rather than played from the cassette.
+    """
+    @intercept_requests(cassette, generate=True, format=cassette_format, **kwargs)
+    def tap():
+        for page in pages:
+            requests.get(f'{echo_server}/items', params={'page': page}, timeout=10)
+
+    received.clear()
+    tap()
+    return [path.rsplit('=', 1)[1] for path in received]
+
+
+def _recorded_pages(cassette, cassette_format='yaml'):
+    requests_, _ = get_format(cassette_format).load_cassette(cassette)
+    return [dict(request.query)['page'] for request in requests_]
+
+
+@pytest.mark.parametrize('cassette_format', ['yaml', 'jsonl'])
+def test_incremental_recording(echo_server, received_requests, tmp_path, cassette_format):
+    """
+    Test that only the requests missing from the cassette are recorded, and that unused interactions are dropped.
+    """
+    cassette = str(tmp_path / 'cassette')
+
+    def record(pages, **kwargs):
+        return _record(echo_server, received_requests, cassette, pages, cassette_format, incremental=True, **kwargs)
+
+    assert record([0, 1, 2]) == ['0', '1', '2']
+    assert record([0, 1, 3, 0]) == ['3', '0']
+    assert _recorded_pages(cassette, cassette_format) == ['0', '1', '3', '0']
+
+    # Stale interactions and paths matching the refreshed patterns are recorded again
+    time.sleep(0.01)
+    assert record([0, 1], refresh_after=0.005) == ['0', '1']
+    assert record([0, 1], refresh_paths=['^/items$']) == ['0', '1']
+    assert _recorded_pages(cassette, cassette_format) == ['0', '1']
+
+
+def test_interrupted_recording(echo_server, received_requests, tmp_path):
+    cassette = str(tmp_path / 'cassette')
+    _record(echo_server, received_requests, cassette, [0, 1, 2], incremental=True)
+
+    @intercept_requests(cassette, generate=True, incremental=True)
+    def tap():
+        requests.get(f'{echo_server}/items', params={'page': 4}, timeout=10)
+        raise RuntimeError('interrupted')
+
+    with pytest.raises(RuntimeError):
+        tap()
+    assert _recorded_pages(cassette) == ['4', '0', '1', '2']
+    with pytest.raises(ValueError):
+        intercept_requests(cassette, generate=True, refresh_paths=['/items'])
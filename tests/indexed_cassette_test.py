@@ -0,0 +1,78 @@
+from vcr import matchers
+from vcr.errors import CannotOverwriteExistingCassetteException
+from vcr.request import Request
+
+from integrations_testing_framework.cassettes.playback import IndexedCassette, request_key_function
+from integrations_testing_framework.decorators.http_mocking_decorators import intercept_requests
+import pytest
+import requests
+
+
+def test_playback_order(echo_server, tmp_path):
+    """
+    Test that the next unplayed match is played when requests are matched by path only.
+    """
+    cassette = str(tmp_path / 'cassette')
+
+    @intercept_requests(cassette, generate=True)
+    def actual_request():
+        for page in range(3):
+            requests.get(f'{echo_server}/items', params={'page': page}, timeout=10)
+
+    @intercept_requests(cassette, generate=False, ignore_on_match=['query'])
+    def mocked_request():
+        pages = [requests.get(f'{echo_server}/items', params={'page': 'x'}, timeout=10).json()['args']['page']
+                 for _ in range(3)]
+        assert pages == ['0', '1', '2']
+
+    actual_request()
+    mocked_request()
+
+
+def test_playback_all_played(echo_server, tmp_path):
+    """
+    Test that unplayed and unknown requests are still reported.
+    """
+    cassette = str(tmp_path / 'cassette')
+
+    @intercept_requests(cassette, generate=True)
+    def actual_request():
+        requests.get(f'{echo_server}/a', timeout=10)
+        requests.get(f'{echo_server}/b', timeout=10)
+
+    @intercept_requests(cassette, generate=False)
+    def too_few_requests():
+        requests.get(f'{echo_server}/b', timeout=10)
+
+    @intercept_requests(cassette, generate=False)
+    def unknown_request():
+        requests.get(f'{echo_server}/c', timeout=10)
+
+    actual_request()
+    with pytest.raises(AssertionError) as err:
+        too_few_requests()
+    assert "not all previously recorded requests were made" in str(err.value)
+    with pytest.raises(CannotOverwriteExistingCassetteException):
+        unknown_request()
+
+
+def test_playback_falls_back_to_vcr_matchers(tmp_path):
+    """
+    Test that requests only equal for the lenient vcr body matcher are still played.
+    """
+    cassette = IndexedCassette(str(tmp_path / 'cassette'),
+                               match_on=[matchers.method, matchers.path, matchers.body])
+    headers = {'Content-Type': 'application/json'}
+    cassette.append(Request('POST', 'http://localhost/a', '{"a": 1, "b": 2}', headers), {'body': {'string': 'ok'}})
+    cassette._build_index()
+
+    request = Request('POST', 'http://localhost/a', '{"b": 2, "a": 1}', headers)
+    assert request in cassette
+    assert cassette.play_response(request) == {'body': {'string': 'ok'}}
+    assert cassette.all_played
+
+
+def test_request_key_function():
+    assert request_key_function(['method', 'headers']) is None
+    request_key = request_key_function(['query', 'method'])
+    assert request_key(Request('GET', 'http://localhost/?b=1&a=2', None, {})) == ('GET', (('a', '2'), ('b', '1')))
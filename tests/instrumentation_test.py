@@ -0,0 +1,88 @@
+import json
+import tracemalloc
+
+from integrations_testing_framework.decorators.decorators import instrument, write_stdout
+from integrations_testing_framework.decorators.http_mocking_decorators import intercept_requests
+from integrations_testing_framework.instrumentation import (SESSION_REPORT, OutputStats, SessionReport, TestReport,
+                                                            instrumenting)
+import pytest
+import requests
+
+
+def test_report(echo_server, tmp_path):
+    """
+    Test that the decorators within an instrumented test fill in its report, written with the session report.
+    """
+    cassette = str(tmp_path / 'cassette')
+    reports = tmp_path / 'reports'
+
+    def tap():
+        for page in range(3):
+            requests.post(f'{echo_server}/items', params={'page': page}, json={'email': 'jane@example.com'},
+                          timeout=10)
+            print(json.dumps({'type': 'RECORD', 'stream': 'items', 'record': {'page': page}}))
+        print(json.dumps({'type': 'STATE', 'value': {}}))
+
+    record = instrument(str(reports))(write_stdout(str(tmp_path / 'output.txt'))(
+        intercept_requests(cassette, generate=True, filter_resp_data=['email'])(tap)))
+    record()
+    play = instrument(str(reports), profile=True, trace_memory=True)(intercept_requests(cassette)(tap))
+    play()
+
+    report = json.loads((reports / f'{__name__}.test_report.tap.json').read_text())
+    assert report['http']['played'] == 3
+    assert report['http']['hosts']['127.0.0.1']['paths'] == {'/items': 3}
+    assert report['http']['bytes_sent'] == 3 * len(b'{"email": "jane@example.com"}')
+    assert report['profile'] and report['memory']['peak_bytes'] > 0
+
+    # The session report is written when the process exits
+    assert not (reports / 'session.json').exists()
+    SESSION_REPORT.write_all()
+    session = json.loads((reports / 'session.json').read_text())
+    assert session['tests'] == len(SESSION_REPORT.reports)
+    assert session['http']['recorded'] >= 3 and session['http']['played'] >= 3
+    assert session['http']['redaction_seconds'] > 0
+    assert session['output']['streams']['items'] >= 3
+    assert session['output']['records_per_second'] == round(
+        session['output']['records'] / session['output']['seconds'], 1)
+
+
+@pytest.mark.parametrize('line, message_type, stream', [
+    ('{"type": "RECORD", "stream": "users", "record": {"stream": "other"}}\n', 'RECORD', 'users'),
+    ('{"type":"RECORD","stream":"us\\"ers","record":{}}\n', 'RECORD', 'us"ers'),
+    ('{"record": {}, "stream": "users", "type": "RECORD"}\n', 'RECORD', 'users'),
+    ('{"type": "STATE", "value": {}}\n', 'STATE', None),
+    ('not a message\n', None, None),
+])
+def test_output_stats(line, message_type, stream):
+    stats = OutputStats()
+    stats.add_line(line)
+    assert (stats.lines, stats.bytes) == (1, len(line))
+    assert dict(stats.messages) == ({message_type: 1} if message_type else {})
+    assert dict(stats.streams) == ({stream: 1} if message_type == 'RECORD' else {})
+
+
+def test_session_rates():
+    session = SessionReport()
+    for _ in range(10):
+        report = TestReport('test')
+        report.output_stats().streams['items'] += 1000
+        report.output._finished = report.output._started + 1
+        session.add(report)
+    output = session.to_dict()['output']
+    assert (output['records'], output['seconds'], output['records_per_second']) == (10000, 10, 1000)
+
+
+def test_trace_memory_without_reset_peak(monkeypatch, tmp_path):
+    """
+    Test that memory is traced while tracemalloc is already tracing on Python versions without reset_peak.
+    """
+    monkeypatch.delattr(tracemalloc, 'reset_peak', raising=False)
+    tracemalloc.start()
+    try:
+        with instrumenting('test', trace_memory=True) as report:
+            data = [bytearray(1 << 16) for _ in range(4)]
+        assert len(data) == 4 and report.memory['peak_bytes'] >= 4 << 16
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
@@ -0,0 +1,109 @@
+import asyncio
+from importlib.util import find_spec
+
+from vcr.errors import CannotOverwriteExistingCassetteException
+
+from integrations_testing_framework.decorators.http_mocking_decorators import mock_requests
+from integrations_testing_framework.mocking import MockResponse, MockServer
+import pytest
+import requests
+
+
+def test_routes():
+    """
+    Test that requests are answered by the first matching route, with the parameters of its pattern.
+    """
+    server = MockServer()
+    server.get('/health', 'ok')
+    server.route('*', 'https://api.example.com/v1/{name:path}', lambda request: {'path': request.params['name']})
+
+    @server.get('/v1/users/{user_id}')
+    def user(request):
+        return {'id': request.params['user_id'], 'fields': request.query.get('fields')}
+
+    @server.post('/v1/users')
+    def create_user(request):
+        return MockResponse({'created': request.json()['name']}, status=201, headers={'Location': '/v1/users/2'})
+
+    # Routes registered later than a matching route are not used
+    server.get('/v1/users/{user_id}', 'unused')
+
+    @mock_requests(server)
+    def test():
+        assert requests.get('http://localhost/health', timeout=10).text == 'ok'
+        assert requests.get('https://other.example.com/v1/users/1', params={'fields': 'name'}, timeout=10).json() == {
+            'id': '1', 'fields': 'name'}
+        response = requests.post('https://other.example.com/v1/users', json={'name': 'Jane'}, timeout=10)
+        assert (response.status_code, response.headers['Location'], response.json()) == (201, '/v1/users/2',
+                                                                                          {'created': 'Jane'})
+        assert requests.delete('https://api.example.com/v1/users/1', timeout=10).json() == {'path': 'users/1'}
+        assert requests.get('https://api.example.com:443/v1/users/1', timeout=10).json() == {'path': 'users/1'}
+        with pytest.raises(CannotOverwriteExistingCassetteException):
+            requests.get('https://other.example.com/v2/users/1', timeout=10)
+
+    test()
+    assert [route.calls for route in server.routes] == [1, 2, 1, 1, 0]
+
+
+def test_paginated_generator():
+    """
+    Test that a generator answers successive requests until it is exhausted.
+    """
+    server = MockServer()
+
+    @server.get('/v1/items')
+    def items(request):
+        for page in range(1, 101):
+            assert request.query['page'] == str(page)
+            request = yield {'data': [page], 'next_page': page + 1 if page < 100 else None}
+
+    @mock_requests(server)
+    def test():
+        pages, page = [], 1
+        while page:
+            response = requests.get('https://api.example.com/v1/items', params={'page': page}, timeout=10).json()
+            pages.extend(response['data'])
+            page = response['next_page']
+        assert pages == list(range(1, 101))
+        with pytest.raises(KeyError):
+            requests.get('https://api.example.com/v1/items', timeout=10)
+
+    test()
+
+
+def test_many_routes():
+    server = MockServer()
+    for i in range(500):
+        server.get(f'/v1/stream_{i}/{{item_id}}', lambda request, i=i: {'stream': i, 'id': request.params['item_id']})
+        server.get(f'/v1/stream_{i}', {'stream': i})
+
+    with server:
+        for i in (0, 250, 499):
+            assert requests.get(f'https://api.example.com/v1/stream_{i}/7', timeout=10).json() == {'stream': i,
+                                                                                                  'id': '7'}
+            assert requests.get(f'https://api.example.com/v1/stream_{i}', timeout=10).json() == {'stream': i}
+
+
+def test_passthrough(echo_server):
+    server = MockServer(passthrough=True)
+    server.get('/mocked', {'mocked': True})
+
+    with server:
+        assert requests.get(f'{echo_server}/mocked', timeout=10).json() == {'mocked': True}
+        assert requests.get(f'{echo_server}/actual', timeout=10).json()['path'] == '/actual'
+
+
+@pytest.mark.skipif(find_spec('httpx') is None, reason='httpx is not installed')
+def test_async_requests():
+    import httpx
+
+    server = MockServer()
+    server.get('/v1/users/{user_id}', lambda request: {'id': int(request.params['user_id'])})
+
+    @mock_requests(server)
+    async def test():
+        async with httpx.AsyncClient() as client:
+            responses = await asyncio.gather(*[client.get(f'https://api.example.com/v1/users/{i}') for i in range(10)])
+        assert [response.json()['id'] for response in responses] == list(range(10))
+
+    asyncio.run(test())
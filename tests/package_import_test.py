@@ -0,0 +1,53 @@
+import subprocess
+import sys
+import textwrap
+
+
+def _run(code):
+    subprocess.run([sys.executable, '-c', textwrap.dedent(code)], check=True)
+
+
+def test_lazy_import():
+    """
+    Test that importing the package has no side effect, and that the decorators are loaded on first access.
+    """
+    _run("""
+        import sys
+        import integrations_testing_framework
+        from integrations_testing_framework import catalog, utils
+        from integrations_testing_framework.utils import select_schema
+        from integrations_testing_framework.decorators.decorators import with_sys_args
+        assert utils.select_schema is select_schema and catalog.__name__ == 'integrations_testing_framework.catalog'
+        assert sys.stdout is sys.__stdout__
+        assert 'vcr' not in sys.modules and 'requests' not in sys.modules
+
+        from integrations_testing_framework import intercept_requests, write_stdout
+        assert 'vcr' in sys.modules and sys.stdout is sys.__stdout__
+        # Names the package used to import from the decorator modules
+        assert integrations_testing_framework.Path.__name__ == 'Path'
+    """)
+
+
+def test_logging_handler():
+    _run("""
+        import importlib
+        import logging
+        import integrations_testing_framework.decorators.http_mocking_decorators as module
+        importlib.reload(module)
+        assert sum(getattr(handler, 'integrations_testing_framework', False)
+                   for handler in logging.getLogger().handlers) == 1
+    """)
+
+
+def test_intercepted_stdout():
+    _run("""
+        import sys
+        import warnings
+        import integrations_testing_framework
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            stdout = integrations_testing_framework.intercepted_stdout
+        assert caught[0].category is DeprecationWarning
+        # Reading it does not replace stdout
+        assert sys.stdout is sys.__stdout__ and stdout.getvalue() == ''
+    """)
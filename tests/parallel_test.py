@@ -0,0 +1,85 @@
+import copy
+import pickle
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from integrations_testing_framework.decorators.decorators import assert_stdout_matches, with_sys_args, write_stdout
+from integrations_testing_framework.decorators.http_mocking_decorators import intercept_requests
+import requests
+
+
+def _tap(echo_server, barrier):
+    """
+    Tap printing its arguments and the responses of the requests made with them.
+    """
+    name = sys.argv[1]
+    barrier.wait(timeout=10)
+    for page in range(5):
+        response = requests.get(f'{echo_server}/{name}', params={'page': page}, timeout=10)
+        print(sys.argv[1], response.json()['path'], response.json()['args']['page'])
+        barrier.wait(timeout=10)
+
+
+def test_concurrent_decorators(echo_server, tmp_path):
+    """
+    Test that stdout, sys.argv and intercepted requests are not shared by functions running in different threads.
+    """
+    names = ['tap_a', 'tap_b', 'tap_c']
+
+    def run(generate):
+        barrier = threading.Barrier(len(names))
+
+        def test_tap(name):
+            cassette = str(tmp_path / f'{name}.yaml')
+            output = str(tmp_path / f'{name}.txt')
+            stdout_decorator = write_stdout(output) if generate else assert_stdout_matches(output)
+
+            @stdout_decorator
+            @intercept_requests(cassette, generate=generate)
+            @with_sys_args([name])
+            def test():
+                _tap(echo_server, barrier)
+
+            test()
+
+        with ThreadPoolExecutor(len(names)) as executor:
+            for future in [executor.submit(test_tap, name) for name in names]:
+                future.result()
+
+    run(generate=True)
+    for name in names:
+        with open(tmp_path / f'{name}.txt') as output:
+            assert output.read() == ''.join(f'{name} /{name} {page}\n' for page in range(5))
+    run(generate=False)
+
+
+def test_threads_of_decorated_function(tmp_path):
+    """
+    Test that threads started by a decorated function write to its stdout.
+    """
+    output = str(tmp_path / 'output.txt')
+
+    @write_stdout(output)
+    def test():
+        threads = [threading.Thread(target=print, args=(f'thread {i}',)) for i in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    test()
+    with open(output) as file:
+        assert sorted(file.read().splitlines()) == ['thread 0', 'thread 1', 'thread 2']
+
+
+def test_copy_sys_args():
+    """
+    Test that sys.argv set by the decorator is copied as a list.
+    """
+    @with_sys_args(['--page', '1'])
+    def test():
+        copies = [copy.copy(sys.argv), copy.deepcopy(sys.argv), pickle.loads(pickle.dumps(sys.argv)), sys.argv[:]]
+        assert all(type(argv) is list and argv[1:] == ['--page', '1'] for argv in copies)
+
+    test()
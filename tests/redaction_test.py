@@ -0,0 +1,90 @@
+import json
+
+from integrations_testing_framework import redaction
+from integrations_testing_framework.decorators.http_mocking_decorators import intercept_requests
+from integrations_testing_framework.redaction import Redactor
+import pytest
+import requests
+
+_DOCUMENT = {
+    'data': [{'id': 7, 'email': 'jane.doe@example.com', 'tags': ['a-b', 2.5], 'active': True,
+              'address': {'street': 'Main st. 1', 'id': 3}}],
+    'meta': {'count': 1, 'next': None},
+    'email': 'support@example.com',
+}
+
+
+@pytest.mark.parametrize('streaming', [False, True])
+@pytest.mark.parametrize('update_keys, skip_keys, expected', [
+    (None, None, {
+        'data': [{'id': 0, 'email': 'XXXX.XXX@XXXXXXX.XXX', 'tags': ['X-X', 0.0], 'active': False,
+                  'address': {'street': 'XXXXXXX.XX', 'id': 0}}],
+        'meta': {'count': 0, 'next': None},
+        'email': 'XXXXXXX@XXXXXXX.XXX'}),
+    # Arrays under keys that are not updated are kept
+    (['email', 'id'], None, {
+        'data': [{'id': 7, 'email': 'jane.doe@example.com', 'tags': ['a-b', 2.5], 'active': True,
+                  'address': {'street': 'Main st. 1', 'id': 3}}],
+        'meta': {'count': 1, 'next': None},
+        'email': 'XXXXXXX@XXXXXXX.XXX'}),
+    (None, ['data', 'count'], {
+        'data': [{'id': 7, 'email': 'jane.doe@example.com', 'tags': ['a-b', 2.5], 'active': True,
+                  'address': {'street': 'Main st. 1', 'id': 3}}],
+        'meta': {'count': 1, 'next': None},
+        'email': 'XXXXXXX@XXXXXXX.XXX'}),
+    (['data.*.email', 'data.*.tags.1'], None, {
+        'data': [{'id': 7, 'email': 'XXXX.XXX@XXXXXXX.XXX', 'tags': ['a-b', 0.0], 'active': True,
+                  'address': {'street': 'Main st. 1', 'id': 3}}],
+        'meta': {'count': 1, 'next': None},
+        'email': 'support@example.com'}),
+    (None, ['data.*.id', 'data.*.tags'], {
+        'data': [{'id': 7, 'email': 'XXXX.XXX@XXXXXXX.XXX', 'tags': ['a-b', 2.5], 'active': False,
+                  'address': {'street': 'XXXXXXX.XX', 'id': 0}}],
+        'meta': {'count': 0, 'next': None},
+        'email': 'XXXXXXX@XXXXXXX.XXX'}),
+])
+def test_redact_json(monkeypatch, streaming, update_keys, skip_keys, expected):
+    """
+    Test redaction with plain keys, matching at any depth, and paths, for bodies redacted at once and streamed.
+    """
+    if streaming:
+        monkeypatch.setattr(redaction, 'STREAMING_THRESHOLD', 0)
+    body = json.dumps(_DOCUMENT, indent=2).encode()
+    assert Redactor(update_keys, skip_keys).redact_json(body) == json.dumps(expected)
+
+
+@pytest.mark.parametrize('body', ['[1, {"a": "b"}, []]', '{"a": [1, 2], "a": {"b": 3}}', '"text"', '{}', ' [] '])
+def test_streaming_matches_json_decoding(monkeypatch, body):
+    """
+    Test that streamed bodies are serialized as decoded bodies are, including duplicate keys of the top level object.
+    """
+    expected = Redactor(['a']).redact_json(body)
+    monkeypatch.setattr(redaction, 'STREAMING_THRESHOLD', 0)
+    assert Redactor(['a']).redact_json(body) == expected
+
+
+@pytest.mark.parametrize('body', ['[1,]', '{"a": 1,}', '{"a" 1}', '[1] 2', '['])
+def test_streaming_invalid_json(monkeypatch, body):
+    monkeypatch.setattr(redaction, 'STREAMING_THRESHOLD', 0)
+    with pytest.raises(ValueError):
+        Redactor(['a']).redact_json(body)
+
+
+def test_filter_response_data_paths(echo_server, tmp_path):
+    """
+    Test that response keys are redacted by path in the recorded file, while the decorated function receives them.
+    """
+    cassette = str(tmp_path / 'cassette')
+    payload = {'users': [{'email': 'jane@example.com'}], 'email': 'support@example.com'}
+
+    @intercept_requests(cassette, generate=True, filter_resp_data=['json.users.*.email'])
+    def actual_request():
+        assert requests.post(f'{echo_server}/users', json=payload, timeout=10).json()['json'] == payload
+
+    @intercept_requests(cassette, generate=False)
+    def mocked_request():
+        response = requests.post(f'{echo_server}/users', json=payload, timeout=10).json()['json']
+        assert response == {'users': [{'email': 'XXXX@XXXXXXX.XXX'}], 'email': 'support@example.com'}
+
+    actual_request()
+    mocked_request()
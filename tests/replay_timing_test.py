@@ -0,0 +1,97 @@
+import asyncio
+from importlib.util import find_spec
+
+from vcr.request import Request
+
+from integrations_testing_framework.cassettes.formats import get_format
+from integrations_testing_framework.cassettes.timing import ReplayTiming
+from integrations_testing_framework.decorators.http_mocking_decorators import intercept_requests
+import pytest
+import requests
+
+
+def _save_cassette(path, latency, count):
+    """
+    Save a cassette of requests recorded one after the other, each taking latency seconds.
+    """
+    interactions = []
+    for page in range(count):
+        request = Request('GET', f'https://api.example.com/items?page={page}', None, {})
+        response = {'status': {'code': 200, 'message': 'OK'}, 'headers': {'Content-Type': ['application/json']},
+                    'body': {'string': b'{}'},
+                    'timeline': {'started': page * latency, 'finished': (page + 1) * latency, 'concurrency': 1}}
+        interactions.append((request, response))
+    get_format('jsonl').save_interactions(path, interactions)
+
+
+def test_recorded_timing(tmp_path):
+    """
+    Test that responses are played back after their recorded latency, scaled.
+    """
+    cassette = str(tmp_path / 'cassette')
+    _save_cassette(cassette, latency=0.1, count=3)
+    timing = ReplayTiming(scale=0.5)
+
+    def pages():
+        for page in range(3):
+            requests.get('https://api.example.com/items', params={'page': page}, timeout=10)
+
+    intercept_requests(cassette, format='jsonl', replay_timing=timing)(pages)()
+    report = timing.reports[0].to_dict()
+    assert 0.15 <= report['wall_seconds'] < 0.5
+    assert report['recorded_seconds'] == pytest.approx(0.3)
+    assert (report['requests'], report['max_concurrency'], len(report['critical_path'])) == (3, 1, 3)
+    assert report['critical_path'][0]['request'] == 'GET https://api.example.com/items?page=0'
+
+    with pytest.raises(AssertionError, match='playback took'):
+        intercept_requests(cassette, format='jsonl', replay_timing=ReplayTiming(max_seconds=0.1))(pages)()
+
+
+@pytest.mark.skipif(find_spec('httpx') is None, reason='httpx is not installed')
+def test_concurrent_timing(tmp_path):
+    """
+    Test that the latency of concurrent asynchronous requests is awaited without blocking the event loop.
+    """
+    import httpx
+
+    cassette = str(tmp_path / 'cassette')
+    _save_cassette(cassette, latency=0.1, count=4)
+    timing = ReplayTiming(latency=0.2, bandwidth=100)
+
+    @intercept_requests(cassette, format='jsonl', ignore_on_match=['body'], replay_timing=timing)
+    async def test():
+        async with httpx.AsyncClient() as client:
+            await asyncio.gather(*(client.get('https://api.example.com/items', params={'page': page})
+                                   for page in range(4)))
+
+    asyncio.run(test())
+    report = timing.reports[0].to_dict()
+    assert 0.22 <= report['wall_seconds'] < 0.6
+    assert (report['max_concurrency'], len(report['critical_path'])) == (4, 1)
+    assert report['critical_path_seconds'] == pytest.approx(0.22)
+
+
+def test_recorded_timeline(echo_server, tmp_path):
+    cassette = str(tmp_path / 'cassette')
+
+    @intercept_requests(cassette, generate=True, format='jsonl')
+    def actual_request():
+        requests.get(f'{echo_server}/items', timeout=10)
+
+    actual_request()
+    _, responses = get_format('jsonl').load_cassette(cassette)
+    timeline = responses[0]['timeline']
+    assert timeline['finished'] >= timeline['started']
+    assert timeline['size'] == len(responses[0]['body']['string'])
+
+
+def test_cassette_without_timeline():
+    """
+    Test that a cassette recorded without timeline, its responses played without latency, is played back.
+    """
+    @intercept_requests('tests/cassette3', generate=False, replay_timing=True)
+    def test():
+        for _ in range(2):
+            assert 'domains' in requests.get('https://www.iana.org/domains/reserved', timeout=10).text
+
+    test()
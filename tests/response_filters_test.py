@@ -0,0 +1,71 @@
+import gzip
+
+from integrations_testing_framework.decorators.http_mocking_decorators import intercept_requests
+from integrations_testing_framework.redaction import Redactor
+from integrations_testing_framework.response_filters import filter_body, filter_csv
+import pytest
+import requests
+
+
+@pytest.mark.parametrize('content_type, body, expected', [
+    ('application/x-ndjson',
+     b'{"id": 1, "email": "a@b.io"}\n\n{"id": 2, "email": "c@d.io"}\r\n',
+     b'{"id": 1, "email": "X@X.XX"}\n\n{"id": 2, "email": "X@X.XX"}\r\n'),
+    ('text/csv',
+     b'id;email;name\r\n1;a@b.io;"Doe; Jane"\r\n2;c@d.io;John\r\n',
+     b'id;email;name\r\n1;X@X.XX;"Doe; Jane"\r\n2;X@X.XX;John\r\n'),
+    ('application/xml',
+     b'<?xml version="1.0" encoding="utf-8"?><users><user id="1" email="a@b.io"><email>c@d.io</email>'
+     b'<name>Jane</name></user></users>',
+     b'<?xml version="1.0" encoding="utf-8"?>\n<users><user id="1" email="X@X.XX"><email>X@X.XX</email>'
+     b'<name>Jane</name></user></users>'),
+    ('application/vnd.api+json', b'{"data": {"email": "a@b.io"}}', b'{"data": {"email": "X@X.XX"}}'),
+])
+def test_filter_body(content_type, body, expected):
+    """
+    Test that the values of the keys are redacted for every supported content type, gzipped or not.
+    """
+    redactor = Redactor(update_keys=['email'])
+    assert filter_body(body, content_type, redactor) == expected
+    assert gzip.decompress(filter_body(gzip.compress(body), content_type, redactor)) == expected
+
+
+@pytest.mark.parametrize('body', [b'{"id": 1}\n{"id": 2}\n', b'id,email\n1,a@b.io\n', b'<a><email>a@b.io</email></a>',
+                                  b'[{"id": 1}]'])
+def test_filter_gzip_content(body):
+    """
+    Test that the content of 'application/gzip' bodies is recognized.
+    """
+    redactor = Redactor(update_keys=['email', 'id'])
+    assert gzip.decompress(filter_body(gzip.compress(body), 'application/gzip', redactor)) != body
+
+
+def test_filter_body_errors():
+    redactor = Redactor(update_keys=['email'])
+    assert filter_body(b'plain text', 'text/plain', redactor) is None
+    for content_type, body in [('application/xml', b'<a>'), ('application/json', b'{'), ('text/csv', b'\x1f\x8bxx')]:
+        with pytest.raises(ValueError):
+            filter_body(body, content_type, redactor)
+
+
+def test_response_filters(echo_server, tmp_path):
+    """
+    Test that filters added to the decorator redact the bodies of their content type before they are recorded.
+    """
+    cassette = str(tmp_path / 'cassette')
+    body = 'id\temail\n1\ta@b.io\n'
+    params = {'content_type': 'text/tab-separated-values'}
+
+    @intercept_requests(cassette, generate=True, filter_resp_data=['email'],
+                        response_filters={'text/tab-separated-values': filter_csv})
+    def actual_request():
+        assert requests.post(f'{echo_server}/export', params=params, data=body, timeout=10).text == body
+
+    @intercept_requests(cassette, generate=False)
+    def mocked_request():
+        response = requests.post(f'{echo_server}/export', params=params, data=body, timeout=10)
+        assert response.text == 'id\temail\n1\tX@X.XX\n'
+        assert response.headers['Content-Length'] == str(len(response.content))
+
+    actual_request()
+    mocked_request()
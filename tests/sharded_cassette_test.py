@@ -0,0 +1,86 @@
+import json
+import os
+
+from integrations_testing_framework.cassettes.formats import get_format
+from integrations_testing_framework.cassettes.sharding import MANIFEST, ShardedFormat
+from integrations_testing_framework.decorators.http_mocking_decorators import intercept_requests
+import pytest
+import requests
+
+
+def _tap(echo_server, paths):
+    def tap():
+        for path in paths:
+            response = requests.get(f'{echo_server}/{path}', timeout=10)
+            assert response.json()['path'] == f'/{path.split("?")[0]}'
+
+    return tap
+
+
+def _manifest(cassette):
+    with open(os.path.join(cassette, MANIFEST)) as file:
+        return json.load(file)
+
+
+@pytest.mark.parametrize('cassette_format', ['yaml', 'jsonl'])
+def test_lazy_shards(echo_server, tmp_path, monkeypatch, cassette_format):
+    """
+    Test that a cassette sharded by path only loads the shards of the requests made.
+    """
+    cassette = str(tmp_path / 'cassette')
+    paths = ['users?page=1', 'items?page=1', 'users?page=2']
+    intercept_requests(cassette, generate=True, format=cassette_format, shard_by='path')(_tap(echo_server, paths))()
+    shards = _manifest(cassette)['shards']
+    assert [(shard['key'].split('/', 1)[1], shard['interactions']) for shard in shards] == [('users', 2), ('items', 1)]
+
+    loaded = []
+    load_shards = ShardedFormat.load_shards
+    monkeypatch.setattr(ShardedFormat, 'load_shards', lambda self, path, shards: loaded.extend(
+        shard['file'] for shard in shards) or load_shards(self, path, shards))
+    for _ in range(2):
+        intercept_requests(cassette, format=cassette_format, shard_by='path')(_tap(echo_server, paths))()
+    assert sorted(loaded) == sorted([shard['file'] for shard in shards] * 2)
+
+    loaded.clear()
+    play_users = intercept_requests(cassette, format=cassette_format, shard_by='path')(
+        _tap(echo_server, ['users?page=1', 'users?page=2']))
+    with pytest.raises(AssertionError, match='not all previously recorded requests were made'):
+        play_users()
+    assert loaded == [shards[0]['file']]
+
+
+def test_shards_by_count(echo_server, tmp_path):
+    """
+    Test that shards split by count are loaded together, and that recording again keeps unchanged shards.
+    """
+    cassette = str(tmp_path / 'cassette')
+    paths = [f'items?page={page}' for page in range(5)]
+
+    def record(recorded_paths):
+        intercept_requests(cassette, generate=True, format='jsonl', shard_by=2)(_tap(echo_server, recorded_paths))()
+        return [shard['file'] for shard in _manifest(cassette)['shards']]
+
+    assert record(paths) == ['part-00000.jsonl', 'part-00001.jsonl', 'part-00002.jsonl']
+    requests_, _ = ShardedFormat(get_format('jsonl'), 2).load_cassette(cassette)
+    assert [request.path for request in requests_] == ['/items'] * 5
+    intercept_requests(cassette, format='jsonl', shard_by=2)(_tap(echo_server, paths))()
+
+    # Recording fewer interactions removes the shards that are not used anymore
+    assert record(paths[:3]) == ['part-00000.jsonl', 'part-00001.jsonl']
+    assert sorted(os.listdir(cassette)) == [MANIFEST, 'part-00000.jsonl', 'part-00001.jsonl']
+    with pytest.raises(ValueError):
+        ShardedFormat(get_format('jsonl'), shard_by='query')
+
+
+def test_incremental_shards(echo_server, received_requests, tmp_path):
+    cassette = str(tmp_path / 'cassette')
+
+    def record(paths):
+        received_requests.clear()
+        intercept_requests(cassette, generate=True, incremental=True, format='jsonl', shard_by='host')(
+            _tap(echo_server, paths))()
+        return list(received_requests)
+
+    assert record(['items?page=1']) == ['/items?page=1']
+    assert record(['items?page=1', 'users']) == ['/users']
+    assert [shard['interactions'] for shard in _manifest(cassette)['shards']] == [2]
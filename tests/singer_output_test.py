@@ -0,0 +1,89 @@
+import json
+
+from integrations_testing_framework.decorators.decorators import assert_singer_output_matches
+from integrations_testing_framework.singer import compare_singer_output, parse_message
+import pytest
+
+EXPECTED = [
+    {'type': 'SCHEMA', 'stream': 'users', 'schema': {'properties': {'id': {'type': 'integer'}}},
+     'key_properties': ['id']},
+    {'type': 'RECORD', 'stream': 'users', 'record': {'id': 1, 'name': 'a', 'score': 1.5}},
+    {'type': 'RECORD', 'stream': 'orders', 'record': {'id': 10, 'total': 2.0}},
+    {'type': 'STATE', 'value': {'bookmarks': {'users': 1}}},
+    {'type': 'RECORD', 'stream': 'users', 'record': {'id': 2, 'name': 'b', 'score': 3}},
+]
+
+
+@pytest.fixture
+def expected_file(tmp_path):
+    path = tmp_path / 'expected.txt'
+    path.write_text(''.join(json.dumps(message) + '\n' for message in EXPECTED))
+    return str(path)
+
+
+def test_parse_message():
+    assert parse_message('{"type": "RECORD", "stream": "s", "record": {"b": 1.0, "a": 0.10}, '
+                         '"time_extracted": "2022-01-01"}') == (('RECORD', 's'), '{"a":0.1,"b":1}')
+    assert parse_message('not json') == (('LINE', None), 'not json')
+    assert parse_message('  \n') is None
+
+
+def test_assert_singer_output_matches(expected_file):
+    """
+    Test that key order, number formatting and stream interleaving are ignored.
+    """
+    @assert_singer_output_matches(expected_file)
+    def tap():
+        print('{"type": "SCHEMA", "stream": "users", "key_properties": ["id"], '
+              '"schema": {"properties": {"id": {"type": "integer"}}}}')
+        print('{"type": "RECORD", "stream": "orders", "record": {"total": 2, "id": 10}}')
+        print('{"type": "RECORD", "stream": "users", "record": {"score": 1.50, "name": "a", "id": 1}}')
+        print('{"type": "RECORD", "stream": "users", "record": {"id": 2, "name": "b", "score": 3.0}}')
+        print('{"type": "STATE", "value": {"bookmarks": {"users": 1}}}')
+
+    tap()
+
+
+def test_assert_singer_output_mismatch(expected_file):
+    @assert_singer_output_matches(expected_file)
+    def tap():
+        for message in EXPECTED[:4]:
+            print(json.dumps(message))
+        print('{"type": "RECORD", "stream": "users", "record": {"id": 3}}')
+        print('{"type": "RECORD", "stream": "users", "record": {"id": 4}}')
+
+    with pytest.raises(AssertionError) as err:
+        tap()
+    assert 'RECORD     users' in str(err.value)
+    assert '{"id":3}' in str(err.value) and '{"id":4}' in str(err.value)
+
+
+def test_ignore_record_order(expected_file, tmp_path):
+    actual = [EXPECTED[0], EXPECTED[4], EXPECTED[2], EXPECTED[1], EXPECTED[3]]
+    actual_lines = [json.dumps(message) + '\n' for message in actual]
+    assert compare_singer_output(expected_file, actual_lines)
+    assert not compare_singer_output(expected_file, actual_lines, ignore_record_order=True)
+
+    diff = compare_singer_output(expected_file, actual_lines[:2], ignore_record_order=True)
+    users, orders = diff.channels[('RECORD', 'users')], diff.channels[('RECORD', 'orders')]
+    assert (users.expected, users.actual, users.missing) == (2, 1, 1)
+    assert (orders.expected, orders.actual, orders.missing) == (1, 0, 1)
+    assert orders.samples == [('missing', None, '{"id":10,"total":2}', None)]
+
+
+def test_max_read_ahead(tmp_path):
+    """
+    Test that the expected messages read ahead of the output are bounded.
+    """
+    path = tmp_path / 'expected.txt'
+    orders = [{'type': 'RECORD', 'stream': 'orders', 'record': {'id': order}} for order in range(10)]
+    path.write_text(''.join(json.dumps(message) + '\n' for message in [*orders, EXPECTED[1]]))
+    actual_lines = [json.dumps(message) + '\n' for message in [EXPECTED[1], *orders]]
+    assert not compare_singer_output(str(path), actual_lines, max_read_ahead=10)
+    with pytest.raises(AssertionError, match='more than 5 expected messages were read ahead looking for the next '
+                                             'RECORD message of users'):
+        compare_singer_output(str(path), actual_lines, max_read_ahead=5)
+
+    # Messages of a stream that are never written are not held in memory
+    diff = compare_singer_output(str(path), actual_lines[1:3], max_read_ahead=5)
+    assert (diff.channels[('RECORD', 'orders')].missing, diff.channels[('RECORD', 'users')].missing) == (8, 1)
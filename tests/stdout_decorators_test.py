@@ -0,0 +1,88 @@
+import os
+
+from integrations_testing_framework.decorators.decorators import assert_stdout_matches, write_stdout
+import pytest
+
+
+def test_write_stdout(tmp_path):
+    """
+    Test that stdout is written to the file, and that the file is kept when stdout is empty.
+    """
+    output = str(tmp_path / 'output.txt')
+
+    @write_stdout(output)
+    def tap():
+        print('{"type": "RECORD", "record": {"id": 1}}')
+        print('partial', end='')
+        print(' line')
+
+    @write_stdout(output)
+    def silent_tap():
+        pass
+
+    tap()
+    with pytest.raises(Exception, match='Stdout is empty'):
+        silent_tap()
+    with open(output) as file:
+        assert file.read() == '{"type": "RECORD", "record": {"id": 1}}\npartial line\n'
+    assert not os.path.exists(f'{output}.tmp')
+
+
+def test_assert_stdout_matches(tmp_path):
+    expected = tmp_path / 'expected.txt'
+    expected.write_text('line 1\nline 2  \n')
+
+    @assert_stdout_matches(str(expected))
+    def tap():
+        print('line 1')
+        print('line 2')
+        print('ignored after the end of the file')
+
+    tap()
+
+
+def test_assert_stdout_matches_fails_fast(tmp_path):
+    """
+    Test that the first mismatching line is reported while the wrapped function runs.
+    """
+    expected = tmp_path / 'expected.txt'
+    expected.write_text('line 1\nline 2\nline 3\n')
+    printed = []
+
+    @assert_stdout_matches(str(expected))
+    def tap():
+        for line in ('line 1', 'line two', 'line 3'):
+            print(line)
+            printed.append(line)
+
+    with pytest.raises(AssertionError) as err:
+        tap()
+    assert 'at line 2' in str(err.value) and 'line two' in str(err.value)
+    assert printed == ['line 1']
+
+
+def test_assert_stdout_matches_swallowed_mismatch(tmp_path):
+    expected = tmp_path / 'expected.txt'
+    expected.write_text('line 1\n')
+
+    @assert_stdout_matches(str(expected))
+    def tap():
+        try:
+            print('line one')
+        except AssertionError:
+            pass
+
+    with pytest.raises(AssertionError):
+        tap()
+
+
+def test_assert_stdout_matches_missing_lines(tmp_path):
+    expected = tmp_path / 'expected.txt'
+    expected.write_text('line 1\nline 2\n')
+
+    @assert_stdout_matches(str(expected))
+    def tap():
+        print('line 1')
+
+    with pytest.raises(AssertionError, match='at line 2'):
+        tap()